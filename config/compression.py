@@ -0,0 +1,118 @@
+"""
+Сжатие ответов: brotli, если он установлен и его принимает клиент, иначе gzip.
+
+Потоковые ответы сжимаются по частям, каждая часть сразу уходит клиенту,
+поэтому сжатие не ломает StreamingHttpResponse. Уже сжатые ответы, частичные
+ответы (Range), ответы для X-Accel-Redirect/X-Sendfile и типы вроде
+изображений не трогаются. Vary: Accept-Encoding добавляется ко всем
+ответам, представление которых зависит от этого заголовка.
+"""
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/feed+json', 'application/javascript',
+    'application/xml', 'application/rss+xml', 'application/atom+xml', 'image/svg+xml',
+)
+MIN_LENGTH = 200
+
+
+def accepted_encodings(header):
+    """
+    Разбирает Accept-Encoding.
+
+    Возвращает:
+        dict: Кодировка -> вес q; кодировки с q=0 не включаются.
+    """
+    encodings = {}
+    for part in header.split(','):
+        name, _sep, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if quality > 0:
+            encodings[name] = quality
+    return encodings
+
+
+def is_compressible(response):
+    if response.has_header('Content-Encoding') or response.has_header('Content-Range') or response.status_code == 206:
+        return False
+    if response.has_header('X-Accel-Redirect') or response.has_header('X-Sendfile'):
+        return False
+    content_type = response.get('Content-Type', '').lower()
+    if not content_type.startswith(COMPRESSIBLE_TYPES):
+        return False
+    return response.streaming or len(response.content) >= MIN_LENGTH
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware с поддержкой brotli и списком сжимаемых типов содержимого.
+    """
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        use_brotli = (
+            brotli is not None
+            and getattr(settings, 'COMPRESSION_BROTLI', True)
+            and 'br' in encodings
+            and encodings['br'] >= encodings.get('gzip', 0)
+        )
+        if not use_brotli:
+            # Django сам добавит Vary, проверит gzip в Accept-Encoding и ослабит ETag
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._brotli_async(response.streaming_content, quality)
+            else:
+                response.streaming_content = self._brotli_stream(response.streaming_content, quality)
+            del response.headers['Content-Length']
+        else:
+            compressed = brotli.compress(response.content, quality=quality)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Сжатое представление не совпадает побайтно с исходным — ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    @staticmethod
+    def _brotli_stream(chunks, quality):
+        compressor = brotli.Compressor(quality=quality)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def _brotli_async(chunks, quality):
+        compressor = brotli.Compressor(quality=quality)
+        async for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
@@ -0,0 +1,28 @@
+"""
+SQLite с настройками для многопроцессной нагрузки.
+
+PRAGMA выполняются на каждом новом соединении; переопределяются ключом
+PRAGMAS в описании базы (OPTIONS SQLite передаёт прямо в sqlite3.connect).
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # WAL: читатели не блокируют писателя и наоборот
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL безопасен и не делает fsync на каждую транзакцию
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательное значение — размер в КиБ (20 МБ страничного кэша на соединение)
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
@@ -0,0 +1,247 @@
+"""
+Кэширование страниц на CDN или обратном прокси.
+
+Представления с EdgeCacheMixin получают политику из EDGE_CACHE['POLICIES']
+и набор surrogate-ключей (пост, автор, отзыв). Запрос GET/HEAD без cookie
+сессии заведомо анонимный: миксин подставляет AnonymousUser, сессия не
+загружается, и SessionMiddleware не добавляет Vary: Cookie. Окончательное
+решение принимает EdgeCacheMiddleware после сессий и CSRF: ответ 200 без
+Set-Cookie и без Vary: Cookie помечается public с s-maxage и заголовком
+ключей, остальные ответы таких представлений — private.
+
+Браузеры получают max-age=0: после входа пользователь не должен видеть
+закэшированную анонимную страницу. Прокси должен пропускать мимо кэша
+запросы с cookie сессии (SESSION_COOKIE_NAME).
+
+При изменении моделей сигналы вызывают purge(): ключи одной транзакции
+собираются и после фиксации одним вызовом передаются очистителю из
+EDGE_CACHE['PURGER'].
+"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.utils.cache import has_vary_header, patch_cache_control
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def edge_settings():
+    return getattr(settings, 'EDGE_CACHE', {})
+
+
+def edge_cache_enabled():
+    return edge_settings().get('ENABLED', False)
+
+
+class EdgeCacheMixin:
+    """
+    Помечает ответы представления для кэширования на CDN.
+
+    Атрибуты:
+        edge_cache_policy: Имя политики в EDGE_CACHE['POLICIES'].
+    """
+    edge_cache_policy = None
+
+    def get_surrogate_keys(self, context):
+        """
+        Возвращает ключи, по которым ответ очищается при изменении данных.
+
+        Аргументы:
+            context: Контекст шаблона ответа (пустой для ответов без шаблона).
+
+        Возвращает:
+            list: Ключи.
+        """
+        return []
+
+    def dispatch(self, request, *args, **kwargs):
+        if not edge_cache_enabled() or request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        anonymous = settings.SESSION_COOKIE_NAME not in request.COOKIES
+        if anonymous:
+            # Без cookie сессии пользователь анонимный; ленивый request.user загрузил бы пустую сессию
+            request.user = AnonymousUser()
+        response = super().dispatch(request, *args, **kwargs)
+        keys = self.get_surrogate_keys(getattr(response, 'context_data', None) or {}) if anonymous else ()
+        request.edge_cache = (self.edge_cache_policy, anonymous, keys)
+        return response
+
+
+class EdgeCacheMiddleware:
+    """
+    Выставляет Cache-Control и заголовок surrogate-ключей по политике представления.
+
+    Стоит перед SessionMiddleware, чтобы видеть cookie и Vary, добавленные сессиями и CSRF.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        marker = getattr(request, 'edge_cache', None)
+        if marker is None:
+            return response
+        name, anonymous, keys = marker
+        options = edge_settings()
+        policy = options.get('POLICIES', {}).get(name)
+        shared = (
+            policy is not None and anonymous and response.status_code == 200
+            and not response.cookies and not has_vary_header(response, 'Cookie')
+        )
+        if not shared:
+            patch_cache_control(response, private=True)
+            return response
+        s_maxage = policy['s_maxage']
+        if not purger_configured():
+            # Без очистки правки видны только после истечения s-maxage, поэтому держим его коротким
+            s_maxage = min(s_maxage, options.get('UNPURGED_S_MAXAGE', 60))
+        directives = {'public': True, 'max_age': policy.get('max_age', 0), 's_maxage': s_maxage}
+        if policy.get('stale_while_revalidate'):
+            directives['stale_while_revalidate'] = policy['stale_while_revalidate']
+        patch_cache_control(response, **directives)
+        if keys:
+            response[options.get('KEY_HEADER', 'Surrogate-Key')] = ' '.join(keys)
+        return response
+
+
+class BasePurger:
+    """
+    Очиститель кэша CDN.
+
+    Аргументы:
+        options: Словарь EDGE_CACHE.
+    """
+    def __init__(self, options):
+        self.options = options
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class NullPurger(BasePurger):
+    """
+    Ничего не очищает; с ним s-maxage ограничен EDGE_CACHE['UNPURGED_S_MAXAGE'].
+    """
+    def purge(self, keys):
+        logger.debug('Edge cache purge skipped for %d keys', len(keys))
+
+
+class HttpPurger(BasePurger):
+    """
+    Отправляет ключи на PURGE_URL в заголовке KEY_HEADER через пробел,
+    пачками по PURGE_BATCH (как API очистки по ключам Fastly или Varnish xkey).
+    """
+    def purge(self, keys):
+        header = self.options.get('KEY_HEADER', 'Surrogate-Key')
+        batch = self.options.get('PURGE_BATCH', 256)
+        for start in range(0, len(keys), batch):
+            headers = dict(self.options.get('PURGE_HEADERS', {}), **{header: ' '.join(keys[start:start + batch])})
+            request = Request(self.options['PURGE_URL'], headers=headers, method=self.options.get('PURGE_METHOD', 'POST'))
+            try:
+                with urlopen(request, timeout=self.options.get('PURGE_TIMEOUT', 2)) as response:
+                    response.read()
+            except (URLError, OSError) as exc:
+                # Очистка не должна ломать запись; устаревшая страница истечёт по s-maxage
+                logger.warning('Edge cache purge of %d keys failed: %s', len(keys[start:start + batch]), exc)
+
+
+def get_purger_class():
+    return import_string(edge_settings().get('PURGER', 'config.edgecache.NullPurger'))
+
+
+def purger_configured():
+    return not issubclass(get_purger_class(), NullPurger)
+
+
+def get_purger():
+    return get_purger_class()(edge_settings())
+
+
+class _PendingPurge:
+    def __init__(self, connection):
+        self.keys = set()
+        self.savepoint_ids = set(connection.savepoint_ids)
+        self.done = False
+
+    def flush(self):
+        self.done = True
+        get_purger().purge(sorted(self.keys))
+
+    def accepts(self, connection):
+        # Ключи копятся, пока обратный вызов ждёт фиксации на том же уровне вложенности:
+        # после отката точки сохранения Django удаляет его из run_on_commit
+        return (
+            not self.done and self.savepoint_ids == set(connection.savepoint_ids)
+            and any(func == self.flush for _sids, func, _robust in connection.run_on_commit)
+        )
+
+
+def purge(keys, using=None):
+    """
+    Очищает ключи после фиксации текущей транзакции.
+
+    Аргументы:
+        keys: Итерируемые ключи.
+        using: Псевдоним БД, в транзакции которой произошло изменение.
+    """
+    if not edge_cache_enabled():
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        get_purger().purge(sorted(set(keys)))
+        return
+    pending = getattr(connection, '_edge_cache_purge', None)
+    if pending is None or not pending.accepts(connection):
+        pending = connection._edge_cache_purge = _PendingPurge(connection)
+        transaction.on_commit(pending.flush, using=using)
+    pending.keys.update(keys)
+
+
+class LocalPurgeServer:
+    """
+    HTTP-заглушка CDN для тестов: принимает запросы очистки и запоминает ключи.
+
+    Использование: with LocalPurgeServer() as server, указать server.url
+    в EDGE_CACHE['PURGE_URL'] с PURGER = 'config.edgecache.HttpPurger'.
+
+    Атрибуты:
+        requests: Списки ключей из полученных запросов.
+    """
+    def __init__(self, header='Surrogate-Key'):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.requests.append(self.headers.get(header, '').split())
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            do_PURGE = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}/purge'
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def purged(self):
+        return {key for keys in self.requests for key in keys}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._httpd.shutdown()
+        self._httpd.server_close()
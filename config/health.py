@@ -0,0 +1,170 @@
+"""
+Проверки живости и готовности воркера для балансировщика.
+
+/healthz отвечает 200, пока процесс обрабатывает запросы, и показывает
+состояние зависимостей. /readyz отвечает 503, пока не закончен прогрев
+(config.warmup) или недоступна критичная зависимость. Каждая проверка
+выполняется в небольшом пуле потоков со строгим таймаутом, а результат
+кэшируется в процессе на HEALTH_CHECKS['TTL'] секунд, поэтому частые
+запросы балансировщика не создают нагрузку на БД и кэш.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.mail import get_connection
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.crypto import get_random_string
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+from config import warmup
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='health-check')
+_lock = threading.Lock()
+_last = {'checked_at': 0.0, 'results': None}
+
+
+def get_config():
+    config = {'TIMEOUT': 1.0, 'TTL': 5.0, 'CRITICAL': ['database', 'cache', 'storage'], 'EMAIL': False}
+    config.update(getattr(settings, 'HEALTH_CHECKS', {}))
+    return config
+
+
+def check_database():
+    for alias in connections:
+        connection = connections[alias]
+        # Потоки пула живут долго: соединение переиспользуется, но сломанное закрывается
+        connection.close_if_unusable_or_obsolete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+
+def check_cache():
+    key = f'health:{get_random_string(12)}'
+    for alias in settings.CACHES:
+        cache = caches[alias]
+        cache.set(key, 1, 10)
+        if cache.get(key) != 1:
+            raise RuntimeError(f'cache {alias!r} did not return the stored value')
+        cache.delete(key)
+
+
+def check_storage():
+    # exists() достаточно, чтобы убедиться, что хранилище отвечает; запись не нужна
+    default_storage.exists('.health')
+
+
+def check_email():
+    connection = get_connection(timeout=get_config()['TIMEOUT'])
+    if connection.open():
+        connection.close()
+
+
+def get_checks():
+    checks = {'database': check_database, 'cache': check_cache, 'storage': check_storage}
+    if get_config()['EMAIL']:
+        checks['email'] = check_email
+    return checks
+
+
+def run_checks():
+    """
+    Запускает все проверки параллельно с общим таймаутом.
+
+    Возвращает:
+        dict: Имя проверки -> {'status': 'ok' | 'error' | 'timeout', 'latency_ms', 'error'}.
+    """
+    timeout = get_config()['TIMEOUT']
+
+    def timed(check):
+        started = time.perf_counter()
+        check()
+        return (time.perf_counter() - started) * 1000
+
+    futures = {name: _executor.submit(timed, check) for name, check in get_checks().items()}
+    deadline = time.monotonic() + timeout
+    results = {}
+    for name, future in futures.items():
+        try:
+            latency = future.result(timeout=max(deadline - time.monotonic(), 0))
+            results[name] = {'status': 'ok', 'latency_ms': round(latency, 2)}
+        except FutureTimeout:
+            # Зависший вызов нельзя прервать; он досчитается в пуле, а ответ уйдёт без него
+            results[name] = {'status': 'timeout', 'latency_ms': round(timeout * 1000, 2)}
+        except Exception as exc:
+            results[name] = {'status': 'error', 'latency_ms': None, 'error': f'{type(exc).__name__}: {exc}'}
+    return results
+
+
+def cached_results():
+    """
+    Возвращает результаты проверок не старше TTL; обновляет их только один запрос.
+
+    Возвращает:
+        tuple: (результаты, возраст результатов в секундах).
+    """
+    ttl = get_config()['TTL']
+    now = time.monotonic()
+    if _last['results'] is None or now - _last['checked_at'] >= ttl:
+        # Пока один поток обновляет результаты, остальные отдают предыдущие
+        if _lock.acquire(blocking=_last['results'] is None):
+            try:
+                if _last['results'] is None or time.monotonic() - _last['checked_at'] >= ttl:
+                    _last['results'] = run_checks()
+                    _last['checked_at'] = time.monotonic()
+            finally:
+                _lock.release()
+    return _last['results'], round(time.monotonic() - _last['checked_at'], 3)
+
+
+def _report(ready_required):
+    results, age = cached_results()
+    critical = get_config()['CRITICAL']
+    healthy = all(results[name]['status'] == 'ok' for name in critical if name in results)
+    warm = warmup.is_warm()
+    data = {
+        'status': 'ok' if healthy else 'degraded',
+        'warm': warm,
+        'checks': results,
+        'age_s': age,
+    }
+    if ready_required:
+        data['ready'] = healthy and warm
+        return JsonResponse(data, status=200 if data['ready'] else 503)
+    return JsonResponse(data)
+
+
+@never_cache
+@require_GET
+def healthz(request):
+    """
+    Проверка живости: 200, пока процесс отвечает; состояние зависимостей — в теле ответа.
+
+    Аргументы:
+        request: HTTP-запрос.
+
+    Возвращает:
+        JsonResponse: Статус и задержка каждой зависимости.
+    """
+    return _report(ready_required=False)
+
+
+@never_cache
+@require_GET
+def readyz(request):
+    """
+    Проверка готовности: 503, пока идёт прогрев или недоступна критичная зависимость.
+
+    Аргументы:
+        request: HTTP-запрос.
+
+    Возвращает:
+        JsonResponse: Статус готовности и задержка каждой зависимости.
+    """
+    return _report(ready_required=True)
@@ -0,0 +1,227 @@
+"""
+Раздача загруженных файлов (MEDIA_ROOT) в production.
+
+Storage добавляет к именам файлов в URL хэш содержимого, поэтому такие URL
+кэшируются браузером и CDN как immutable. Представление serve_media снимает
+хэш, отдаёт файл через X-Sendfile/X-Accel-Redirect фронтенд-сервера
+(если включено в настройках) или сам — потоково, с Range и ETag.
+"""
+import functools
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+HASH_LENGTH = 12
+HASHED_NAME_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % HASH_LENGTH)
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+CHUNK_SIZE = 64 * 1024
+
+# Сколько хэшей держать в памяти; ключ включает размер и mtime, поэтому
+# заменённые файлы оставляют старые записи, и без предела словарь рос бы вечно
+CONTENT_HASH_CACHE_SIZE = 4096
+# Сколько секунд URL файла берётся из памяти без stat(); файл, заменённый
+# другим процессом, до истечения срока отдаётся по старому URL без immutable
+URL_HASH_TTL = 60
+
+
+@functools.lru_cache(maxsize=CONTENT_HASH_CACHE_SIZE)
+def _file_hash(path, size, mtime_ns):
+    hasher = hashlib.md5(usedforsecurity=False)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()[:HASH_LENGTH]
+
+
+def content_hash(path, stat):
+    # Пересчитывается только если у файла изменились размер или mtime
+    return _file_hash(path, stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=CONTENT_HASH_CACHE_SIZE)
+def _url_hash(path, period):
+    # OSError для отсутствующего файла не кэшируется: файл может появиться позже
+    return content_hash(path, os.stat(path))
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Файловое хранилище, которое отдаёт URL вида ``ironman.<hash>.jpg``.
+
+    На диске файл лежит под исходным именем; хэш нужен только для того,
+    чтобы после замены файла у него поменялся URL.
+    """
+    def url(self, name):
+        url = super().url(name)
+        try:
+            # Шаблоны вызывают url() на каждой странице: в пределах URL_HASH_TTL обходимся без stat()
+            digest = _url_hash(self.path(name), int(time.monotonic() // URL_HASH_TTL))
+        except (OSError, ValueError):
+            return url
+        root, ext = posixpath.splitext(url)
+        return f'{root}.{digest}{ext}'
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        # Файл мог занять имя удалённого: его хэш в этом процессе должен смениться сразу
+        _url_hash.cache_clear()
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        _url_hash.cache_clear()
+
+
+def _resolve(path):
+    """
+    Возвращает (имя, полный путь, stat, хэш из URL) для запрошенного пути.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    match = HASHED_NAME_RE.match(path)
+    candidates = []
+    if match:
+        candidates.append((match['stem'] + match['ext'], match['hash']))
+    candidates.append((path, None))
+    for name, url_hash in candidates:
+        fullpath = safe_join(settings.MEDIA_ROOT, name)
+        if os.path.isfile(fullpath):
+            return name, fullpath, os.stat(fullpath), url_hash
+    raise Http404('Файл не найден.')
+
+
+def _parse_range(header, size):
+    """
+    Разбирает одиночный диапазон ``bytes=start-end``.
+
+    Возвращает:
+        tuple | None: (start, end) включительно; None — диапазон не задан или не поддерживается.
+    Исключения:
+        ValueError: диапазон не пересекается с файлом (ответ 416).
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or (not match['start'] and not match['end']):
+        return None
+    if match['start']:
+        start = int(match['start'])
+        end = int(match['end']) if match['end'] else size - 1
+    else:
+        # bytes=-N: последние N байт
+        start = max(size - int(match['end']), 0)
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+class RangeFileWrapper:
+    """
+    Итератор по части файла, отдаёт данные блоками фиксированного размера.
+    """
+    def __init__(self, filelike, start, length):
+        self.filelike = filelike
+        self.filelike.seek(start)
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        data = self.filelike.read(min(CHUNK_SIZE, self.remaining))
+        if not data:
+            raise StopIteration
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Отдаёт файл из MEDIA_ROOT.
+
+    Аргументы:
+        request: HTTP-запрос.
+        path: Путь к файлу относительно MEDIA_URL (возможно, с хэшем содержимого).
+
+    Возвращает:
+        HttpResponse: Файл, его часть (206), 304 или ответ с заголовком для фронтенд-сервера.
+    """
+    name, fullpath, stat, url_hash = _resolve(path)
+    digest = content_hash(fullpath, stat)
+    etag = f'"{digest}"'
+    cache_control = IMMUTABLE_CACHE_CONTROL if url_hash == digest else DEFAULT_CACHE_CONTROL
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        not_modified = etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    else:
+        not_modified = not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime)
+    if not_modified:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    sendfile_backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', '')
+    # Заголовки с не-ASCII Django кодирует по RFC 2047, а nginx и mod_xsendfile ждут
+    # путь в процентной кодировке (например, для posts/images/Тор.jpg)
+    if sendfile_backend == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + name)
+    elif sendfile_backend == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = quote(str(fullpath))
+    else:
+        response = _file_response(request, fullpath, stat.st_size, content_type, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def _file_response(request, fullpath, size, content_type, etag):
+    response_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag:
+        try:
+            response_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    f = open(fullpath, 'rb')
+    if response_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = response_range
+        length = end - start + 1
+        response = FileResponse(RangeFileWrapper(f, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,456 @@
+"""
+Метрики, общие для всех процессов-воркеров.
+
+Каждый поток пишет значения в свой файл в METRICS_DIR, отображённый в
+память через mmap: у файла один писатель, поэтому запись сэмпла не
+требует блокировок — это поиск смещения в словаре и перезапись восьми
+байт. Эндпоинт /metrics читает все файлы и суммирует значения: счётчики
+и гистограммы завершившихся процессов сохраняются (и сворачиваются в
+archive.db), а значения датчиков учитываются только у живых процессов.
+Формат вывода — текстовый формат Prometheus.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from config.ratelimit import client_ip
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки архив не сворачивается
+    fcntl = None
+
+INITIAL_FILE_SIZE = 64 * 1024
+ARCHIVE_NAME = 'archive.db'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+REGISTRY = {}
+
+
+def metrics_dir():
+    default = Path(tempfile.gettempdir()) / f'{Path(settings.BASE_DIR).name}-metrics'
+    return Path(getattr(settings, 'METRICS_DIR', None) or default)
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class ValueFile:
+    """
+    Файл значений: заголовок с занятым размером и записи
+    [длина ключа: int32][ключ, выровненный до 8 байт][значение: float64].
+
+    Писатель у файла один, поэтому новая запись сначала пишется целиком,
+    а затем увеличивается занятый размер — читатель не увидит неполную запись.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < INITIAL_FILE_SIZE:
+            self._file.truncate(INITIAL_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._positions = {key: position for key, _value, position in _parse(self._map, self._used)}
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padding = 8 - (len(encoded) + 4) % 8
+        entry = struct.pack(f'i{len(encoded)}s{padding}xd', len(encoded), encoded, 0.0)
+        if self._used + len(entry) > len(self._map):
+            size = len(self._map) * 2
+            while self._used + len(entry) > size:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[self._used:self._used + len(entry)] = entry
+        position = self._used + len(entry) - 8
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        struct.pack_into('d', self._map, position, struct.unpack_from('d', self._map, position)[0] + amount)
+
+
+def _parse(data, used=None):
+    """
+    Возвращает записи файла значений: (ключ, значение, смещение значения).
+    """
+    if used is None:
+        used = struct.unpack_from('i', data, 0)[0] if len(data) >= 4 else 0
+    position = 8
+    entries = []
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        position += 4
+        key = bytes(data[position:position + length]).decode('utf-8')
+        position += length + (8 - (length + 4) % 8)
+        entries.append((key, struct.unpack_from('d', data, position)[0], position))
+        position += 8
+    return entries
+
+
+class _Slots:
+    """
+    Файлы процесса. Поток получает свободный файл при первой записи и
+    возвращает его при завершении, поэтому число файлов равно пиковому
+    числу потоков, а не числу потоков за всё время жизни процесса.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.free = []
+        self.count = 0
+        self.local = threading.local()
+
+    def current(self):
+        value_file = getattr(self.local, 'file', None)
+        if value_file is not None and self.pid == os.getpid():
+            return value_file
+        return self._acquire()
+
+    def _acquire(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Новый процесс после fork: файлы родителя остаются родителю
+                self.pid, self.free, self.count = os.getpid(), [], 0
+            if self.free:
+                value_file = self.free.pop()
+            else:
+                directory = metrics_dir()
+                directory.mkdir(parents=True, exist_ok=True)
+                path = directory / f'{self.pid}_{self.count}.db'
+                if path.exists():
+                    # Файл завершившегося процесса с тем же PID (например, после перезапуска контейнера)
+                    reclaim(directory, path)
+                value_file = ValueFile(path)
+                self.count += 1
+        self.local.file = value_file
+        weakref.finalize(threading.current_thread(), self._release, self.pid, value_file)
+        return value_file
+
+    def _release(self, pid, value_file):
+        with self.lock:
+            if pid == self.pid:
+                self.free.append(value_file)
+
+
+_slots = _Slots()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        REGISTRY[name] = self
+
+    def _key(self, sample, labelvalues, extra=()):
+        cache_key = (sample, labelvalues, extra)
+        key = self._keys.get(cache_key)
+        if key is None:
+            labels = list(zip(self.labelnames, labelvalues)) + list(extra)
+            key = self._keys[cache_key] = json.dumps([self.kind, self.name + sample, labels], ensure_ascii=False)
+        return key
+
+    def _labelvalues(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, key, amount):
+        if metrics_enabled():
+            _slots.current().add(key, amount)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key('_total', self._labelvalues(labels)), amount)
+
+
+class Gauge(Metric):
+    """
+    Датчик, который складывается по потокам и процессам, поэтому поддерживает
+    только inc/dec; значения завершившихся процессов не учитываются.
+    """
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key('', self._labelvalues(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        labelvalues = self._labelvalues(labels)
+        # Храним попадания в отдельный интервал; накопительные значения считаются при выводе
+        bucket = self.buckets[bisect_left(self.buckets, value)]
+        self._add(self._key('_bucket', labelvalues, (('le', _format_float(bucket)),)), 1)
+        self._add(self._key('_sum', labelvalues), value)
+        self._add(self._key('_count', labelvalues), 1)
+
+
+def _format_float(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by URL name',
+                            ('view', 'method'))
+REQUESTS = Counter('http_requests', 'Requests by URL name and status code', ('view', 'method', 'status'))
+DB_QUERIES_PER_REQUEST = Histogram('db_queries_per_request', 'Database queries executed per request',
+                                   ('view',), buckets=COUNT_BUCKETS)
+QUERY_CACHE_LOOKUPS = Counter('querycache_lookups', 'Query result cache lookups by result', ('result',))
+MAIL_QUEUE = Gauge('mail_queue_depth', 'Messages currently being handed to the mail backend')
+MAILS = Counter('mail_messages', 'Messages handed to the mail backend by result', ('result',))
+VIEW_BUFFER = Gauge('view_analytics_buffered_events', 'View events waiting in worker buffers')
+VIEW_FLUSH_LAG = Histogram('view_analytics_flush_lag_seconds',
+                           'Age of the oldest buffered view event when its batch was written',
+                           buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # os.kill(pid, 0) на Windows завершает процесс, а не проверяет его
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        return _parse(path.read_bytes())
+    except (OSError, struct.error, UnicodeDecodeError):
+        return []
+
+
+def _archive(directory, paths):
+    # Вызывается под блокировкой archive.lock
+    archive = ValueFile(directory / ARCHIVE_NAME)
+    for path in paths:
+        for key, value, _position in _read(path):
+            if json.loads(key)[0] != 'gauge':
+                archive.add(key, value)
+        path.unlink(missing_ok=True)
+    archive._map.flush()
+
+
+def compact(directory):
+    """
+    Сворачивает файлы завершившихся процессов в archive.db: счётчики и
+    гистограммы суммируются, датчики отбрасываются.
+    """
+    if fcntl is None:
+        return
+    with open(directory / 'archive.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        dead = [path for path in directory.glob('*_*.db') if not _pid_alive(int(path.name.split('_', 1)[0]))]
+        if dead:
+            _archive(directory, dead)
+
+
+def reclaim(directory, path):
+    """
+    Освобождает имя файла, оставшееся от завершившегося процесса с тем же PID:
+    его счётчики уходят в архив, датчики отбрасываются, и новый процесс
+    начинает с пустого файла.
+    """
+    if fcntl is None:
+        path.unlink(missing_ok=True)
+        return
+    with open(directory / 'archive.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if path.exists():
+            _archive(directory, [path])
+
+
+def collect():
+    """
+    Суммирует значения всех файлов.
+
+    Возвращает:
+        dict: Ключ сэмпла -> значение.
+    """
+    directory = metrics_dir()
+    if not directory.is_dir():
+        return {}
+    compact(directory)
+    totals = defaultdict(float)
+    alive = {}
+    for path in directory.glob('*.db'):
+        pid = None if path.name == ARCHIVE_NAME else int(path.name.split('_', 1)[0])
+        for key, value, _position in _read(path):
+            kind = json.loads(key)[0]
+            if kind == 'gauge' and pid is not None:
+                if pid not in alive:
+                    alive[pid] = _pid_alive(pid)
+                if not alive[pid]:
+                    continue
+            totals[key] += value
+    return totals
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def render_text(totals):
+    """
+    Формирует текстовый формат Prometheus из суммированных значений.
+    """
+    samples = defaultdict(list)
+    for key, value in totals.items():
+        _kind, sample_name, labels = json.loads(key)
+        samples[sample_name].append((labels, value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if isinstance(metric, Histogram):
+            series = defaultdict(dict)
+            for labels, value in samples.get(metric.name + '_bucket', ()):
+                le = dict(labels)['le']
+                series[tuple(tuple(pair) for pair in labels if pair[0] != 'le')][le] = value
+            sums = {tuple(map(tuple, labels)): value for labels, value in samples.get(metric.name + '_sum', ())}
+            counts = {tuple(map(tuple, labels)): value for labels, value in samples.get(metric.name + '_count', ())}
+            for labels in sorted(series):
+                cumulative = 0.0
+                for bucket in metric.buckets:
+                    cumulative += series[labels].get(_format_float(bucket), 0.0)
+                    lines.append(f'{metric.name}_bucket{_labels_text(labels + (("le", _format_float(bucket)),))} {cumulative}')
+                lines.append(f'{metric.name}_sum{_labels_text(labels)} {sums.get(labels, 0.0)}')
+                lines.append(f'{metric.name}_count{_labels_text(labels)} {counts.get(labels, 0.0)}')
+        else:
+            sample_name = metric.name + ('_total' if isinstance(metric, Counter) else '')
+            for labels, value in sorted(samples.get(sample_name, ()), key=lambda item: item[0]):
+                lines.append(f'{sample_name}{_labels_text(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Отдаёт метрики всех процессов в текстовом формате Prometheus.
+
+    Доступ: адреса из METRICS_ALLOWED_IPS или сотрудники.
+
+    Аргументы:
+        request: HTTP-запрос.
+
+    Возвращает:
+        HttpResponse: Метрики в формате text/plain; version=0.0.4.
+    """
+    allowed = client_ip(request) in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    if not allowed and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden('Metrics are not available from this address.')
+    return HttpResponse(render_text(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """
+    Измеряет длительность запроса и число SQL-запросов по имени URL.
+
+    Для потоковых ответов учитывается время до начала отправки тела.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not metrics_enabled():
+            return self.get_response(request)
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connections['default'].execute_wrapper(count_queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else '<unresolved>'
+        REQUEST_LATENCY.observe(duration, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        DB_QUERIES_PER_REQUEST.observe(queries[0], view=view)
+        return response
+
+
+class InstrumentedEmailBackend(BaseEmailBackend):
+    """
+    Почтовый бэкенд, который считает отправки и передаёт их MAIL_DELIVERY_BACKEND.
+
+    Письма отправляются синхронно в запросе, поэтому глубина очереди — число
+    писем, которые воркеры передают бэкенду прямо сейчас.
+    """
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.delivery = get_connection(settings.MAIL_DELIVERY_BACKEND, fail_silently=fail_silently, **kwargs)
+
+    def open(self):
+        return self.delivery.open()
+
+    def close(self):
+        self.delivery.close()
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        count = len(email_messages)
+        MAIL_QUEUE.inc(count)
+        try:
+            sent = self.delivery.send_messages(email_messages) or 0
+        except Exception:
+            MAILS.inc(count, result='error')
+            raise
+        finally:
+            MAIL_QUEUE.dec(count)
+        MAILS.inc(sent, result='sent')
+        if sent < count:
+            MAILS.inc(count - sent, result='failed')
+        return sent
@@ -0,0 +1,182 @@
+"""
+Ограничение частоты запросов к пишущим и авторизационным представлениям.
+
+Счётчики — скользящее окно (два соседних фиксированных окна со взвешиванием)
+в кэше RATELIMIT_CACHE: incr атомарен и в Redis, и в locmem; если кэш
+недоступен, счётчики временно ведутся в локальном locmem процесса. Правила
+задаются в settings.RATELIMITS по группам, ключ — IP, пользователь или оба.
+При превышении возвращается 429 с заголовком Retry-After, отказы считаются
+в кэше и доступны персоналу через ratelimit_metrics.
+"""
+import logging
+import math
+import re
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+RATE_RE = re.compile(r'^(?P<limit>\d+)/(?P<count>\d*)(?P<unit>[smhd])$')
+UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEY_PREFIX = 'ratelimit'
+
+# Запасной кэш на случай недоступности основного (например, Redis)
+_fallback_cache = LocMemCache('ratelimit-fallback', {})
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+
+
+def parse_rate(rate):
+    """
+    Разбирает строку вида '10/m' или '100/15m'.
+
+    Возвращает:
+        tuple: (лимит, длина окна в секундах).
+    """
+    match = RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f'Invalid rate: {rate!r}')
+    return int(match['limit']), int(match['count'] or 1) * UNITS[match['unit']]
+
+
+def client_ip(request):
+    """
+    Возвращает IP клиента.
+
+    Левые элементы X-Forwarded-For задаёт сам клиент, а каждый прокси дописывает
+    адрес справа, поэтому клиентом считается адрес, добавленный первым из
+    RATELIMIT_TRUSTED_PROXIES доверенных прокси (N-й справа).
+    """
+    if getattr(settings, 'RATELIMIT_TRUST_FORWARDED', False):
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        depth = max(getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 1), 1)
+        if len(forwarded) >= depth:
+            return forwarded[-depth]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_key(request, key_type):
+    user = getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    if key_type in ('user', 'user_or_ip') and authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def _incr(cache, key, timeout):
+    # add() создаёт счётчик с TTL, incr() атомарно увеличивает существующий
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def hit(group, key, rate, now=None, cache=None):
+    """
+    Регистрирует обращение и проверяет лимит.
+
+    Аргументы:
+        group: Имя группы правил.
+        key: Ключ клиента (IP или пользователь).
+        rate: Строка лимита.
+        now: Текущее время (для тестов).
+        cache: Кэш для счётчиков (по умолчанию RATELIMIT_CACHE).
+
+    Возвращает:
+        tuple: (разрешено ли, через сколько секунд повторить).
+    """
+    limit, window = parse_rate(rate)
+    cache = cache or get_cache()
+    now = time.time() if now is None else now
+    current_window = int(now // window)
+    elapsed = now - current_window * window
+    base = f'{KEY_PREFIX}:{group}:{key}:'
+    current = _incr(cache, base + str(current_window), window * 2)
+    previous = cache.get(base + str(current_window - 1), 0)
+    weight = 1 - elapsed / window
+    estimated = previous * weight + current
+    if estimated <= limit:
+        return True, 0
+    if current > limit:
+        retry_after = window - elapsed
+    else:
+        # Ждём, пока вклад предыдущего окна уменьшится настолько, чтобы уложиться в лимит
+        retry_after = (1 - (limit - current) / previous) * window - elapsed if previous else window - elapsed
+    return False, max(1, math.ceil(retry_after))
+
+
+def record_rejection(group):
+    cache = get_cache()
+    try:
+        _incr(cache, f'{KEY_PREFIX}:rejected:{group}', None)
+        _incr(cache, f'{KEY_PREFIX}:rejected:__all__', None)
+    except Exception:
+        logger.warning('Rate limit metrics are unavailable', exc_info=True)
+
+
+def get_metrics():
+    groups = list(getattr(settings, 'RATELIMITS', {})) + ['__all__']
+    values = get_cache().get_many([f'{KEY_PREFIX}:rejected:{group}' for group in groups])
+    return {group: values.get(f'{KEY_PREFIX}:rejected:{group}', 0) for group in groups}
+
+
+def check_request(request, group):
+    """
+    Проверяет запрос по правилу группы.
+
+    Возвращает:
+        HttpResponse | None: Ответ 429 или None, если запрос разрешён.
+    """
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return None
+    rule = settings.RATELIMITS.get(group)
+    if not rule or request.method not in rule.get('methods', ('POST',)):
+        return None
+    key = request_key(request, rule.get('key', 'ip'))
+    try:
+        allowed, retry_after = hit(group, key, rule['rate'])
+    except Exception:
+        logger.warning('Rate limit cache is unavailable, using local fallback', exc_info=True)
+        allowed, retry_after = hit(group, key, rule['rate'], cache=_fallback_cache)
+    if allowed:
+        return None
+    record_rejection(group)
+    logger.warning('Rate limit exceeded for %s (%s)', group, client_ip(request))
+    response = HttpResponse('Слишком много запросов. Повторите попытку позже.', status=429,
+                            content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimitMixin:
+    """
+    Применяет правило settings.RATELIMITS[ratelimit_group] до обработки запроса.
+
+    Атрибуты:
+        ratelimit_group: Имя группы правил.
+    """
+    ratelimit_group = None
+
+    def dispatch(self, request, *args, **kwargs):
+        response = check_request(request, self.ratelimit_group)
+        if response is not None:
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+@staff_member_required
+def ratelimit_metrics(request):
+    """
+    Возвращает количество отклонённых запросов по группам.
+    """
+    return JsonResponse({'rejected': get_metrics()})
@@ -10,8 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,7 +42,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'config.metrics.MetricsMiddleware',
+    'config.traffic.TrafficCaptureMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'config.compression.CompressionMiddleware',
+    'config.edgecache.EdgeCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -77,21 +82,58 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'mssql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST'),
-        'PORT': '',
-        'OPTIONS': {
-            'driver': 'ODBC Driver 18 for SQL Server',
-            'extra_params': 'TrustServerCertificate=yes',
-        },
+# Профиль БД выбирается переменной DB_PROFILE: mssql (production), postgresql или sqlite.
+# Параметры подключения читаются только для выбранного профиля.
+DB_PROFILE = config('DB_PROFILE', default='mssql')
+
+
+def _database_profile(profile):
+    common = {
+        # Постоянные соединения: поток запросов не открывает соединение заново на каждый запрос
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
+    if profile == 'sqlite':
+        return {
+            'ENGINE': 'config.db_backends.sqlite',
+            'NAME': config('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {'timeout': 20},
+            **common,
+        }
+    if profile == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': config('DB_PORT', default=''),
+            **common,
+        }
+    if profile == 'mssql':
+        return {
+            'ENGINE': 'mssql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': '',
+            'OPTIONS': {
+                'driver': 'ODBC Driver 18 for SQL Server',
+                'extra_params': 'TrustServerCertificate=yes',
+            },
+            **common,
+        }
+    raise ValueError(f'Unknown DB_PROFILE: {profile!r}')
+
+
+DATABASES = {
+    'default': _database_profile(DB_PROFILE),
 }
 
+# Прогрев воркера при старте (config/warmup.py): 'background', 'sync' (без --preload) или '' (выключен)
+WARMUP_ON_STARTUP = config('WARMUP_ON_STARTUP', default='background')
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -110,6 +152,25 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хэширование паролей (users/hashers.py): PASSWORD_HASHER выбирает основной алгоритм,
+# остальные остаются для проверки старых хэшей и перехэшируются при входе
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='scrypt')
+SCRYPT_WORK_FACTOR = config('SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+SCRYPT_BLOCK_SIZE = config('SCRYPT_BLOCK_SIZE', default=8, cast=int)
+SCRYPT_PARALLELISM = config('SCRYPT_PARALLELISM', default=1, cast=int)
+PBKDF2_ITERATIONS = config('PBKDF2_ITERATIONS', default=720000, cast=int)
+_PASSWORD_HASHERS = {
+    'scrypt': 'users.hashers.TunableScryptPasswordHasher',
+    'pbkdf2': 'users.hashers.TunablePBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *[hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER],
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -133,13 +194,32 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Хранилище добавляет хэш содержимого в URL загруженных файлов (см. config/media.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'config.media.HashedMediaStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Заранее построенные sitemap-файлы (команда build_sitemaps)
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+SITE_URL = config('SITE_URL', default='http://127.0.0.1:8000')
+# Отдача медиафайлов фронтенд-сервером: '' (сам Django), 'x-sendfile' или 'x-accel-redirect'
+MEDIA_SENDFILE_BACKEND = config('MEDIA_SENDFILE_BACKEND', default='')
+# internal-location nginx, в который смотрит X-Accel-Redirect
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Email settings
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Используем консоль для тестов
+# Отправки считаются для /metrics, доставку выполняет MAIL_DELIVERY_BACKEND
+EMAIL_BACKEND = 'config.metrics.InstrumentedEmailBackend'
+MAIL_DELIVERY_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Используем консоль для тестов
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -153,15 +233,117 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/users/login/'  # После выхода перенаправляем на логин
 CSRF_COOKIE_SECURE = False  # Убедимся, что CSRF-куки передаются без HTTPS (для локального теста)
 CSRF_COOKIE_HTTPONLY = False
+# Ограничение частоты запросов (config/ratelimit.py): лимит 'N/окно', ключ 'ip', 'user' или 'user_or_ip'
+RATELIMIT_ENABLED = config('RATELIMIT_ENABLED', default=True, cast=bool)
+RATELIMIT_CACHE = 'default'
+# Брать IP из X-Forwarded-For (только за доверенным прокси)
+RATELIMIT_TRUST_FORWARDED = config('RATELIMIT_TRUST_FORWARDED', default=False, cast=bool)
+# Сколько доверенных прокси дописывают X-Forwarded-For; клиент — адрес на этой глубине справа
+RATELIMIT_TRUSTED_PROXIES = config('RATELIMIT_TRUSTED_PROXIES', default=1, cast=int)
+RATELIMITS = {
+    'login': {'rate': '10/m', 'key': 'ip'},
+    'register': {'rate': '5/h', 'key': 'ip'},
+    'reset_password': {'rate': '3/h', 'key': 'user'},
+    'post_create': {'rate': '20/h', 'key': 'user_or_ip'},
+    'review_create': {'rate': '10/m', 'key': 'user_or_ip'},
+}
+# Кэш результатов запросов Post/Origin/Review (posts/querycache.py)
+QUERY_CACHE = {
+    'ENABLED': config('QUERY_CACHE_ENABLED', default=True, cast=bool),
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    # Сколько ждать результата, который уже считает другой запрос
+    'LOCK_WAIT': 0.5,
+    # Поля, изменение которых не сбрасывает кэш таблицы; last_login обновляется при каждом входе
+    'VOLATILE_FIELDS': {'posts_post': ['views'], 'auth_user': ['last_login']},
+}
+# Сжатие ответов (config/compression.py): brotli, если установлен пакет brotli, иначе gzip
+COMPRESSION_BROTLI = config('COMPRESSION_BROTLI', default=True, cast=bool)
+COMPRESSION_BROTLI_QUALITY = 5
+# Проверки /healthz и /readyz (config/health.py): таймаут и время жизни результата в секундах
+HEALTH_CHECKS = {
+    'TIMEOUT': config('HEALTH_CHECK_TIMEOUT', default=1.0, cast=float),
+    'TTL': 5.0,
+    # Без этих зависимостей /readyz отвечает 503
+    'CRITICAL': ['database', 'cache', 'storage'],
+    # Проверять ли SMTP-соединение (отчётно, на готовность не влияет)
+    'EMAIL': config('HEALTH_CHECK_EMAIL', default=False, cast=bool),
+}
+# Метрики воркеров (config/metrics.py): файлы значений в METRICS_DIR общие для всех процессов.
+# manage.py выключает их для всех команд, кроме runserver
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+# Каталог во временной файловой системе: файлы живут, пока живут воркеры; при нескольких
+# экземплярах на одном хосте каждому нужен свой каталог
+METRICS_DIR = config('METRICS_DIR', default=os.path.join(tempfile.gettempdir(), f'{BASE_DIR.name}-metrics'))
+# С каких адресов /metrics доступен без входа сотрудника
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1', cast=Csv())
+# Кэширование анонимных страниц на CDN (config/edgecache.py). Браузерам max-age=0,
+# общим кэшам s-maxage; прокси должен обходить кэш для запросов с cookie sessionid
+EDGE_CACHE = {
+    'ENABLED': config('EDGE_CACHE_ENABLED', default=True, cast=bool),
+    'KEY_HEADER': 'Surrogate-Key',
+    'POLICIES': {
+        'post_list': {'s_maxage': 300, 'stale_while_revalidate': 30},
+        'post_detail': {'s_maxage': 3600, 'stale_while_revalidate': 60},
+        'review_detail': {'s_maxage': 86400, 'stale_while_revalidate': 60},
+    },
+    # Очиститель по ключам: NullPurger (без CDN) или HttpPurger с PURGE_URL
+    'PURGER': config('EDGE_CACHE_PURGER', default='config.edgecache.NullPurger'),
+    # Пока очистка не настроена (NullPurger), s-maxage из POLICIES не больше этого значения
+    'UNPURGED_S_MAXAGE': 60,
+    'PURGE_URL': config('EDGE_CACHE_PURGE_URL', default=''),
+    'PURGE_METHOD': 'POST',
+    # Например, {'Fastly-Key': '...'} для API очистки CDN
+    'PURGE_HEADERS': {},
+    'PURGE_BATCH': 256,
+    'PURGE_TIMEOUT': 2,
+}
+# Запись трафика для replay_traffic (config/traffic.py); по умолчанию выключена
+TRAFFIC_CAPTURE = {
+    'ENABLED': config('TRAFFIC_CAPTURE_ENABLED', default=False, cast=bool),
+    'DIR': config('TRAFFIC_CAPTURE_DIR', default=os.path.join(BASE_DIR, 'traffic')),
+    # Файл каждого процесса ротируется по размеру, хранится BACKUP_COUNT старых частей
+    'MAX_BYTES': 50 * 1024 * 1024,
+    'BACKUP_COUNT': 5,
+    # Доля записываемых запросов
+    'SAMPLE_RATE': config('TRAFFIC_CAPTURE_SAMPLE_RATE', default=1.0, cast=float),
+    'NAMESPACES': ['posts', 'users'],
+    # Параметры запроса без личных данных; текст остальных заменяется заполнителем
+    'KEEP_QUERY': ['cursor', 'granularity', 'start', 'end'],
+    # Аргументы пути, которые пишутся псевдонимом, и поле модели для их подстановки при воспроизведении
+    'PSEUDONYMIZE': {'username': 'auth.User.username'},
+    # Запросы, меняющие сессию или учётные данные, не воспроизводятся
+    'EXCLUDE': ['users:login', 'users:logout', 'users:register', 'users:password_update', 'users:reset_password'],
+}
+# Почасовая статистика просмотров (posts/analytics.py)
+VIEW_ANALYTICS = {
+    'ENABLED': config('VIEW_ANALYTICS_ENABLED', default=True, cast=bool),
+    # Буфер событий сбрасывается в БД по размеру или по времени (секунды)
+    'MAX_BUFFER': 1000,
+    'FLUSH_INTERVAL': 10,
+    # Сколько хранить почасовые и дневные агрегаты
+    'HOURLY_RETENTION_DAYS': 14,
+    'DAILY_RETENTION_DAYS': 730,
+}
+
 # Настройки сессий
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': 'redis://127.0.0.1:6379/1',
-        'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+# CACHE_PROFILE=locmem позволяет запускать проект без Redis (вместе с DB_PROFILE=sqlite)
+CACHE_PROFILE = config('CACHE_PROFILE', default='redis')
+if CACHE_PROFILE == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         }
     }
-}
\ No newline at end of file
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            }
+        }
+    }
\ No newline at end of file
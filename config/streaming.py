@@ -0,0 +1,92 @@
+"""
+Потоковый вывод больших страниц списков.
+
+Персонал может запросить ?page_size=N (до max_page_size). Если страница
+больше stream_threshold, она отдаётся через StreamingHttpResponse: шаблон
+страницы рендерится один раз с меткой вместо списка, затем элементы
+читаются из БД порциями через iterator() и рендерятся отдельным шаблоном
+элемента. Время до первого байта и память не зависят от размера страницы.
+"""
+from django.http import StreamingHttpResponse
+from django.template import Context
+from django.template.loader import get_template, select_template
+from django.utils.safestring import mark_safe
+
+STREAM_MARKER = '<!-- stream:items -->'
+
+
+class StreamingListMixin:
+    """
+    Миксин для ListView с режимом больших страниц для персонала.
+
+    Атрибуты:
+        item_template_name: Шаблон одного элемента списка.
+        item_context_name: Имя элемента в шаблоне элемента.
+        max_page_size: Максимальный размер страницы по ?page_size.
+        stream_threshold: Начиная с какого размера страница отдаётся потоком.
+        stream_chunk_size: Сколько элементов читать и отправлять за раз.
+    """
+    item_template_name = None
+    item_context_name = 'object'
+    max_page_size = 500
+    stream_threshold = 50
+    stream_chunk_size = 100
+
+    def get_requested_page_size(self):
+        """
+        Возвращает размер страницы из ?page_size, если его запросил сотрудник.
+
+        Возвращает:
+            int: Размер страницы или None.
+        """
+        if not self.request.user.is_staff:
+            return None
+        try:
+            size = int(self.request.GET.get('page_size', ''))
+        except ValueError:
+            return None
+        return min(max(size, 1), self.max_page_size)
+
+    def get_paginate_by(self, queryset):
+        return self.get_requested_page_size() or super().get_paginate_by(queryset)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['page_size'] = self.get_requested_page_size()
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        page_size = self.get_requested_page_size()
+        if not page_size or page_size < self.stream_threshold or not context.get('page_obj'):
+            return super().render_to_response(context, **response_kwargs)
+        response_kwargs.setdefault('content_type', 'text/html; charset=utf-8')
+        return StreamingHttpResponse(self.stream_page(context), **response_kwargs)
+
+    def stream_page(self, context):
+        """
+        Генерирует страницу частями: начало шаблона, порции элементов, конец шаблона.
+        """
+        page_template = select_template(self.get_template_names())
+        page = page_template.render({**context, 'streaming': True, 'stream_marker': mark_safe(STREAM_MARKER)},
+                                    self.request)
+        head, _marker, tail = page.partition(STREAM_MARKER)
+        yield head
+
+        # Контекстные процессоры выполняем один раз, а не для каждого элемента
+        item_template = get_template(self.item_template_name).template
+        values = {}
+        for processor in item_template.engine.template_context_processors:
+            values.update(processor(self.request))
+        values.update(context)
+        item_context = Context(values, autoescape=item_template.engine.autoescape)
+
+        parts = []
+        for obj in context['page_obj'].object_list.iterator(chunk_size=self.stream_chunk_size):
+            with item_context.push({self.item_context_name: obj}):
+                parts.append(item_template.render(item_context))
+            if len(parts) >= self.stream_chunk_size:
+                yield ''.join(parts)
+                parts = []
+        if parts:
+            yield ''.join(parts)
+        yield tail
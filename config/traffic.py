@@ -0,0 +1,189 @@
+"""
+Запись реального трафика для нагрузочных тестов.
+
+Включённый TrafficCaptureMiddleware пишет по строке NDJSON на каждый запрос
+к приложениям из TRAFFIC_CAPTURE['NAMESPACES']: имя URL, аргументы пути,
+параметры запроса и поля формы, уровень пользователя (anonymous, user,
+staff), код ответа и длительность. Пароли, токены и адреса почты в файл не
+попадают, а произвольный текст из форм и параметров запроса заменяется
+заполнителем той же длины. Аргументы пути из TRAFFIC_CAPTURE['PSEUDONYMIZE']
+(например, имя пользователя) пишутся псевдонимом — HMAC от значения, — и при
+воспроизведении сопоставляются с существующими объектами. Каждый
+процесс пишет в свой файл traffic-<pid>.ndjson, который ротируется по
+размеру. Команда replay_traffic воспроизводит записи на локальном экземпляре.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+FILLER = 'lorem ipsum dolor sit amet consectetur adipiscing elit '
+# Значения, которые переносятся как есть: числа, флажки и пустые поля
+PLAIN_VALUE = re.compile(r'^(-?\d+(\.\d+)?|on|off|true|false|)$', re.IGNORECASE)
+DEFAULT_SENSITIVE = r'pass|token|secret|csrf|email|key|session'
+MAX_QUERY_VALUE = 100
+PSEUDONYM_PREFIX = 'anon-'
+
+_writer_lock = threading.Lock()
+_writer = None
+_writer_pid = None
+
+
+def capture_settings():
+    return getattr(settings, 'TRAFFIC_CAPTURE', {})
+
+
+def capture_dir():
+    return Path(capture_settings().get('DIR') or Path(settings.BASE_DIR) / 'traffic')
+
+
+def user_tier(user):
+    """
+    Определяет уровень пользователя, под которым запрос воспроизводится.
+
+    Возвращает:
+        str: 'staff', 'user' или 'anonymous'.
+    """
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    return 'staff' if user.is_staff else 'user'
+
+
+def filler(length):
+    """
+    Возвращает текст-заполнитель заданной длины из обычных слов.
+
+    Слова вместо одного повторяющегося символа сохраняют похожую нагрузку
+    на разметку, поиск и проверку дубликатов.
+    """
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+def sanitize(pairs, sensitive, keep=(), limit=None):
+    """
+    Очищает пары (ключ, значение) из GET или POST.
+
+    Аргументы:
+        pairs: Итератор пар (ключ, список значений), как у QueryDict.lists().
+        sensitive: Скомпилированное выражение для имён полей, которые отбрасываются.
+        keep: Имена полей, значения которых не содержат личных данных и переносятся как есть.
+        limit: Максимальная длина значения или None.
+
+    Возвращает:
+        list: Пары [ключ, значение]; прочий текст заменён заполнителем той же длины.
+    """
+    cleaned = []
+    for key, values in pairs:
+        if sensitive.search(key):
+            continue
+        for value in values:
+            if limit is not None:
+                value = value[:limit]
+            if key not in keep and not PLAIN_VALUE.match(value):
+                value = filler(len(value))
+            cleaned.append([key, value])
+    return cleaned
+
+
+def pseudonym(value):
+    """
+    Возвращает устойчивый псевдоним значения: одно и то же значение даёт один псевдоним.
+    """
+    return PSEUDONYM_PREFIX + salted_hmac('config.traffic.pseudonym', str(value)).hexdigest()[:16]
+
+
+def pseudonymize(kwargs, names):
+    """
+    Заменяет псевдонимами аргументы пути с именами из names.
+
+    Возвращает:
+        dict: Аргументы для записи.
+    """
+    return {key: pseudonym(value) if key in names else value for key, value in kwargs.items()}
+
+
+def _get_writer():
+    global _writer, _writer_pid
+    pid = os.getpid()
+    if _writer_pid != pid:
+        with _writer_lock:
+            if _writer_pid != pid:
+                # После fork дочерний процесс открывает собственный файл
+                options = capture_settings()
+                directory = capture_dir()
+                directory.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(
+                    directory / f'traffic-{pid}.ndjson',
+                    maxBytes=options.get('MAX_BYTES', 50 * 1024 * 1024),
+                    backupCount=options.get('BACKUP_COUNT', 5),
+                    encoding='utf-8',
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                _writer, _writer_pid = handler, pid
+    return _writer
+
+
+def write_record(record):
+    """
+    Дописывает запись в файл трафика текущего процесса.
+    """
+    line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+    _get_writer().handle(logging.makeLogRecord({'msg': line, 'args': None}))
+
+
+class TrafficCaptureMiddleware:
+    """
+    Записывает очищенные трассы запросов, если TRAFFIC_CAPTURE['ENABLED'].
+
+    Стоит первым после MetricsMiddleware, чтобы длительность включала сессии
+    и аутентификацию. Пользователь определяется после ответа, поэтому вход,
+    выход и регистрация (они меняют сессию) исключены через EXCLUDE.
+    Для потоковых ответов учитывается время до начала отправки тела.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = capture_settings()
+        if not options.get('ENABLED'):
+            return self.get_response(request)
+        started_at = time.time()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.namespace not in options.get('NAMESPACES', ('posts', 'users')):
+            return response
+        if match.view_name in options.get('EXCLUDE', ()):
+            return response
+        if random.random() >= options.get('SAMPLE_RATE', 1.0):
+            return response
+
+        sensitive = re.compile(options.get('SENSITIVE', DEFAULT_SENSITIVE), re.IGNORECASE)
+        record = {
+            'ts': round(started_at, 3),
+            'method': request.method,
+            'view': match.view_name,
+            'kwargs': pseudonymize(match.kwargs, options.get('PSEUDONYMIZE', {})),
+            'query': sanitize(request.GET.lists(), sensitive, options.get('KEEP_QUERY', ()), MAX_QUERY_VALUE),
+            'tier': user_tier(getattr(request, 'user', None)),
+            'status': response.status_code,
+            'ms': round(duration * 1000, 2),
+        }
+        if request.method == 'POST':
+            # Файлы не сохраняются: при воспроизведении форма уходит без них
+            record['form'] = sanitize(request.POST.lists(), sensitive)
+        try:
+            write_record(record)
+        except (OSError, TypeError, ValueError) as exc:
+            logging.getLogger(__name__).warning('Traffic capture failed: %s', exc)
+        return response
@@ -1,13 +1,25 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from config.health import healthz, readyz
+from config.media import serve_media
+from config.metrics import metrics_view
+from config.ratelimit import ratelimit_metrics
+from posts.analytics import view_stats
+from posts.querycache import querycache_stats
+from posts.sitemaps import serve_sitemap
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('posts.urls')),
     path('users/', include('users.urls')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path('healthz', healthz, name='healthz'),
+    path('metrics', metrics_view, name='metrics'),
+    path('readyz', readyz, name='readyz'),
+    path('internal/ratelimit/', ratelimit_metrics, name='ratelimit_metrics'),
+    path('internal/querycache/', querycache_stats, name='querycache_stats'),
+    path('internal/views/', view_stats, name='view_stats'),
+    path('sitemap.xml', serve_sitemap, name='sitemap'),
+    re_path(r'^(?P<filename>sitemap-[\w-]+\.xml)$', serve_sitemap, name='sitemap_section'),
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+]
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Прогрев воркера перед первым запросом.
+
+Вызывается из config/wsgi.py и config/asgi.py после создания приложения:
+строит URL-резолверы, компилирует шаблоны приложений и загружает каталоги
+переводов, чтобы эти затраты не ложились на первый запрос, и проверяет,
+что БД отвечает. Флаг готовности используется проверкой /readyz.
+
+Соединения Django привязаны к потоку, поэтому соединение, открытое при
+прогреве, первому запросу не достаётся: поток запроса открывает своё.
+Модуль wsgi импортируется и в мастер-процессе сервера с предзагрузкой
+(gunicorn --preload), поэтому по умолчанию прогрев идёт в фоновом потоке,
+закрывает свои соединения, а после fork каждый воркер прогревается заново.
+"""
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_scheduled = False
+
+
+def is_warm():
+    return _ready.is_set()
+
+
+def preload_urls():
+    from django.urls import get_resolver
+    resolver = get_resolver()
+    # reverse_dict строит таблицы для reverse() по всем include()
+    resolver.reverse_dict
+    for namespace in resolver.namespace_dict:
+        resolver.namespace_dict[namespace][1].reverse_dict
+
+
+def preload_templates():
+    from django.apps import apps
+    from django.template import TemplateDoesNotExist, TemplateSyntaxError
+    from django.template.loader import get_template
+    for app_config in apps.get_app_configs():
+        templates_dir = Path(app_config.path) / 'templates'
+        if not templates_dir.is_dir():
+            continue
+        for path in templates_dir.rglob('*.html'):
+            try:
+                get_template(path.relative_to(templates_dir).as_posix())
+            except (TemplateDoesNotExist, TemplateSyntaxError):
+                logger.warning('Warm-up: template %s could not be loaded', path)
+
+
+def preload_translations():
+    from django.utils import translation
+    for code, _name in settings.LANGUAGES:
+        with translation.override(code):
+            translation.gettext('')
+
+
+def check_database():
+    from django.db import connections
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+WARMUP_STEPS = [
+    ('urls', preload_urls),
+    ('templates', preload_templates),
+    ('translations', preload_translations),
+    ('database', check_database),
+]
+
+
+def warm_up():
+    """
+    Выполняет все шаги прогрева один раз за процесс.
+
+    Возвращает:
+        dict: Время каждого шага в секундах.
+    """
+    timings = {}
+    with _lock:
+        if _ready.is_set():
+            return timings
+        for name, step in WARMUP_STEPS:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                # Недоступная зависимость не должна ронять воркер: /readyz покажет проблему
+                logger.exception('Warm-up step %s failed', name)
+            timings[name] = time.perf_counter() - started
+        _ready.set()
+    logger.info('Warm-up finished: %s', ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in timings.items()))
+    return timings
+
+
+def _warm_up_in_thread():
+    from django.db import connections
+    try:
+        warm_up()
+    finally:
+        # Соединения потока прогрева никому не нужны и не должны пережить fork
+        connections.close_all()
+
+
+def schedule_warm_up():
+    """
+    Запускает прогрев согласно настройке WARMUP_ON_STARTUP.
+
+    'background' (по умолчанию) — в отдельном потоке, чтобы воркер быстрее
+    открыл сокет (пока прогрев идёт, /readyz отвечает 503); 'sync' — до того,
+    как сервер начнёт принимать запросы, только для серверов без предзагрузки
+    приложения в мастер-процессе; пустое значение — без прогрева.
+    """
+    global _scheduled
+    _scheduled = True
+    mode = getattr(settings, 'WARMUP_ON_STARTUP', 'background')
+    if mode == 'background':
+        threading.Thread(target=_warm_up_in_thread, name='warm-up', daemon=True).start()
+    elif mode:
+        warm_up()
+    else:
+        _ready.set()
+
+
+def _rewarm_after_fork():
+    # Флаг готовности мастера ничего не говорит о воркере, а поток прогрева fork не переживает
+    # и мог оставить _lock захваченным. Дочерние процессы команд (без schedule_warm_up) не трогаем
+    global _lock
+    _lock = threading.Lock()
+    if _scheduled and getattr(settings, 'WARMUP_ON_STARTUP', 'background'):
+        _ready.clear()
+        threading.Thread(target=_warm_up_in_thread, name='warm-up', daemon=True).start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_rewarm_after_fork)
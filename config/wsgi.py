@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Прогрев URL-резолверов, шаблонов и переводов до первого запроса (config/warmup.py)
+from config.warmup import schedule_warm_up  # noqa: E402
+
+schedule_warm_up()
@@ -7,6 +7,9 @@ import sys
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    if sys.argv[1:2] != ['runserver']:
+        # Метрики собираются с воркеров; тесты и разовые команды не оставляют файлов в METRICS_DIR
+        os.environ.setdefault('METRICS_ENABLED', 'False')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
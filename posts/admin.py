@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Comment, Origin
+from .models import Post, Comment, Origin, Place
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -22,8 +22,16 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(Origin)
 class OriginAdmin(admin.ModelAdmin):
-    list_display = ('post', 'parent_name', 'origin', 'id')
+    list_display = ('post', 'parent_name', 'origin', 'place', 'id')
     list_filter = ('post',)
     search_fields = ('parent_name', 'origin', 'description')
     ordering = ('post',)
-    fields = ('post', 'parent_name', 'origin', 'description')
\ No newline at end of file
+    fields = ('post', 'parent_name', 'origin', 'description')
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'post_count', 'id')
+    search_fields = ('name', 'key')
+    ordering = ('-post_count', 'name')
+    fields = ('name', 'key', 'post_count')
+    readonly_fields = ('key', 'post_count')
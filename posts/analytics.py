@@ -0,0 +1,330 @@
+"""
+Почасовая статистика просмотров постов.
+
+record_view() только добавляет событие в буфер процесса. Буфер сворачивается
+в счётчики (пост, час) и сбрасывается в PostViewHour пакетным UPSERT: при
+заполнении, по таймеру фонового потока и при завершении процесса. Сырые
+события в БД не пишутся. Почасовые строки сворачиваются в PostViewDay
+командой rollup_post_views, старые агрегаты удаляет prune_post_views,
+а отчёты читают только агрегаты.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import NotSupportedError, connections, router, transaction
+from django.db.models import Min, Sum
+from django.db.models.functions import TruncDate
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from config.metrics import VIEW_BUFFER, VIEW_FLUSH_LAG
+
+from .models import Post, PostViewDay, PostViewHour
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном INSERT/MERGE: по 3 параметра, с запасом до лимитов SQLite (999) и SQL Server (2100)
+UPSERT_BATCH_SIZE = 300
+DELETE_CHUNK_SIZE = 5000
+DEFAULT_WINDOWS = {'hour': timedelta(hours=24), 'day': timedelta(days=30)}
+
+stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'flushes': 0}
+_buffer = []
+_lock = threading.Lock()
+_flusher = None
+
+
+def get_config():
+    config = {
+        'ENABLED': True, 'MAX_BUFFER': 1000, 'FLUSH_INTERVAL': 10,
+        'HOURLY_RETENTION_DAYS': 14, 'DAILY_RETENTION_DAYS': 730,
+    }
+    config.update(getattr(settings, 'VIEW_ANALYTICS', {}))
+    return config
+
+
+def bucket_hour(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def record_view(post_id, moment=None):
+    """
+    Добавляет просмотр в буфер; запись в БД происходит позже и пакетом.
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return
+    _ensure_flusher(config['FLUSH_INTERVAL'])
+    with _lock:
+        # Если БД долго недоступна, буфер не растёт бесконечно
+        if len(_buffer) >= config['MAX_BUFFER'] * 10:
+            stats['dropped'] += 1
+            return
+        _buffer.append((post_id, moment or timezone.now()))
+        stats['recorded'] += 1
+        VIEW_BUFFER.inc()
+        full = len(_buffer) >= config['MAX_BUFFER']
+    if full:
+        _safe_flush()
+
+
+def flush():
+    """
+    Сбрасывает буфер в PostViewHour.
+
+    Возвращает:
+        int: Количество записанных событий.
+    """
+    global _buffer
+    with _lock:
+        events, _buffer = _buffer, []
+    if not events:
+        return 0
+    try:
+        counts = Counter((post_id, bucket_hour(moment)) for post_id, moment in events)
+        # Пост мог быть физически удалён, пока событие ждало в буфере
+        existing = set(Post.all_objects.filter(pk__in={post_id for post_id, _hour in counts}).values_list('pk', flat=True))
+        upsert(PostViewHour, 'hour', [
+            (post_id, hour, views) for (post_id, hour), views in counts.items() if post_id in existing
+        ], accumulate=True)
+    except Exception:
+        with _lock:
+            _buffer[:0] = events
+        raise
+    stats['flushed'] += len(events)
+    stats['flushes'] += 1
+    VIEW_BUFFER.dec(len(events))
+    VIEW_FLUSH_LAG.observe((timezone.now() - min(moment for _post_id, moment in events)).total_seconds())
+    return len(events)
+
+
+def _safe_flush():
+    try:
+        flush()
+    except Exception:
+        logger.warning('View analytics flush failed, events stay buffered', exc_info=True)
+
+
+def _flush_periodically(interval):
+    while True:
+        time.sleep(interval)
+        _safe_flush()
+        # Соединения этого потока не нужны до следующего сброса
+        connections.close_all()
+
+
+def _ensure_flusher(interval):
+    global _flusher
+    # После fork воркера поток родителя не существует, поэтому проверяем is_alive()
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        first_start = _flusher is None
+        _flusher = threading.Thread(
+            target=_flush_periodically, args=(interval,), name='view-analytics-flush', daemon=True,
+        )
+        _flusher.start()
+    if first_start:
+        atexit.register(_safe_flush)
+
+
+def upsert(model, bucket_field, rows, accumulate):
+    """
+    Вставляет или обновляет строки (post_id, начало интервала, просмотры) агрегатной таблицы.
+
+    Аргументы:
+        model: PostViewHour или PostViewDay.
+        bucket_field: Имя поля интервала ('hour' или 'day').
+        rows: Список кортежей (post_id, интервал, просмотры).
+        accumulate: Прибавлять к существующему значению (True) или заменять его.
+    """
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    field = model._meta.get_field(bucket_field)
+    post_column, bucket_column, views_column = qn('post_id'), qn(field.column), qn('views')
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            params = []
+            for post_id, bucket, views in batch:
+                params.extend((post_id, field.get_db_prep_value(bucket, connection), views))
+            if connection.vendor in ('sqlite', 'postgresql'):
+                new_value = f'{table}.{views_column} + excluded.{views_column}' if accumulate else f'excluded.{views_column}'
+                sql = (
+                    f'INSERT INTO {table} ({post_column}, {bucket_column}, {views_column}) VALUES {values} '
+                    f'ON CONFLICT ({post_column}, {bucket_column}) DO UPDATE SET {views_column} = {new_value}'
+                )
+            elif connection.vendor == 'microsoft':
+                new_value = f'target.{views_column} + source.views' if accumulate else 'source.views'
+                sql = (
+                    f'MERGE {table} WITH (HOLDLOCK) AS target '
+                    f'USING (VALUES {values}) AS source (post_id, bucket, views) '
+                    f'ON target.{post_column} = source.post_id AND target.{bucket_column} = source.bucket '
+                    f'WHEN MATCHED THEN UPDATE SET {views_column} = {new_value} '
+                    f'WHEN NOT MATCHED THEN INSERT ({post_column}, {bucket_column}, {views_column}) '
+                    f'VALUES (source.post_id, source.bucket, source.views);'
+                )
+            else:
+                raise NotSupportedError(f'View analytics UPSERT is not implemented for {connection.vendor}')
+            cursor.execute(sql, params)
+
+
+def _day_start(day):
+    return datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+
+
+def rollup(first_day, last_day):
+    """
+    Пересчитывает дневные агрегаты за дни [first_day, last_day] из почасовых.
+
+    Повторный запуск безопасен: дневные значения заменяются, а не прибавляются.
+
+    Возвращает:
+        int: Количество записанных дневных строк.
+    """
+    rows = (
+        PostViewHour.objects
+        .filter(hour__gte=_day_start(first_day), hour__lt=_day_start(last_day + timedelta(days=1)))
+        .annotate(day=TruncDate('hour', tzinfo=dt_timezone.utc))
+        .values('post_id', 'day')
+        .annotate(total=Sum('views'))
+        .order_by()
+    )
+    rows = [(row['post_id'], row['day'], row['total']) for row in rows]
+    upsert(PostViewDay, 'day', rows, accumulate=False)
+    return len(rows)
+
+
+def _delete_in_chunks(queryset):
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:DELETE_CHUNK_SIZE])
+        if not pks:
+            return deleted
+        queryset.model._default_manager.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def prune(now=None):
+    """
+    Удаляет агрегаты старше сроков хранения.
+
+    Почасовые строки перед удалением сворачиваются в дневные, поэтому
+    история не теряется, даже если rollup_post_views давно не запускалась.
+
+    Возвращает:
+        tuple: Количество удалённых почасовых и дневных строк.
+    """
+    config = get_config()
+    now = now or timezone.now()
+    hourly_cutoff = _day_start((now - timedelta(days=config['HOURLY_RETENTION_DAYS'])).astimezone(dt_timezone.utc).date())
+    expired_hours = PostViewHour.objects.filter(hour__lt=hourly_cutoff)
+    oldest = expired_hours.aggregate(oldest=Min('hour'))['oldest']
+    if oldest is not None:
+        rollup(oldest.astimezone(dt_timezone.utc).date(), (hourly_cutoff - timedelta(days=1)).date())
+    daily_cutoff = (now - timedelta(days=config['DAILY_RETENTION_DAYS'])).astimezone(dt_timezone.utc).date()
+    return _delete_in_chunks(expired_hours), _delete_in_chunks(PostViewDay.objects.filter(day__lt=daily_cutoff))
+
+
+def _bucket_range(granularity, start, end):
+    field = 'hour' if granularity == 'hour' else 'day'
+    if granularity == 'day':
+        start, end = start.date(), end.date() + timedelta(days=1)
+    return {f'{field}__gte': start, f'{field}__lt': end}
+
+
+def time_series(post_id, granularity, start, end):
+    """
+    Возвращает точки (начало интервала, просмотры) поста за окно; пустые интервалы пропускаются.
+    """
+    model, field = (PostViewHour, 'hour') if granularity == 'hour' else (PostViewDay, 'day')
+    return list(
+        model.objects.filter(post_id=post_id, **_bucket_range(granularity, start, end))
+        .order_by(field).values_list(field, 'views')
+    )
+
+
+def top_posts(granularity, start, end, limit=10):
+    """
+    Возвращает посты с наибольшим числом просмотров за окно.
+
+    Возвращает:
+        list: Словари с post_id, title и views.
+    """
+    model = PostViewHour if granularity == 'hour' else PostViewDay
+    totals = list(
+        model.objects.filter(**_bucket_range(granularity, start, end))
+        .values('post_id').annotate(total=Sum('views')).order_by('-total', 'post_id')[:limit]
+    )
+    titles = dict(Post.all_objects.filter(pk__in=[row['post_id'] for row in totals]).values_list('pk', 'title'))
+    return [{'post_id': row['post_id'], 'title': titles.get(row['post_id']), 'views': row['total']} for row in totals]
+
+
+def _parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = _day_start(day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+@staff_member_required
+def view_stats(request):
+    """
+    Отдаёт статистику просмотров из агрегатов.
+
+    Параметры запроса: granularity (hour или day), start и end (дата или
+    дата-время ISO 8601), top (размер рейтинга) и необязательный post
+    для временного ряда одного поста.
+
+    Аргументы:
+        request: HTTP-запрос.
+
+    Возвращает:
+        JsonResponse: Временной ряд и рейтинг постов за окно.
+    """
+    granularity = request.GET.get('granularity', 'hour')
+    if granularity not in DEFAULT_WINDOWS:
+        return JsonResponse({'error': 'granularity must be "hour" or "day"'}, status=400)
+    try:
+        end = _parse_moment(request.GET['end']) if request.GET.get('end') else timezone.now()
+        start = _parse_moment(request.GET['start']) if request.GET.get('start') else end - DEFAULT_WINDOWS[granularity]
+        limit = min(max(int(request.GET.get('top', 10)), 1), 100)
+        post_id = int(request.GET['post']) if request.GET.get('post') else None
+    except ValueError:
+        return JsonResponse({'error': 'invalid start, end, top or post parameter'}, status=400)
+    if start >= end:
+        return JsonResponse({'error': 'start must be before end'}, status=400)
+
+    data = {
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'top': top_posts(granularity, start, end, limit),
+        'buffer': {**stats, 'pending': len(_buffer)},
+    }
+    if post_id is not None:
+        data['series'] = [
+            {'t': bucket.isoformat(), 'views': views}
+            for bucket, views in time_series(post_id, granularity, start, end)
+        ]
+    return JsonResponse(data)
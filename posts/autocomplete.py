@@ -0,0 +1,263 @@
+"""
+Префиксный индекс для автодополнения строки поиска.
+
+Индекс — отсортированный список кортежей (ключ, текст, вид, id поста), поиск
+по префиксу выполняется через bisect. Каждый воркер строит свой индекс из БД
+и держит его в памяти; через кэш воркеры обмениваются только изменениями.
+После фиксации транзакции писатель под блокировкой в кэше читает актуальное
+состояние изменённых постов и записывает его в журнал под следующим номером
+версии. Воркеры раз в VERSION_CHECK_INTERVAL сверяют номер и применяют
+недостающие записи журнала. Если запись журнала пропала из кэша или отставание
+слишком велико, воркер перестраивает индекс из БД; увеличение эпохи
+заставляет перестроиться все воркеры.
+"""
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'autocomplete:version'
+EPOCH_KEY = 'autocomplete:epoch'
+LOG_KEY = 'autocomplete:log:{}'
+LOCK_KEY = 'autocomplete:lock'
+# Как часто воркер сверяет свою копию с версией в кэше
+VERSION_CHECK_INTERVAL = 2.0
+# Сколько хранятся записи журнала и сколько их можно применить вместо перестройки
+LOG_TIMEOUT = 3600
+MAX_LOG_GAP = 500
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 2.0
+WORD_START_RE = re.compile(r'[\s,.\-–—()«»"]+')
+
+KIND_TITLE = 'title'
+KIND_ORIGIN = 'origin'
+KIND_PARENT = 'parent'
+
+
+def fold(text):
+    """
+    Приводит строку к ключу поиска: casefold и «ё» → «е».
+    """
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def terms_for(text):
+    """
+    Возвращает ключи для строки: целиком и с начала каждого следующего слова,
+    чтобы «нью» находило «Квинс, Нью-Йорк».
+    """
+    folded = fold(text)
+    if not folded:
+        return []
+    keys = [folded]
+    for match in WORD_START_RE.finditer(folded):
+        rest = folded[match.end():]
+        if rest:
+            keys.append(rest)
+    return keys
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.entries = []
+        # id поста -> (заголовок, происхождения, записи); позволяет заменить пост без полного прохода
+        self.by_post = {}
+
+    def search(self, prefix, limit=10):
+        key = fold(prefix)
+        if not key:
+            return []
+        results = []
+        seen = set()
+        position = bisect_left(self.entries, (key,))
+        for term, display, kind, post_id in self.entries[position:]:
+            if not term.startswith(key):
+                break
+            marker = (kind, display) if kind != KIND_TITLE else (kind, post_id)
+            if marker in seen:
+                continue
+            seen.add(marker)
+            results.append({'label': display, 'kind': kind, 'post_id': post_id})
+            if len(results) >= limit:
+                break
+        return results
+
+    def remove_post(self, post_id):
+        _title, _origins, entries = self.by_post.pop(post_id, (None, None, []))
+        for entry in entries:
+            position = bisect_left(self.entries, entry)
+            if position < len(self.entries) and self.entries[position] == entry:
+                del self.entries[position]
+
+    def set_post(self, post_id, title, origins):
+        """
+        Заменяет записи поста.
+
+        Аргументы:
+            post_id: ID поста.
+            title: Заголовок.
+            origins: Пары (origin, parent_name).
+        """
+        self.remove_post(post_id)
+        origins = sorted(origins)
+        entries = [(term, title, KIND_TITLE, post_id) for term in terms_for(title)]
+        for origin, parent_name in origins:
+            entries += [(term, origin, KIND_ORIGIN, post_id) for term in terms_for(origin)]
+            entries += [(term, parent_name, KIND_PARENT, post_id) for term in terms_for(parent_name)]
+        entries = sorted(set(entries))
+        for entry in entries:
+            insort(self.entries, entry)
+        self.by_post[post_id] = (title, origins, entries)
+
+    def apply(self, states):
+        """
+        Применяет запись журнала: {id поста: (заголовок, происхождения) или None}.
+        """
+        for post_id, state in states.items():
+            if state is None:
+                self.remove_post(post_id)
+            else:
+                self.set_post(post_id, *state)
+
+
+# Индекс меняется и читается разными потоками запросов только под _local_lock
+_local = {'index': None, 'version': None, 'epoch': None, 'checked_at': 0.0}
+_local_lock = threading.Lock()
+
+
+def _visible_posts():
+    from .models import Post
+    return Post.objects.filter(is_active=True)
+
+
+def _origins_for(post_ids):
+    from .models import Origin
+    origins = {}
+    for post_id, origin, parent_name in Origin.objects.filter(post_id__in=post_ids).values_list(
+            'post_id', 'origin', 'parent_name'):
+        origins.setdefault(post_id, []).append((origin, parent_name))
+    return origins
+
+
+def _post_states(post_ids):
+    """
+    Читает из БД состояние постов для индекса.
+
+    Возвращает:
+        dict: id поста -> (заголовок, отсортированные происхождения) или None для скрытых.
+    """
+    visible = dict(_visible_posts().filter(pk__in=post_ids).values_list('pk', 'title'))
+    origins = _origins_for(list(visible))
+    return {
+        post_id: (visible[post_id], sorted(origins.get(post_id, []))) if post_id in visible else None
+        for post_id in post_ids
+    }
+
+
+def _load(version, epoch):
+    # Версия читается до запросов к БД: изменения, записанные позже, придут из журнала
+    index = PrefixIndex()
+    posts = list(_visible_posts().values_list('pk', 'title'))
+    origins = _origins_for([pk for pk, _title in posts])
+    for pk, title in posts:
+        index.set_post(pk, title, origins.get(pk, []))
+    _local.update(index=index, version=version or 0, epoch=epoch, checked_at=time.monotonic())
+    return index
+
+
+def _sync(force=False):
+    """
+    Доводит локальный индекс до версии в кэше; вызывается под _local_lock.
+    """
+    now = time.monotonic()
+    if _local['index'] is not None and not force and now - _local['checked_at'] < VERSION_CHECK_INTERVAL:
+        return _local['index']
+    shared = cache.get_many([VERSION_KEY, EPOCH_KEY])
+    version, epoch = shared.get(VERSION_KEY, 0), shared.get(EPOCH_KEY)
+    if _local['index'] is None or epoch != _local['epoch'] or version < _local['version'] \
+            or version - _local['version'] > MAX_LOG_GAP:
+        return _load(version, epoch)
+    if version > _local['version']:
+        numbers = range(_local['version'] + 1, version + 1)
+        logs = cache.get_many([LOG_KEY.format(number) for number in numbers])
+        if len(logs) != len(numbers):
+            # Запись вытеснена из кэша: изменения не восстановить, перестраиваемся
+            return _load(version, epoch)
+        for number in numbers:
+            _local['index'].apply(logs[LOG_KEY.format(number)])
+        _local['version'] = version
+    _local['checked_at'] = now
+    return _local['index']
+
+
+def get_index():
+    with _local_lock:
+        return _sync()
+
+
+def build_index():
+    """
+    Перестраивает индекс этого воркера из БД и велит остальным воркерам сделать то же.
+    """
+    cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+    with _local_lock:
+        return _sync(force=True)
+
+
+def _acquire_lock():
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while True:
+        if cache.add(LOCK_KEY, token, timeout=LOCK_TIMEOUT):
+            return token
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.01)
+
+
+def _publish(post_ids):
+    """
+    Записывает в журнал изменившиеся посты; вызывается после фиксации транзакции.
+    """
+    token = _acquire_lock()
+    if token is None:
+        # Без блокировки записи журнала могут перезаписать друг друга — перестраиваем все индексы
+        cache.set(EPOCH_KEY, uuid.uuid4().hex, None)
+        return
+    try:
+        with _local_lock:
+            index = _sync(force=True)
+            # Под блокировкой читаем состояние, зафиксированное последним. С локальным индексом
+            # не сравниваем: перестроенный из БД, он уже содержит изменение, о котором не знают другие
+            changed = _post_states(post_ids)
+            version = cache.get(VERSION_KEY, 0) + 1
+            cache.set(LOG_KEY.format(version), changed, LOG_TIMEOUT)
+            cache.set(VERSION_KEY, version, None)
+            index.apply(changed)
+            _local['version'] = version
+    finally:
+        if cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+
+
+def posts_changed(post_ids):
+    """
+    Обновляет индекс для постов после фиксации текущей транзакции;
+    откаченные изменения в индекс не попадают.
+    """
+    post_ids = sorted(set(post_ids))
+    if post_ids:
+        transaction.on_commit(lambda: _publish(post_ids))
+
+
+def post_changed(post):
+    posts_changed([post.pk])
+
+
+def search(prefix, limit=10):
+    with _local_lock:
+        return _sync().search(prefix, limit)
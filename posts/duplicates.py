@@ -0,0 +1,338 @@
+"""
+Поиск почти-дубликатов постов.
+
+Для каждого поста хранятся отпечатки (PostFingerprint):
+- MinHash шинглов из SHINGLE_SIZE слов заголовка и содержимого — оценка
+  сходства Жаккара для переписанных с правками текстов;
+- SimHash слов — расстояние Хэмминга для текстов с переставленными частями;
+- dHash изображения — одинаковые картинки, загруженные под разными именами
+  или пережатые.
+
+Отпечатки разбиваются на полосы (LSH): MinHash на MINHASH_BANDS полос,
+SimHash и dHash на HASH_BLOCKS блоков по 16 бит. Ключи полос хранятся в
+FingerprintBand с индексом по ключу, поэтому поиск кандидатов — один
+индексный запрос по нескольким десяткам ключей, а точная проверка идёт
+только по найденным кандидатам.
+"""
+import hashlib
+import re
+import zlib
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.db import connections, router, transaction
+
+from .autocomplete import fold
+from .models import FingerprintBand, Post, PostFingerprint
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+# 16 полос по 4 значения: пары со сходством от ~0.5 почти всегда попадают в общую полосу
+MINHASH_BANDS = 16
+MIN_JACCARD = 0.6
+HASH_BLOCKS = 4
+# При 4 блоках хэши на расстоянии до 3 бит гарантированно совпадают хотя бы в одном блоке
+MAX_SIMHASH_DISTANCE = 3
+MAX_IMAGE_DISTANCE = 3
+# Ключ полосы, который есть у слишком многих постов (например, шаблонный текст), не ограничивает поиск
+MAX_CANDIDATES = 200
+
+_PRIME = 4294967311  # наименьшее простое число больше 2**32
+_rng = np.random.default_rng(20240531)
+_A = _rng.integers(1, 2 ** 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, NUM_PERM, dtype=np.uint64)
+WORD_RE = re.compile(r'\w+')
+KIND_MINHASH, KIND_SIMHASH, KIND_IMAGE = 'm', 's', 'i'
+
+
+def words(title, content):
+    return WORD_RE.findall(fold(f'{title} {content}'))
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _signed(value):
+    # BigIntegerField знаковое, а хэши — беззнаковые 64 бита
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _unsigned(value):
+    return value & ((1 << 64) - 1)
+
+
+def minhash(tokens):
+    """
+    Возвращает MinHash-подпись шинглов или None для пустого текста.
+
+    Возвращает:
+        numpy.ndarray: NUM_PERM значений uint32.
+    """
+    if not tokens:
+        return None
+    size = min(SHINGLE_SIZE, len(tokens))
+    shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # Универсальное хэширование (a·x + b) mod p для всех перестановок сразу; a·x < 2**64
+    permuted = (hashes[:, None] * _A[None, :] % _PRIME + _B[None, :]) % _PRIME
+    return (permuted.min(axis=0) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def simhash(tokens):
+    weights = np.zeros(64)
+    if tokens:
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        hashes = np.array([_hash64(token) for token in counts], dtype=np.uint64)
+        bits = np.unpackbits(hashes.astype('>u8').view(np.uint8).reshape(-1, 8), axis=1)
+        weights = (np.where(bits, 1.0, -1.0) * np.fromiter(counts.values(), dtype=float)[:, None]).sum(axis=0)
+    return int(''.join('1' if weight > 0 else '0' for weight in weights), 2)
+
+
+def image_hash(file):
+    """
+    Считает dHash изображения: знаки разностей соседних пикселей уменьшенной копии 9×8.
+
+    Возвращает:
+        int: 64-битный хэш или None, если файл не удалось прочитать как изображение.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            pixels = np.asarray(image.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+    finally:
+        file.seek(0)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hamming(first, second):
+    return (_unsigned(first) ^ _unsigned(second)).bit_count()
+
+
+def jaccard(first, second):
+    return float(np.mean(first == second))
+
+
+@dataclass
+class Fingerprint:
+    """
+    Отпечатки одного поста или черновика.
+
+    Атрибуты:
+        simhash: 64-битный SimHash (беззнаковый).
+        minhash: Подпись MinHash или None.
+        image_hash: dHash изображения (беззнаковый) или None.
+    """
+    simhash: int
+    minhash: object = None
+    image_hash: int = None
+
+    @classmethod
+    def compute(cls, title, content, image=None):
+        tokens = words(title, content)
+        return cls(simhash(tokens), minhash(tokens), image_hash(image) if image else None)
+
+    @classmethod
+    def from_stored(cls, simhash, minhash, image_hash):
+        """
+        Восстанавливает отпечаток из значений столбцов PostFingerprint.
+        """
+        signature = np.frombuffer(bytes(minhash), dtype=np.uint32) if minhash else None
+        return cls(_unsigned(simhash), signature, _unsigned(image_hash) if image_hash is not None else None)
+
+    @classmethod
+    def from_model(cls, fingerprint):
+        return cls.from_stored(fingerprint.simhash, fingerprint.minhash, fingerprint.image_hash)
+
+    def band_keys(self):
+        """
+        Возвращает ключи LSH-полос отпечатка.
+        """
+        keys = set()
+        if self.minhash is not None:
+            rows = NUM_PERM // MINHASH_BANDS
+            for band in range(MINHASH_BANDS):
+                keys.add(_signed(_hash64(f'{KIND_MINHASH}{band}:{self.minhash[band * rows:(band + 1) * rows].tobytes().hex()}')))
+        blocks = [(KIND_SIMHASH, self.simhash)] if self.minhash is not None else []
+        if self.image_hash is not None:
+            blocks.append((KIND_IMAGE, self.image_hash))
+        width = 64 // HASH_BLOCKS
+        for kind, value in blocks:
+            for block in range(HASH_BLOCKS):
+                keys.add(_signed(_hash64(f'{kind}{block}:{(value >> (block * width)) & ((1 << width) - 1)}')))
+        return keys
+
+    def compare(self, other):
+        """
+        Сравнивает отпечатки.
+
+        Возвращает:
+            dict: Совпавшие признаки: 'text' — оценка сходства Жаккара, 'image' — расстояние dHash.
+        """
+        reasons = {}
+        if self.minhash is not None and other.minhash is not None:
+            similarity = jaccard(self.minhash, other.minhash)
+            if similarity >= MIN_JACCARD or hamming(self.simhash, other.simhash) <= MAX_SIMHASH_DISTANCE:
+                reasons['text'] = round(similarity, 2)
+        if self.image_hash is not None and other.image_hash is not None:
+            distance = hamming(self.image_hash, other.image_hash)
+            if distance <= MAX_IMAGE_DISTANCE:
+                reasons['image'] = distance
+        return reasons
+
+
+@dataclass
+class DuplicateMatch:
+    """
+    Найденный почти-дубликат.
+
+    Атрибуты:
+        post: Похожий пост (загружены только id и title).
+        reasons: Результат Fingerprint.compare().
+    """
+    post: Post
+    reasons: dict = field(default_factory=dict)
+
+    @property
+    def score(self):
+        return max(self.reasons.get('text', 0), 1.0 if 'image' in self.reasons else 0)
+
+
+def find_duplicates(fingerprint, exclude_pk=None, limit=5):
+    """
+    Ищет неудалённые посты, похожие на отпечаток.
+
+    Аргументы:
+        fingerprint: Fingerprint проверяемого поста или черновика.
+        exclude_pk: id самого поста, если он уже сохранён.
+        limit: Сколько совпадений вернуть.
+
+    Возвращает:
+        list: DuplicateMatch по убыванию сходства.
+    """
+    keys = fingerprint.band_keys()
+    if not keys:
+        return []
+    matches = {}
+    for post_id, *stored in _candidates(keys, exclude_pk):
+        reasons = fingerprint.compare(Fingerprint.from_stored(*stored))
+        if reasons:
+            matches[post_id] = reasons
+    if not matches:
+        return []
+    posts = Post.objects.only('id', 'title').in_bulk(matches)
+    found = [DuplicateMatch(posts[post_id], reasons) for post_id, reasons in matches.items() if post_id in posts]
+    found.sort(key=lambda match: match.score, reverse=True)
+    return found[:limit]
+
+
+def _candidates(keys, exclude_pk):
+    """
+    Читает отпечатки неудалённых постов с общими ключами полос одним SQL-запросом.
+
+    Ключи, которые есть больше чем у MAX_CANDIDATES постов, пропускаются, как
+    в scan_duplicates --max-bucket; остальные кандидаты упорядочены по числу
+    общих ключей, поэтому усечение до MAX_CANDIDATES отбрасывает наименее похожие.
+
+    Запрос собирается вручную: построение того же запроса через ORM стоит
+    дороже, чем его выполнение по индексу, а проверка идёт при каждом создании поста.
+    """
+    using = router.db_for_read(PostFingerprint)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    bands = qn(FingerprintBand._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(keys))
+    sql = (
+        f'SELECT f.{qn("post_id")}, f.{qn("simhash")}, f.{qn("minhash")}, f.{qn("image_hash")} '
+        f'FROM {qn(PostFingerprint._meta.db_table)} f '
+        f'INNER JOIN {qn(Post._meta.db_table)} p ON p.{qn("id")} = f.{qn("post_id")} '
+        f'INNER JOIN (SELECT b.{qn("post_id")} AS {qn("post_id")}, COUNT(*) AS {qn("hits")} FROM {bands} b '
+        f'WHERE b.{qn("key")} IN ({placeholders}) AND b.{qn("key")} NOT IN ('
+        f'SELECT c.{qn("key")} FROM {bands} c WHERE c.{qn("key")} IN ({placeholders}) '
+        f'GROUP BY c.{qn("key")} HAVING COUNT(*) > %s) '
+        f'GROUP BY b.{qn("post_id")}) m ON m.{qn("post_id")} = f.{qn("post_id")} '
+        f'WHERE p.{qn("is_deleted")} = %s'
+    )
+    params = [*keys, *keys, MAX_CANDIDATES, False]
+    if exclude_pk is not None:
+        sql += f' AND f.{qn("post_id")} <> %s'
+        params.append(exclude_pk)
+    sql += f' ORDER BY m.{qn("hits")} DESC, f.{qn("post_id")}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # Без LIMIT/TOP, чтобы запрос одинаково работал на всех профилях БД
+        return cursor.fetchmany(MAX_CANDIDATES)
+
+
+def fingerprint_post(post, stored=None):
+    """
+    Считает отпечаток сохранённого поста; хэш изображения берётся из stored, если файл не менялся.
+    """
+    if post.image and stored is not None and stored.image_name == post.image.name:
+        fingerprint = Fingerprint.compute(post.title, post.content)
+        fingerprint.image_hash = _unsigned(stored.image_hash) if stored.image_hash is not None else None
+        return fingerprint
+    if not post.image:
+        return Fingerprint.compute(post.title, post.content)
+    try:
+        with post.image.open('rb') as image:
+            return Fingerprint.compute(post.title, post.content, image)
+    except OSError:
+        # Файл изображения пропал из хранилища — сравниваем только текст
+        return Fingerprint.compute(post.title, post.content)
+
+
+def _fingerprint_row(post, fingerprint):
+    return PostFingerprint(
+        post_id=post.pk,
+        simhash=_signed(fingerprint.simhash),
+        minhash=fingerprint.minhash.tobytes() if fingerprint.minhash is not None else b'',
+        image_hash=_signed(fingerprint.image_hash) if fingerprint.image_hash is not None else None,
+        image_name=post.image.name if post.image and fingerprint.image_hash is not None else '',
+    )
+
+
+def index_posts(posts):
+    """
+    Пересчитывает отпечатки и полосы для постов и заменяет прежние.
+
+    Аргументы:
+        posts: Список сохранённых постов с загруженными title, content и image.
+
+    Возвращает:
+        int: Количество проиндексированных постов.
+    """
+    if not posts:
+        return 0
+    pks = [post.pk for post in posts]
+    stored = PostFingerprint.objects.in_bulk(pks)
+    rows, bands = [], []
+    for post in posts:
+        fingerprint = fingerprint_post(post, stored.get(post.pk))
+        rows.append(_fingerprint_row(post, fingerprint))
+        bands.extend(FingerprintBand(post_id=post.pk, key=key) for key in fingerprint.band_keys())
+    with transaction.atomic():
+        FingerprintBand.objects.filter(post_id__in=pks).delete()
+        PostFingerprint.objects.filter(post_id__in=pks).delete()
+        PostFingerprint.objects.bulk_create(rows)
+        FingerprintBand.objects.bulk_create(bands, batch_size=1000)
+    return len(rows)
+
+
+def post_changed(post, update_fields=None):
+    """
+    Переиндексирует пост после сохранения, если изменились заголовок, содержимое или изображение.
+    """
+    if update_fields is not None and not {'title', 'content', 'image'} & set(update_fields):
+        return
+    if {'title', 'content', 'image'} & post.get_deferred_fields():
+        post = Post.all_objects.get(pk=post.pk)
+    index_posts([post])
@@ -0,0 +1,50 @@
+"""
+Фасеты по месту происхождения.
+
+Счётчики постов хранятся в Place.post_count и пересчитываются из сигналов
+только для затронутых мест: одним UPDATE с подзапросом COUNT по индексу
+origin.place_id. Боковой панели остаётся один небольшой запрос по индексу
+(-post_count, name) без GROUP BY.
+"""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Origin, Place
+
+SIDEBAR_LIMIT = 30
+
+
+def refresh_counts(place_ids):
+    """
+    Пересчитывает post_count у указанных мест.
+
+    Считаются только активные и не удалённые посты — те, что видны в общем списке.
+    """
+    place_ids = {place_id for place_id in place_ids if place_id}
+    if not place_ids:
+        return
+    posts = (
+        Origin.objects.filter(place=OuterRef('pk'), post__is_deleted=False, post__is_active=True)
+        .values('place')
+        .annotate(total=Count('post', distinct=True))
+        .values('total')
+    )
+    Place.objects.filter(pk__in=place_ids).update(post_count=Coalesce(Subquery(posts), 0))
+
+
+def places_of_posts(post_ids):
+    return set(Origin.objects.filter(post_id__in=post_ids).values_list('place_id', flat=True))
+
+
+def refresh_posts(post_ids):
+    """
+    Пересчитывает места постов, у которых изменилась видимость.
+    """
+    refresh_counts(places_of_posts(post_ids))
+
+
+def sidebar(limit=SIDEBAR_LIMIT):
+    """
+    Возвращает самые наполненные места для боковой панели.
+    """
+    return Place.objects.filter(post_count__gt=0).order_by('-post_count', 'name')[:limit]
@@ -0,0 +1,199 @@
+"""
+Ленты активных постов в форматах RSS 2.0, Atom 1.0 и JSON Feed 1.1.
+
+Лента строится из values() без загрузки моделей и отдаётся потоково.
+Готовое тело кэшируется; ключ включает номер версии, который сигналы
+увеличивают при изменении постов и смене имени автора, поэтому
+инвалидация — один incr.
+ETag зависит только от версии, и условный GET отвечает 304 без запросов к БД.
+"""
+import hashlib
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import Http404, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.decorators.http import require_safe
+
+from .models import Post
+
+VERSION_KEY = 'feeds:version'
+FEED_TIMEOUT = 60 * 60
+FEED_LIMIT = 50
+FEED_TITLE = 'Посты Marvel'
+FEED_DESCRIPTION = 'Новые посты о персонажах Marvel'
+
+XML_FEEDS = {
+    'rss': (feedgenerator.Rss201rev2Feed, 'item'),
+    'atom': (feedgenerator.Atom1Feed, 'entry'),
+}
+CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(VERSION_KEY, version, None)
+    return version
+
+
+def feed_rows(username=None):
+    """
+    Возвращает итератор по последним активным постам (только нужные колонки).
+    """
+    posts = Post.objects.filter(is_active=True)
+    if username:
+        posts = posts.filter(author__username=username)
+    return posts.order_by('-created_at').values(
+        'pk', 'title', 'content', 'created_at', 'author__username',
+    )[:FEED_LIMIT].iterator()
+
+
+def _xml_chunks(feed_class, item_tag, feed_kwargs, items):
+    buffer = StringIO()
+    handler = SimplerXMLGenerator(buffer, 'utf-8', short_empty_elements=True)
+    feed = feed_class(**feed_kwargs)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    handler.startDocument()
+    if item_tag == 'item':
+        handler.startElement('rss', feed.rss_attributes())
+        handler.startElement('channel', feed.root_attributes())
+    else:
+        handler.startElement('feed', feed.root_attributes())
+    feed.add_root_elements(handler)
+    yield flush()
+    for item in items:
+        feed.add_item(**item)
+        # Элемент нормализуется add_item() и сразу выбрасывается, чтобы не копить ленту в памяти
+        normalized = feed.items.pop()
+        handler.startElement(item_tag, feed.item_attributes(normalized))
+        feed.add_item_elements(handler, normalized)
+        handler.endElement(item_tag)
+        yield flush()
+    if item_tag == 'item':
+        feed.endChannelElement(handler)
+        handler.endElement('rss')
+    else:
+        handler.endElement('feed')
+    yield flush()
+
+
+def _json_chunks(feed_kwargs, items):
+    head = {
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': feed_kwargs['title'],
+        'home_page_url': feed_kwargs['link'],
+        'feed_url': feed_kwargs['feed_url'],
+        'description': feed_kwargs['description'],
+        'language': feed_kwargs['language'],
+    }
+    yield json.dumps(head, ensure_ascii=False)[:-1] + ', "items": ['
+    separator = ''
+    for item in items:
+        entry = {
+            'id': item['unique_id'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': item['description'],
+            'date_published': item['pubdate'].isoformat(),
+            'authors': [{'name': item['author_name']}] if item['author_name'] else [],
+        }
+        yield separator + json.dumps(entry, ensure_ascii=False)
+        separator = ', '
+    yield ']}'
+
+
+@require_safe
+def feed_view(request, feed_format, username=None):
+    """
+    Отдаёт ленту активных постов (всех или одного автора).
+
+    Аргументы:
+        request: HTTP-запрос.
+        feed_format: 'rss', 'atom' или 'json'.
+        username: Имя автора для персональной ленты.
+
+    Возвращает:
+        HttpResponse: Лента, 304 при совпадении ETag.
+    """
+    if feed_format not in CONTENT_TYPES:
+        raise Http404('Неизвестный формат ленты.')
+    version = get_version()
+    base = request.build_absolute_uri('/')
+    cache_key = 'feeds:{}:{}'.format(
+        version, hashlib.md5(f'{feed_format}|{username or ""}|{base}'.encode(), usedforsecurity=False).hexdigest(),
+    )
+    etag = f'"{cache_key.split(":", 1)[1]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=300'}
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        return HttpResponseNotModified(headers=headers)
+
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return StreamingHttpResponse([cached], content_type=CONTENT_TYPES[feed_format], headers=headers)
+    # Проверяется только при промахе: закэшированная лента уже принадлежит существующему автору
+    if username and not User.objects.filter(username=username).exists():
+        raise Http404('Автор не найден.')
+
+    # Без строки запроса: лента от неё не зависит, а ключ кэша её не учитывает
+    feed_url = request.build_absolute_uri(request.path)
+    feed_kwargs = {
+        'title': f'{FEED_TITLE}: {username}' if username else FEED_TITLE,
+        'link': request.build_absolute_uri(reverse('posts:post_list')),
+        'description': FEED_DESCRIPTION,
+        'feed_url': feed_url,
+        'language': 'ru',
+    }
+
+    def items():
+        for row in feed_rows(username):
+            link = request.build_absolute_uri(reverse('posts:post_detail', args=[row['pk']]))
+            yield {
+                'title': row['title'],
+                'link': link,
+                'description': row['content'],
+                'author_name': row['author__username'],
+                'pubdate': row['created_at'],
+                'unique_id': link,
+            }
+
+    if feed_format == 'json':
+        chunks = _json_chunks(feed_kwargs, items())
+    else:
+        feed_class, item_tag = XML_FEEDS[feed_format]
+        chunks = _xml_chunks(feed_class, item_tag, feed_kwargs, items())
+
+    def stream():
+        body = []
+        for chunk in chunks:
+            encoded = chunk.encode('utf-8')
+            body.append(encoded)
+            yield encoded
+        # В кэш попадает только полностью отданная лента
+        cache.set(cache_key, b''.join(body), FEED_TIMEOUT)
+
+    return StreamingHttpResponse(stream(), content_type=CONTENT_TYPES[feed_format], headers=headers)
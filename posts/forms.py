@@ -1,6 +1,8 @@
 from django import forms
-from django.forms import inlineformset_factory
-from .models import Post, Origin
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from .models import Post, Origin, Place
 from django import forms
 from .models import Post, Review
 
@@ -17,16 +19,119 @@ class ReviewForm(forms.ModelForm):
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
-        fields = ['title', 'content', 'image', 'is_active']
+        fields = ['title', 'content', 'image', 'is_active', 'version']
+        widgets = {
+            # Версия, которую видел автор правки: при расхождении сохранение отклоняется (posts.tracking)
+            'version': forms.HiddenInput(),
+        }
         labels = {
             'title': 'Заголовок',
             'content': 'Содержание',
             'image': 'Изображение',
         }
+        help_texts = {
+            'content': 'Поддерживаются **жирный**, *курсив*, `код`, [ссылки](https://...), '
+                       'заголовки #, списки - и 1., цитаты > и блоки кода ```.',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['version'].required = False
+
+    def clean_version(self):
+        # Без версии в запросе (старая форма, API-клиент) проверяется версия, загруженная с объектом
+        version = self.cleaned_data.get('version')
+        return self.instance.version if version is None else version
+
+class BaseOriginFormSet(BaseInlineFormSet):
+    """
+    Формсет происхождений, который сохраняет изменения пакетно.
+    """
+    def add_fields(self, form, index):
+        """
+        Проверяет скрытое поле id по уже загруженным строкам формсета, а не
+        отдельным SELECT на каждую форму, как делает ModelChoiceField.
+        """
+        super().add_fields(form, index)
+        pk_name = self.model._meta.pk.name
+        field = form.fields.get(pk_name)
+        if not isinstance(field, forms.ModelChoiceField):
+            return
+
+        def to_python(value):
+            if value in field.empty_values:
+                return None
+            try:
+                obj = self._existing_object(self.model._meta.pk.to_python(value))
+            except ValidationError:
+                obj = None
+            if obj is None:
+                raise ValidationError(field.error_messages['invalid_choice'], code='invalid_choice')
+            return obj
+
+        field.to_python = to_python
+
+    def save_bulk(self):
+        """
+        Сравнивает отправленные строки с существующими и применяет разницу
+        одним bulk_create, одним DELETE и bulk_update на каждый набор изменённых
+        полей в транзакции, поэтому число запросов не зависит от количества
+        происхождений. Строка записывает только свои изменённые поля и не
+        затирает остальные значениями из формы.
+
+        Возвращает:
+            tuple: Количество созданных, обновлённых и удалённых записей.
+        """
+        from .signals import origins_bulk_changed
+        to_create, to_update, to_delete = [], [], []
+        # Набор изменённых полей -> строки с ровно этими изменениями
+        updates = {}
+        place_ids = set()
+        for form in self.forms:
+            pk = form.instance.pk
+            if self.can_delete and self._should_delete_form(form):
+                if pk:
+                    to_delete.append(pk)
+                    place_ids.add(form.instance.place_id)
+                continue
+            if not form.has_changed():
+                continue
+            obj = form.save(commit=False)
+            if pk:
+                fields = {name for name in form.changed_data if name in self.form._meta.fields}
+                if 'origin' in fields:
+                    fields.add('place')
+                updates.setdefault(frozenset(fields), []).append(obj)
+                to_update.append(obj)
+            else:
+                setattr(obj, self.fk.name, self.instance)
+                to_create.append(obj)
+
+        # Места всех новых и изменённых строк одним запросом, а не get_or_create на строку
+        places = Place.resolve(obj.origin for obj in to_create + to_update)
+        for obj in to_create + to_update:
+            place_ids.add(getattr(obj, '_loaded_place_id', None))
+            obj.assign_place(places)
+            place_ids.add(obj.place_id)
+
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            if to_delete:
+                # Без коллектора: у Origin нет зависимых строк, сигналы заменяет origins_bulk_changed
+                self.model._default_manager.filter(**{self.fk.name: self.instance}, pk__in=to_delete)._raw_delete(using)
+            for fields, objs in updates.items():
+                self.model._default_manager.bulk_update(objs, sorted(fields))
+            if to_create:
+                self.model._default_manager.bulk_create(to_create)
+        if to_create or to_update or to_delete:
+            origins_bulk_changed.send(sender=self.model, post_ids=[self.instance.pk], place_ids=place_ids)
+        return len(to_create), len(to_update), len(to_delete)
+
 
 PostOriginFormSet = inlineformset_factory(
     Post,
     Origin,
+    formset=BaseOriginFormSet,
     fields=('parent_name', 'origin', 'description'),
     extra=1,
     can_delete=True,
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from config import edgecache
+from posts.models import Post, make_excerpt
+
+
+class Command(BaseCommand):
+    help = 'Computes Post.excerpt for existing posts in keyset-ordered batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts processed per batch')
+        parser.add_argument('--all', action='store_true', help='Recompute excerpts that are already filled')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.all_objects.uncached()
+        if not options['all']:
+            posts = posts.filter(excerpt='')
+        updated = 0
+        last_pk = 0
+        while True:
+            rows = list(posts.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'content')[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            Post.all_objects.bulk_update(
+                [Post(pk=pk, excerpt=make_excerpt(content)) for pk, content in rows], ['excerpt'],
+            )
+            edgecache.purge([f'post-{pk}' for pk, _content in rows])
+            updated += len(rows)
+        self.stdout.write(self.style.SUCCESS(f"Excerpts updated for {updated} posts."))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import related
+
+
+class Command(BaseCommand):
+    help = 'Computes TF-IDF related posts and stores the top neighbours of every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=related.TOP_K, help='Neighbours stored per post')
+        parser.add_argument('--max-terms', type=int, default=related.MAX_TERMS,
+                            help='Highest-weighted terms kept per post')
+        parser.add_argument('--max-df', type=float, default=related.MAX_DF,
+                            help='Ignore terms found in more than this share of posts')
+        parser.add_argument('--block-cells', type=int, default=related.BLOCK_CELLS,
+                            help='Size limit of one dense similarity block (rows x posts)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        matrix = related.TfidfMatrix(related.iter_documents(), options['max_terms'], options['max_df'])
+        self.stdout.write(f"Vectorized {len(matrix)} posts ({len(matrix.data)} weights) "
+                          f"in {time.perf_counter() - started:.1f}s")
+
+        step = max(1, len(matrix) // 10)
+        next_report = [step]
+
+        def progress(done):
+            if done >= next_report[0] or done == len(matrix):
+                self.stdout.write(f"  {done}/{len(matrix)} posts compared")
+                next_report[0] = done + step
+
+        neighbours, scores = matrix.top_neighbours(options['top_k'], options['block_cells'], progress)
+        stored = related.store_neighbours(matrix.post_ids, neighbours, scores)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stored} related links in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.sitemaps import SITEMAP_MAX_URLS, PostSitemap, ReviewSitemap, build_sitemaps
+
+
+class Command(BaseCommand):
+    help = 'Pre-renders sharded sitemap files and the sitemap index into SITEMAP_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-urls', type=int, default=SITEMAP_MAX_URLS, help='URLs per sitemap file')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows fetched per keyset query')
+        parser.add_argument('--base-url', default=None, help='Site URL, defaults to settings.SITE_URL')
+
+    def handle(self, *args, **options):
+        written = build_sitemaps(
+            # Профили пользователей доступны только после входа, поэтому в sitemap их нет
+            [PostSitemap(), ReviewSitemap()],
+            base_url=options['base_url'],
+            max_urls=options['max_urls'],
+            chunk_size=options['chunk_size'],
+        )
+        for filename, count in written:
+            self.stdout.write(f"{filename}: {count} URLs")
+        self.stdout.write(self.style.SUCCESS(f"Sitemap index written with {len(written)} files."))
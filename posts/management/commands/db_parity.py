@@ -0,0 +1,177 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+
+PROFILES = ('sqlite', 'postgresql', 'mssql')
+RESULT_MARKER = 'DB_PARITY '
+
+
+class Command(BaseCommand):
+    help = ('Runs the same view workloads on every available database profile and compares '
+            'query counts, latency and query plans')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default=','.join(PROFILES), help='Comma-separated DB profiles to try')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per workload')
+        parser.add_argument('--posts', type=int, default=200, help='Synthetic posts to create')
+        parser.add_argument('--plans', action='store_true', help='Print query plans')
+        parser.add_argument('--worker', action='store_true', help='Internal: run workloads for the current profile')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(RESULT_MARKER + json.dumps(self.run_worker(options)))
+            return
+
+        results = {}
+        for profile in options['profiles'].split(','):
+            env = dict(os.environ, DB_PROFILE=profile, CACHE_PROFILE='locmem', WARMUP_ON_STARTUP='')
+            proc = subprocess.run(
+                [sys.executable, 'manage.py', 'db_parity', '--worker',
+                 '--repeat', str(options['repeat']), '--posts', str(options['posts'])],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            payload = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+            if proc.returncode != 0 or not payload:
+                last_line = (proc.stderr.strip().splitlines() or ['no output'])[-1]
+                self.stdout.write(self.style.WARNING(f"{profile}: unavailable ({last_line})"))
+                continue
+            results[profile] = json.loads(payload[-1][len(RESULT_MARKER):])
+
+        if not results:
+            self.stdout.write(self.style.ERROR("No database profile could be benchmarked."))
+            return
+        self.report(results, options['plans'])
+
+    def report(self, results, show_plans):
+        profiles = list(results)
+        workloads = list(next(iter(results.values())))
+        header = f"{'workload':22}" + ''.join(f" {p + ' q':>13} {p + ' p50':>13} {p + ' p95':>13}" for p in profiles)
+        self.stdout.write(header)
+        mismatches = []
+        for name in workloads:
+            line = f"{name:22}"
+            counts = set()
+            for profile in profiles:
+                data = results[profile][name]
+                counts.add(data['queries'])
+                line += f" {data['queries']:13d} {data['p50_ms']:13.2f} {data['p95_ms']:13.2f}"
+            self.stdout.write(line)
+            if len(counts) > 1:
+                mismatches.append(name)
+        for name in mismatches:
+            self.stdout.write(self.style.WARNING(f"Query count differs between backends for {name}"))
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Query counts match on all benchmarked backends."))
+        if show_plans:
+            for profile in profiles:
+                for name in workloads:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"[{profile}] {name}"))
+                    for sql, plan in results[profile][name]['plans']:
+                        self.stdout.write(f"  {sql[:160]}")
+                        for row in plan:
+                            self.stdout.write(f"      {row}")
+
+    def run_worker(self, options):
+        """
+        Создаёт тестовую базу текущего профиля, заполняет её и прогоняет нагрузки.
+        """
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # Кэш запросов скрыл бы различия между СУБД
+            with override_settings(QUERY_CACHE={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                                   VIEW_ANALYTICS={'ENABLED': False}):
+                workloads = self.build_workloads(options['posts'])
+                return {name: self.measure(client, url, options['repeat']) for name, (client, url) in workloads.items()}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def build_workloads(self, count):
+        from django.contrib.auth.models import User
+        from posts.models import Origin, Post, Review
+
+        author = User.objects.create_user(username='parity-author', password='parity')
+        reader = User.objects.create_user(username='parity-reader', password='parity')
+        places = ['Асгард', 'Земля', 'Квинс, Нью-Йорк', 'Ваканда', 'Титан']
+        Post.objects.bulk_create([
+            Post(title=f'Персонаж {i}', content=f'Описание персонажа {i}. ' * 20,
+                 excerpt=f'Описание персонажа {i}.', author=author)
+            for i in range(count)
+        ])
+        posts = list(Post.objects.order_by('pk'))
+        Origin.objects.bulk_create([
+            Origin(post=post, parent_name=f'Родитель {post.pk}', origin=places[post.pk % len(places)])
+            for post in posts
+        ])
+        Review.objects.bulk_create([
+            Review(post=post, author=reader, text='Отзыв', rating=post.pk % 5 + 1, slug=f'parity-{post.pk}')
+            for post in posts
+        ])
+        anonymous = Client()
+        authenticated = Client()
+        authenticated.force_login(reader)
+        middle = posts[len(posts) // 2]
+        return {
+            'post_list': (anonymous, '/'),
+            'post_list_page_3': (anonymous, '/?page=3'),
+            'search': (anonymous, '/search/?q=Асгард'),
+            'post_detail_anon': (anonymous, f'/post/{middle.pk}/'),
+            'post_detail_auth': (authenticated, f'/post/{middle.pk}/'),
+            'review_detail': (anonymous, f'/review/parity-{middle.pk}/'),
+            'user_list': (authenticated, '/users/users/'),
+        }
+
+    def measure(self, client, url, repeat):
+        durations = []
+        queries = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                durations.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            queries = captured.captured_queries
+        durations.sort()
+        return {
+            'queries': len(queries),
+            'p50_ms': statistics.median(durations),
+            'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            'plans': [(query['sql'], self.explain(query['sql'])) for query in queries if query['sql'].startswith('SELECT')],
+        }
+
+    def explain(self, sql):
+        """
+        Возвращает план запроса в формате текущей СУБД.
+
+        Запросы из CaptureQueriesContext уже содержат подставленные параметры.
+        """
+        vendor = connection.vendor
+        try:
+            with connection.cursor() as cursor:
+                if vendor == 'sqlite':
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    return [' '.join(str(col) for col in row[1:]) for row in cursor.fetchall()]
+                if vendor == 'postgresql':
+                    cursor.execute('EXPLAIN ' + sql)
+                    return [row[0] for row in cursor.fetchall()]
+                if vendor == 'microsoft':
+                    cursor.execute('SET SHOWPLAN_TEXT ON')
+                    try:
+                        cursor.execute(sql)
+                        cursor.nextset()
+                        return [row[0] for row in cursor.fetchall()]
+                    finally:
+                        cursor.execute('SET SHOWPLAN_TEXT OFF')
+        except Exception as exc:
+            return [f'plan unavailable: {exc}']
+        return []
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном интерпретаторе, чтобы измерять холодный старт,
+# а не уже прогретый процесс manage.py.
+PROBE = r"""
+import json, os, sys, time
+started = time.perf_counter()
+from django.apps import AppConfig
+ready_times = {}
+_create = AppConfig.create.__func__
+
+def create(cls, entry):
+    app_config = _create(cls, entry)
+    ready = app_config.ready
+
+    def timed_ready():
+        t = time.perf_counter()
+        ready()
+        ready_times[app_config.label] = time.perf_counter() - t
+    app_config.ready = timed_ready
+    return app_config
+
+AppConfig.create = classmethod(create)
+import django
+t = time.perf_counter()
+django.setup()
+setup_time = time.perf_counter() - t
+warmup = {}
+if os.environ.get('PROFILE_WARMUP') == '1':
+    from config.warmup import warm_up
+    warmup = warm_up()
+print('PROFILE_STARTUP ' + json.dumps({
+    'setup': setup_time,
+    'ready': ready_times,
+    'warmup': warmup,
+    'total': time.perf_counter() - started,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Reports cold-start cost: per-module import time, AppConfig.ready() time and warm-up steps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Number of slowest modules to show')
+        parser.add_argument('--no-warmup', action='store_true', help='Do not measure warm-up steps')
+        parser.add_argument('--group', action='store_true',
+                            help='Aggregate import time by top-level package')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        env['PROFILE_WARMUP'] = '0' if options['no_warmup'] else '1'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        report = None
+        for line in result.stdout.splitlines():
+            if line.startswith('PROFILE_STARTUP '):
+                report = json.loads(line[len('PROFILE_STARTUP '):])
+        if result.returncode != 0 or report is None:
+            raise CommandError('Startup probe failed:\n' + result.stderr[-2000:])
+
+        imports = self._parse_importtime(result.stderr, options['group'])
+        self.stdout.write(self.style.MIGRATE_HEADING("Slowest imports (cumulative, ms):"))
+        for module, micros in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f"  {micros / 1000:9.1f}  {module}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("AppConfig.ready() (ms):"))
+        for label, seconds in sorted(report['ready'].items(), key=lambda item: item[1], reverse=True):
+            self.stdout.write(f"  {seconds * 1000:9.1f}  {label}")
+
+        if report['warmup']:
+            self.stdout.write(self.style.MIGRATE_HEADING("Warm-up steps (ms):"))
+            for name, seconds in report['warmup'].items():
+                self.stdout.write(f"  {seconds * 1000:9.1f}  {name}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"django.setup(): {report['setup'] * 1000:.1f} ms, total boot: {report['total'] * 1000:.1f} ms"
+        ))
+
+    def _parse_importtime(self, stderr, group):
+        """
+        Разбирает вывод ``-X importtime``: ``import time: self | cumulative | module``.
+        """
+        imports = {}
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_time, cumulative, module = line[len('import time:'):].split('|')
+            name = module.strip()
+            if group:
+                # Для группировки берём собственное время, иначе вложенные импорты посчитаются дважды
+                top_level = name.split('.')[0]
+                imports[top_level] = imports.get(top_level, 0) + int(self_time)
+            else:
+                imports[name] = int(cumulative)
+        return imports
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import analytics
+
+
+class Command(BaseCommand):
+    help = 'Deletes post view aggregates older than the configured retention periods'
+
+    def handle(self, *args, **options):
+        hours, days = analytics.prune()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {hours} hourly and {days} daily rows."))
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import models, router, transaction
+from django.utils import timezone
+
+from posts import querycache
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Physically removes soft-deleted posts and their related rows in bounded chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Maximum number of rows removed by one DELETE statement')
+        parser.add_argument('--days', type=int, default=0,
+                            help='Only purge posts deleted at least this many days ago')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        using = router.db_for_write(Post)
+        tombstoned = Post.all_objects.tombstoned().uncached()
+        if options['days']:
+            tombstoned = tombstoned.filter(deleted_at__lte=timezone.now() - timedelta(days=options['days']))
+
+        # Дочерние таблицы находим по метаданным, чтобы не держать их список вручную
+        children = [
+            (rel.related_model, rel.field.name)
+            for rel in Post._meta.related_objects
+            if not rel.many_to_many and rel.on_delete is models.CASCADE
+        ]
+
+        purged = 0
+        last_pk = 0
+        while True:
+            post_ids = list(
+                tombstoned.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not post_ids:
+                break
+            last_pk = post_ids[-1]
+            for model, field_name in children:
+                self._purge_in_chunks(model._base_manager.filter(**{f'{field_name}__in': post_ids}), chunk_size, using)
+            with transaction.atomic(using=using):
+                Post.all_objects.filter(pk__in=post_ids)._raw_delete(using)
+            purged += len(post_ids)
+            self.stdout.write(f"Purged {purged} posts...")
+
+        # Дочерние строки удалялись через _base_manager, минуя CachedQuerySet
+        querycache.invalidate_models(Post, *(model for model, _field in children))
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} soft-deleted posts."))
+
+    def _purge_in_chunks(self, queryset, chunk_size, using):
+        """
+        Удаляет строки порциями по первичному ключу, не создавая объекты моделей.
+        """
+        model = queryset.model
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            with transaction.atomic(using=using):
+                model._base_manager.filter(pk__in=pks)._raw_delete(using)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import autocomplete
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the autocomplete prefix index from the database and makes every worker reload it'
+
+    def handle(self, *args, **options):
+        index = autocomplete.build_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"Autocomplete index rebuilt: {len(index.by_post)} posts, {len(index.entries)} keys."
+        ))
@@ -0,0 +1,72 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from config import edgecache
+from posts.markup import MARKUP_VERSION, render_batch
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Renders Post.content to content_html in a process pool for posts rendered by an older markup version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts read, rendered and written per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Renderer processes')
+        parser.add_argument('--all', action='store_true', help='Re-render posts that are already up to date')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        posts = Post.all_objects.uncached()
+        if not options['all']:
+            posts = posts.filter(content_html_version__lt=MARKUP_VERSION)
+
+        def batches():
+            last_pk = 0
+            while True:
+                rows = list(posts.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'content')[:options['batch_size']])
+                if not rows:
+                    return
+                last_pk = rows[-1][0]
+                yield rows
+
+        rendered = skipped = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            # Пока основной процесс пишет одну пачку, пул рендерит следующие; в памяти не больше 2 × workers пачек
+            pending = deque()
+            for rows in batches():
+                pending.append((rows, pool.submit(render_batch, rows)))
+                if len(pending) >= options['workers'] * 2:
+                    rendered, skipped = self.store(*pending.popleft(), rendered, skipped)
+            while pending:
+                rendered, skipped = self.store(*pending.popleft(), rendered, skipped)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} posts with markup version {MARKUP_VERSION} "
+            f"in {time.perf_counter() - started:.1f}s ({skipped} changed meanwhile and were skipped)."
+        ))
+
+    def store(self, rows, future, rendered, skipped):
+        """
+        Записывает HTML пачки, пропуская посты, содержимое которых изменилось после чтения.
+
+        Возвращает:
+            tuple: Обновлённые счётчики (записано, пропущено).
+        """
+        contents = dict(rows)
+        with transaction.atomic():
+            current = dict(
+                Post.all_objects.select_for_update().filter(pk__in=contents).values_list('pk', 'content')
+            )
+            # Изменённый пост уже отрендерен своим save() текущей версией разметки
+            fresh = [
+                Post(pk=pk, content_html=html, content_html_version=MARKUP_VERSION)
+                for pk, html in future.result() if current.get(pk) == contents[pk]
+            ]
+            Post.all_objects.bulk_update(fresh, ['content_html', 'content_html_version'])
+            # bulk_update не вызывает post_save, поэтому страницы на CDN очищаем сами
+            edgecache.purge([f'post-{post.pk}' for post in fresh])
+        return rendered + len(fresh), skipped + len(rows) - len(fresh)
@@ -0,0 +1,269 @@
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+
+from config.traffic import PSEUDONYM_PREFIX, capture_dir, capture_settings
+
+# Поля оптимистической блокировки: записанное значение к моменту воспроизведения
+# устарело, а без него форма берёт текущую версию объекта (PostForm.clean_version)
+STALE_FIELDS = ('version',)
+# Сколько объектов берётся для подстановки вместо псевдонимов
+PSEUDONYM_POOL_SIZE = 10000
+
+
+class NoRedirect(HTTPRedirectHandler):
+    # Перенаправление — это ответ воспроизводимого запроса, а не новый запрос
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def percentile(sorted_values, share):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+
+def read_records(paths):
+    """
+    Читает записи трафика из файлов и каталогов (включая ротированные части).
+
+    Возвращает:
+        list: Записи, упорядоченные по времени запроса.
+    """
+    files = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.extend(sorted(path.glob('traffic-*.ndjson*')))
+        elif path.exists():
+            files.append(path)
+        else:
+            raise CommandError(f'{path} does not exist')
+    records = []
+    for file in files:
+        with open(file, encoding='utf-8') as stream:
+            for line in stream:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    records.sort(key=lambda record: record['ts'])
+    return records
+
+
+def pseudonym_pools():
+    """
+    Загружает значения, которые подставляются вместо псевдонимов аргументов пути.
+
+    Возвращает:
+        dict: Имя аргумента -> список значений из TRAFFIC_CAPTURE['PSEUDONYMIZE'].
+    """
+    pools = {}
+    for name, label in capture_settings().get('PSEUDONYMIZE', {}).items():
+        app_label, model_name, field = label.split('.')
+        manager = apps.get_model(app_label, model_name)._default_manager
+        pools[name] = list(manager.order_by('pk').values_list(field, flat=True)[:PSEUDONYM_POOL_SIZE])
+    return pools
+
+
+def resolve_kwargs(kwargs, pools):
+    """
+    Заменяет псевдонимы в аргументах пути существующими значениями.
+
+    Один и тот же псевдоним всегда даёт одно и то же значение, поэтому
+    распределение запросов по объектам сохраняется. Если подставить
+    нечего, бросается LookupError с именем аргумента.
+
+    Возвращает:
+        dict: Аргументы для reverse().
+    """
+    resolved = {}
+    for key, value in kwargs.items():
+        if isinstance(value, str) and value.startswith(PSEUDONYM_PREFIX):
+            pool = pools.get(key)
+            if not pool:
+                raise LookupError(key)
+            value = pool[int(value[len(PSEUDONYM_PREFIX):], 16) % len(pool)]
+        resolved[key] = value
+    return resolved
+
+
+class Session:
+    """
+    Клиент одного уровня пользователя: общие для потоков cookie и CSRF-токен.
+    """
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def request(self, method, path, form=None):
+        """
+        Выполняет запрос и дочитывает тело ответа.
+
+        Возвращает:
+            int: Код ответа.
+        """
+        data = None
+        headers = {'Referer': self.base_url + path}
+        if method not in ('GET', 'HEAD'):
+            data = urlencode([tuple(pair) for pair in form or ()]).encode()
+            headers['X-CSRFToken'] = self.csrf_token()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            with self.opener.open(Request(self.base_url + path, data=data, headers=headers, method=method),
+                                  timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as exc:
+            exc.read()
+            return exc.code
+
+    def login(self, username, password):
+        path = reverse('users:login')
+        # GET выдаёт cookie csrftoken, без него POST формы входа отклоняется
+        self.request('GET', path)
+        status = self.request('POST', path, [
+            ('username', username), ('password', password), ('csrfmiddlewaretoken', self.csrf_token()),
+        ])
+        return status == 302 and any(cookie.name == 'sessionid' for cookie in self.cookies)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays traffic recorded by TrafficCaptureMiddleware against a running instance and reports '
+        'latency percentiles per URL name. Writes are replayed too: use a disposable copy of the data '
+        'and disable RATELIMIT_ENABLED on the target.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Traffic files or directories (default: TRAFFIC_CAPTURE DIR)')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='Instance to replay against')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most')
+        parser.add_argument('--speedup', type=float, default=1.0,
+                            help='Replay N times faster than recorded; 0 sends requests as fast as possible')
+        parser.add_argument('--limit', type=int, help='Replay only the first N records')
+        parser.add_argument('--login', action='append', default=[], metavar='TIER=USERNAME:PASSWORD',
+                            help="Credentials for the 'user' or 'staff' tier; requests of tiers without credentials are skipped")
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        records = read_records(options['paths'] or [capture_dir()])
+        if options['limit']:
+            records = records[:options['limit']]
+        if not records:
+            raise CommandError('No traffic records to replay.')
+        base_url = options['base_url'].rstrip('/')
+        sessions = self.sessions(base_url, options['login'], options['timeout'])
+        pools = pseudonym_pools()
+
+        self.results = defaultdict(list)
+        self.statuses = Counter()
+        self.lock = threading.Lock()
+        skipped = Counter()
+        slots = threading.BoundedSemaphore(max(options['concurrency'], 1))
+        speedup = options['speedup']
+        max_lag = 0.0
+        started = time.perf_counter()
+        first_ts = records[0]['ts']
+
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1), thread_name_prefix='replay') as pool:
+            for record in records:
+                session = sessions.get(record['tier'])
+                if session is None:
+                    skipped[f"no credentials for {record['tier']}"] += 1
+                    continue
+                try:
+                    path = reverse(record['view'], kwargs=resolve_kwargs(record['kwargs'], pools))
+                except LookupError as exc:
+                    skipped[f'no objects for pseudonymous {exc.args[0]}'] += 1
+                    continue
+                except NoReverseMatch:
+                    skipped['unknown URL name'] += 1
+                    continue
+                if record['query']:
+                    path += '?' + urlencode([tuple(pair) for pair in record['query']])
+                if speedup > 0:
+                    delay = started + (record['ts'] - first_ts) / speedup - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        max_lag = max(max_lag, -delay)
+                # Если все слоты заняты, отставание от расписания попадает в max_lag
+                form = [pair for pair in record.get('form') or () if pair[0] not in STALE_FIELDS]
+                slots.acquire()
+                pool.submit(self.replay, session, record, path, form, slots)
+        elapsed = time.perf_counter() - started
+
+        self.report(records, elapsed, skipped, max_lag if speedup > 0 else None)
+
+    def sessions(self, base_url, logins, timeout):
+        sessions = {'anonymous': Session(base_url, timeout)}
+        try:
+            sessions['anonymous'].request('GET', reverse('users:login'))
+        except URLError as exc:
+            raise CommandError(f'{base_url} is not reachable: {exc.reason}')
+        for login in logins:
+            tier, _, credentials = login.partition('=')
+            username, _, password = credentials.partition(':')
+            if tier not in ('user', 'staff') or not username:
+                raise CommandError(f"Invalid --login {login!r}: expected user=USERNAME:PASSWORD or staff=USERNAME:PASSWORD")
+            # Один вход на уровень: форма входа ограничена по частоте
+            session = Session(base_url, timeout)
+            if not session.login(username, password):
+                raise CommandError(f'Could not log in as {username} for the {tier} tier')
+            sessions[tier] = session
+        return sessions
+
+    def replay(self, session, record, path, form, slots):
+        started = time.perf_counter()
+        try:
+            status = session.request(record['method'], path, form)
+        except (URLError, OSError) as exc:
+            status = f'error: {getattr(exc, "reason", exc)}'
+        finally:
+            slots.release()
+        duration = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.results[record['view']].append((duration, status, record['ms']))
+            self.statuses[status] += 1
+
+    def report(self, records, elapsed, skipped, max_lag):
+        header = (f"{'view':28} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                  f"{'max ms':>9} {'rec p50':>9}")
+        self.stdout.write(header)
+        replayed = 0
+        for view in sorted(self.results, key=lambda name: -len(self.results[name])):
+            rows = self.results[view]
+            replayed += len(rows)
+            durations = sorted(row[0] for row in rows)
+            recorded = sorted(row[2] for row in rows)
+            errors = sum(1 for row in rows if not isinstance(row[1], int) or row[1] >= 400)
+            self.stdout.write(
+                f"{view:28} {len(rows):7d} {errors:7d} {percentile(durations, 0.5):9.1f} "
+                f"{percentile(durations, 0.95):9.1f} {percentile(durations, 0.99):9.1f} {durations[-1]:9.1f} "
+                f"{percentile(recorded, 0.5):9.1f}"
+            )
+        self.stdout.write('Statuses: ' + ', '.join(f'{status}: {count}' for status, count in self.statuses.most_common()))
+        for reason, count in skipped.items():
+            self.stdout.write(self.style.WARNING(f"Skipped {count} records: {reason}"))
+        if max_lag is not None and max_lag > 0.1:
+            self.stdout.write(self.style.WARNING(
+                f"Replay fell behind the recorded schedule by up to {max_lag:.1f}s; raise --concurrency or lower --speedup."
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replayed} of {len(records)} requests in {elapsed:.1f}s ({replayed / elapsed if elapsed else 0:.1f} req/s)."
+        ))
@@ -0,0 +1,22 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import analytics
+
+
+class Command(BaseCommand):
+    help = 'Rolls hourly post view buckets up into daily totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Number of most recent UTC days to recompute, including today')
+
+    def handle(self, *args, **options):
+        # Буфер этого процесса обычно пуст, но команда может запускаться и из shell веб-процесса
+        analytics.flush()
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        first_day = today - timedelta(days=max(options['days'], 1) - 1)
+        rows = analytics.rollup(first_day, today)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {rows} daily rows for {first_day}..{today}."))
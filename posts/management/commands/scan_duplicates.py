@@ -0,0 +1,78 @@
+import time
+from itertools import combinations, groupby
+
+from django.core.management.base import BaseCommand
+
+from posts import duplicates
+from posts.models import FingerprintBand, Post, PostFingerprint
+
+
+class Command(BaseCommand):
+    help = 'Fingerprints posts for near-duplicate detection and reports likely duplicate pairs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts fingerprinted per batch')
+        parser.add_argument('--reindex', action='store_true', help='Recompute fingerprints that already exist')
+        parser.add_argument('--max-bucket', type=int, default=duplicates.MAX_CANDIDATES,
+                            help='Skip LSH buckets shared by more posts than this')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = self.index(options['batch_size'], options['reindex'])
+        self.stdout.write(f"Fingerprinted {indexed} posts in {time.perf_counter() - started:.1f}s")
+
+        pairs, skipped = self.candidate_pairs(options['max_bucket'])
+        fingerprints = {
+            row.pk: duplicates.Fingerprint.from_model(row)
+            for row in PostFingerprint.objects.filter(post__is_deleted=False).iterator(chunk_size=2000)
+        }
+        found = []
+        for first, second in sorted(pairs):
+            if first in fingerprints and second in fingerprints:
+                reasons = fingerprints[first].compare(fingerprints[second])
+                if reasons:
+                    found.append((first, second, reasons))
+
+        titles = dict(Post.objects.filter(
+            pk__in={pk for pair in found for pk in pair[:2]},
+        ).values_list('pk', 'title'))
+        for first, second, reasons in found:
+            details = ', '.join(f'{name}={value}' for name, value in reasons.items())
+            self.stdout.write(f"  #{first} {titles.get(first, '')!r} ~ #{second} {titles.get(second, '')!r}: {details}")
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} buckets larger than {options['max_bucket']} posts."))
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {len(found)} likely duplicate pairs among {len(pairs)} candidates "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def index(self, batch_size, reindex):
+        posts = Post.objects.uncached()
+        if not reindex:
+            posts = posts.filter(fingerprint__isnull=True)
+        indexed = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk).order_by('pk').only('id', 'title', 'content', 'image')[:batch_size])
+            if not batch:
+                return indexed
+            last_pk = batch[-1].pk
+            indexed += duplicates.index_posts(batch)
+
+    def candidate_pairs(self, max_bucket):
+        """
+        Собирает пары постов с общим ключом полосы.
+
+        Возвращает:
+            tuple: Множество пар (меньший id, больший id) и число пропущенных больших корзин.
+        """
+        pairs = set()
+        skipped = 0
+        bands = FingerprintBand.objects.order_by('key', 'post_id').values_list('key', 'post_id').iterator(chunk_size=5000)
+        for _key, group in groupby(bands, key=lambda row: row[0]):
+            post_ids = [post_id for _key, post_id in group]
+            if len(post_ids) > max_bucket:
+                skipped += 1
+                continue
+            pairs.update(combinations(post_ids, 2))
+        return pairs, skipped
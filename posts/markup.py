@@ -0,0 +1,169 @@
+"""
+Разметка описаний постов: небольшое подмножество Markdown.
+
+Поддерживаются абзацы, переносы строк, заголовки (#, ##, ###), списки
+(- , * , 1. ), цитаты (> ), блоки кода (```), а внутри строк — **жирный**,
+*курсив*, `код` и ссылки [текст](адрес). Исходный текст сначала
+экранируется целиком, а разметка добавляет только теги из этого модуля,
+поэтому сырой HTML из описания в результат не попадает. Ссылки допускаются
+только на http(s), mailto и адреса сайта.
+
+HTML строится один раз при сохранении поста (Post.content_html). При
+изменении правил увеличьте MARKUP_VERSION и запустите render_post_content.
+"""
+import html
+import re
+
+from django.utils.html import escape, strip_tags
+
+MARKUP_VERSION = 2
+
+HEADING_RE = re.compile(r'^(#{1,3})\s+(.+?)\s*#*\s*$')
+UNORDERED_RE = re.compile(r'^[-*]\s+(.*)$')
+ORDERED_RE = re.compile(r'^\d{1,9}[.)]\s+(.*)$')
+QUOTE_RE = re.compile(r'^>\s?(.*)$')
+FENCE = '```'
+
+CODE_SPAN_RE = re.compile(r'`([^`\n]+)`')
+LINK_RE = re.compile(r'\[([^\[\]\n]+)\]\(([^()\s]+)\)')
+BOLD_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+ITALIC_RE = re.compile(r'(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])')
+# Браузеры читают «\» в начале пути как «/», поэтому «/\host» — такой же внешний адрес, как «//host»
+SAFE_URL_RE = re.compile(r'^(https?://|mailto:|/(?![/\\])|#)', re.IGNORECASE)
+PLACEHOLDER = '\x00{}\x00'
+PLACEHOLDER_RE = re.compile('\x00(\\d+)\x00')
+# Заголовки описания начинаются с уровня разделов страницы поста (h3)
+HEADING_OFFSET = 2
+
+
+def render_inline(text):
+    """
+    Экранирует строку и размечает код, ссылки, жирный текст и курсив.
+    """
+    protected = []
+
+    def protect(html):
+        protected.append(html)
+        return PLACEHOLDER.format(len(protected) - 1)
+
+    # Содержимое кода и адреса ссылок не должны разбираться как разметка
+    text = CODE_SPAN_RE.sub(lambda match: protect(f'<code>{escape(match[1])}</code>'), text)
+
+    def link(match):
+        label, url = match[1], match[2]
+        if not SAFE_URL_RE.match(url):
+            return match[0]
+        return protect(f'<a href="{escape(url)}" rel="nofollow noopener">') + label + protect('</a>')
+
+    text = LINK_RE.sub(link, text)
+    text = escape(text)
+    text = BOLD_RE.sub(r'<strong>\1</strong>', text)
+    text = ITALIC_RE.sub(r'<em>\2</em>', text)
+    return PLACEHOLDER_RE.sub(lambda match: protected[int(match[1])], text)
+
+
+def _lines_html(lines):
+    return '<br>'.join(render_inline(line.strip()) for line in lines)
+
+
+def render_markup(text):
+    """
+    Превращает описание поста в безопасный HTML.
+
+    Аргументы:
+        text: Описание в разметке.
+
+    Возвращает:
+        str: HTML без исходных тегов, пригодный для вывода через |safe.
+    """
+    return '\n'.join(_render_blocks(text))
+
+
+def plain_text(text, headings=True):
+    """
+    Возвращает описание без разметки: текст блоков (абзацев, заголовков,
+    списков, цитат, кода), по блоку в элементе списка.
+
+    Аргументы:
+        text: Описание в разметке.
+        headings: Включать ли заголовки.
+    """
+    blocks = []
+    for block in _render_blocks(text):
+        if not headings and block.startswith('<h'):
+            continue
+        # Переносы строк и пункты списков становятся пробелами, а не склеиваются
+        block = block.replace('<br>', ' ').replace('</li>', ' ')
+        block = ' '.join(html.unescape(strip_tags(block)).split())
+        if block:
+            blocks.append(block)
+    return blocks
+
+
+def _render_blocks(text):
+    # \x00 служит меткой внутри render_inline и в исходном тексте не нужен
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').replace('\x00', '').split('\n')
+    blocks = []
+    paragraph = []
+    index = 0
+
+    def close_paragraph():
+        if paragraph:
+            blocks.append(f'<p>{_lines_html(paragraph)}</p>')
+            paragraph.clear()
+
+    while index < len(lines):
+        line = lines[index]
+        stripped = line.strip()
+        if stripped.startswith(FENCE):
+            close_paragraph()
+            code = []
+            index += 1
+            while index < len(lines) and not lines[index].strip().startswith(FENCE):
+                code.append(lines[index])
+                index += 1
+            blocks.append(f'<pre><code>{escape(chr(10).join(code))}</code></pre>')
+            index += 1
+            continue
+        if not stripped:
+            close_paragraph()
+            index += 1
+            continue
+        heading = HEADING_RE.match(stripped)
+        if heading:
+            close_paragraph()
+            level = len(heading[1]) + HEADING_OFFSET
+            blocks.append(f'<h{level}>{render_inline(heading[2])}</h{level}>')
+            index += 1
+            continue
+        for pattern, tag in ((UNORDERED_RE, 'ul'), (ORDERED_RE, 'ol'), (QUOTE_RE, 'blockquote')):
+            if pattern.match(stripped):
+                close_paragraph()
+                items = []
+                while index < len(lines) and pattern.match(lines[index].strip()):
+                    items.append(pattern.match(lines[index].strip())[1])
+                    index += 1
+                if tag == 'blockquote':
+                    blocks.append(f'<blockquote><p>{_lines_html(items)}</p></blockquote>')
+                else:
+                    rendered = ''.join(f'<li>{render_inline(item.strip())}</li>' for item in items)
+                    blocks.append(f'<{tag}>{rendered}</{tag}>')
+                break
+        else:
+            paragraph.append(line)
+            index += 1
+    close_paragraph()
+    return blocks
+
+
+def render_batch(rows):
+    """
+    Рендерит пачку описаний; вызывается в процессах пула render_post_content.
+
+    Аргументы:
+        rows: Список пар (id поста, описание).
+
+    Возвращает:
+        list: Пары (id поста, HTML).
+    """
+    return [(pk, render_markup(content)) for pk, content in rows]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.14 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def normalize_place(name):
+    # Копия posts.models.normalize_place: миграция не должна зависеть от текущего кода модели
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def populate_places(apps, schema_editor):
+    Origin = apps.get_model('posts', 'Origin')
+    Place = apps.get_model('posts', 'Place')
+    db = schema_editor.connection.alias
+
+    # Самое частое написание становится названием места
+    spellings = (
+        Origin.objects.using(db).values('origin').annotate(total=Count('id')).order_by('-total', 'origin')
+    )
+    places = {}
+    for row in spellings:
+        key = normalize_place(row['origin'])
+        if not key:
+            continue
+        if key not in places:
+            places[key] = Place.objects.using(db).create(key=key, name=' '.join(row['origin'].split()))
+        Origin.objects.using(db).filter(origin=row['origin']).update(place=places[key])
+
+    counts = (
+        Origin.objects.using(db)
+        .filter(place__isnull=False, post__is_deleted=False, post__is_active=True)
+        .values('place').annotate(total=Count('post', distinct=True))
+    )
+    for row in counts:
+        Place.objects.using(db).filter(pk=row['place']).update(post_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='Ключ')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+            ],
+            options={
+                'verbose_name': 'Место',
+                'verbose_name_plural': 'Места',
+                'indexes': [models.Index(fields=['-post_count', 'name'], name='posts_place_facet_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='origin',
+            name='place',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='origins', to='posts.place', verbose_name='Место'),
+        ),
+        migrations.RunPython(populate_places, migrations.RunPython.noop),
+    ]
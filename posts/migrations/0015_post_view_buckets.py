@@ -0,0 +1,53 @@
+# Generated by Django 5.0.14 on 2026-10-19 18:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_relatedpost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostViewHour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Начало часа')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_hours', to='posts.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Просмотры за час',
+                'verbose_name_plural': 'Просмотры по часам',
+            },
+        ),
+        migrations.CreateModel(
+            name='PostViewDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_days', to='posts.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Просмотры за день',
+                'verbose_name_plural': 'Просмотры по дням',
+                'indexes': [models.Index(fields=['day'], name='posts_postviewday_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postviewday',
+            constraint=models.UniqueConstraint(fields=('post', 'day'), name='posts_postviewday_post_day_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='postviewhour',
+            index=models.Index(fields=['hour'], name='posts_postviewhour_hour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='postviewhour',
+            constraint=models.UniqueConstraint(fields=('post', 'hour'), name='posts_postviewhour_post_hour_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-19 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_content_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostFingerprint',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='posts.post', verbose_name='Пост')),
+                ('simhash', models.BigIntegerField(verbose_name='SimHash')),
+                ('minhash', models.BinaryField(blank=True, verbose_name='MinHash')),
+                ('image_hash', models.BigIntegerField(blank=True, null=True, verbose_name='Хэш изображения')),
+                ('image_name', models.CharField(blank=True, max_length=255, verbose_name='Файл изображения')),
+            ],
+            options={
+                'verbose_name': 'Отпечаток поста',
+                'verbose_name_plural': 'Отпечатки постов',
+            },
+        ),
+        migrations.CreateModel(
+            name='FingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(verbose_name='Ключ полосы')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint_bands', to='posts.post', verbose_name='Пост')),
+            ],
+            options={
+                'verbose_name': 'Полоса отпечатка',
+                'verbose_name_plural': 'Полосы отпечатков',
+                'indexes': [models.Index(fields=['key'], name='posts_fpband_key_idx')],
+            },
+        ),
+    ]
@@ -3,6 +3,11 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
 from django.utils.crypto import get_random_string
+from django.utils import timezone
+from django.utils.text import Truncator
+from .markup import MARKUP_VERSION, plain_text, render_markup
+from .querycache import CachedQuerySet
+from .tracking import DirtyFieldsMixin
 import datetime
 from django.utils.translation import gettext_lazy as _
 
@@ -20,14 +25,79 @@ def generate_unique_slug(model_instance, base_slug=None):
         counter += 1
     return slug
 
-class Post(models.Model):
+EXCERPT_LENGTH = 300
+
+def make_excerpt(content):
+    # Первый блок описания без разметки (заголовок — только если других блоков нет),
+    # обрезанный до EXCERPT_LENGTH символов
+    blocks = plain_text(content, headings=False) or plain_text(content)
+    return Truncator(blocks[0]).chars(EXCERPT_LENGTH) if blocks else ''
+
+
+class PostQuerySet(CachedQuerySet):
+    def alive(self):
+        return self.filter(is_deleted=False)
+
+    def tombstoned(self):
+        return self.filter(is_deleted=True)
+
+    def soft_delete(self):
+        # Одно UPDATE без загрузки объектов и без каскада по связанным таблицам
+        from .signals import post_soft_deleted
+        pks = list(self.filter(is_deleted=False).values_list('pk', flat=True))
+        updated = self.model.all_objects.filter(pk__in=pks).update(is_deleted=True, deleted_at=timezone.now())
+        post_soft_deleted.send(sender=self.model, pks=pks)
+        return updated
+
+class PostManager(models.Manager.from_queryset(PostQuerySet)):
+    """
+    Менеджер по умолчанию: скрывает посты, помеченные как удалённые.
+    """
+    def get_queryset(self):
+        return super().get_queryset().alive()
+
+class Post(DirtyFieldsMixin, models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     content = models.TextField(verbose_name="Содержание")
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False, verbose_name="Анонс")
+    # HTML содержимого строится при сохранении (posts.markup) и выводится без повторной обработки
+    content_html = models.TextField(blank=True, editable=False, verbose_name="Содержание (HTML)")
+    content_html_version = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="Версия разметки")
     image = models.ImageField(upload_to='posts/images/', blank=True, null=True, verbose_name="Изображение")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', verbose_name="Автор", null=True)
-    created_at = models.DateTimeField(auto_now_add=True, validators=[validate_creation_date], verbose_name="Дата создания")
+    created_at = models.DateTimeField(auto_now_add=True, validators=[validate_creation_date], db_index=True, verbose_name="Дата создания")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
+    is_deleted = models.BooleanField(default=False, db_index=True, verbose_name="Удалён")
+    deleted_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата удаления")
+    # Растёт при каждом save(); форма редактирования передаёт версию, которую видел автор правки
+    version = models.PositiveIntegerField(default=0, verbose_name="Версия")
+
+    objects = PostManager()
+    all_objects = PostQuerySet.as_manager()
+
+    version_field = 'version'
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        written = self.get_update_fields(update_fields)
+        # Анонс и HTML пересчитываются только когда сохраняется изменённое содержимое;
+        # без явных update_fields DirtyFieldsMixin сам увидит, что они изменились
+        if 'content' not in self.get_deferred_fields() and (written is None or 'content' in written):
+            self.excerpt = make_excerpt(self.content)
+            self.content_html = render_markup(self.content)
+            self.content_html_version = MARKUP_VERSION
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt', 'content_html', 'content_html_version'}
+        super().save(*args, **kwargs)
+
+    def soft_delete(self):
+        """
+        Помечает пост удалённым; физически он удаляется командой purge_deleted_posts.
+        """
+        Post.all_objects.filter(pk=self.pk).soft_delete()
+        self.is_deleted = True
+        self.deleted_at = timezone.now()
 
     def __str__(self):
         return self.title
@@ -35,8 +105,93 @@ class Post(models.Model):
     class Meta:
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # Лента профиля: посты автора по убыванию даты (users.timeline)
+        indexes = [models.Index(fields=['author', 'created_at'], name='posts_post_author_created')]
+
+class RelatedPost(models.Model):
+    """
+    Похожий пост, найденный командой build_related_posts.
+
+    Атрибуты:
+        post: Пост, для которого найден сосед.
+        related: Похожий пост.
+        rank: Место соседа по убыванию близости, начиная с 0.
+        score: Косинусная близость TF-IDF векторов.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links', verbose_name="Пост")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_from', verbose_name="Похожий пост")
+    rank = models.PositiveSmallIntegerField(verbose_name="Позиция")
+    score = models.FloatField(verbose_name="Близость")
+
+    objects = CachedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Похожий пост"
+        verbose_name_plural = "Похожие посты"
+        constraints = [models.UniqueConstraint(fields=['post', 'rank'], name='posts_relatedpost_post_rank_uniq')]
+
+class PostFingerprint(models.Model):
+    """
+    Отпечатки поста для поиска почти-дубликатов (posts.duplicates).
+
+    Атрибуты:
+        post: Пост.
+        simhash: 64-битный SimHash слов заголовка и содержимого.
+        minhash: MinHash-подпись шинглов текста (NUM_PERM чисел uint32) или пусто, если текста нет.
+        image_hash: 64-битный dHash изображения или None.
+        image_name: Имя файла, для которого посчитан image_hash.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint', verbose_name="Пост")
+    simhash = models.BigIntegerField(verbose_name="SimHash")
+    minhash = models.BinaryField(blank=True, verbose_name="MinHash")
+    image_hash = models.BigIntegerField(blank=True, null=True, verbose_name="Хэш изображения")
+    image_name = models.CharField(max_length=255, blank=True, verbose_name="Файл изображения")
+
+    class Meta:
+        verbose_name = "Отпечаток поста"
+        verbose_name_plural = "Отпечатки постов"
+
+class FingerprintBand(models.Model):
+    """
+    Полоса LSH-индекса: посты с общим ключом полосы — кандидаты в дубликаты.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='fingerprint_bands', verbose_name="Пост")
+    key = models.BigIntegerField(verbose_name="Ключ полосы")
+
+    class Meta:
+        verbose_name = "Полоса отпечатка"
+        verbose_name_plural = "Полосы отпечатков"
+        indexes = [models.Index(fields=['key'], name='posts_fpband_key_idx')]
+
+class PostViewHour(models.Model):
+    """
+    Просмотры поста за час; заполняется пакетами из буфера posts.analytics.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_hours', verbose_name="Пост")
+    hour = models.DateTimeField(verbose_name="Начало часа")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
 
-class Comment(models.Model):
+    class Meta:
+        verbose_name = "Просмотры за час"
+        verbose_name_plural = "Просмотры по часам"
+        constraints = [models.UniqueConstraint(fields=['post', 'hour'], name='posts_postviewhour_post_hour_uniq')]
+        indexes = [models.Index(fields=['hour'], name='posts_postviewhour_hour_idx')]
+
+class PostViewDay(models.Model):
+    """
+    Просмотры поста за сутки (UTC), свёрнутые из PostViewHour командой rollup_post_views.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='view_days', verbose_name="Пост")
+    day = models.DateField(verbose_name="День")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотры")
+
+    class Meta:
+        verbose_name = "Просмотры за день"
+        verbose_name_plural = "Просмотры по дням"
+        constraints = [models.UniqueConstraint(fields=['post', 'day'], name='posts_postviewday_post_day_uniq')]
+        indexes = [models.Index(fields=['day'], name='posts_postviewday_day_idx')]
+
+class Comment(DirtyFieldsMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name="Пост")
     text = models.TextField(verbose_name="Текст комментария")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
@@ -48,11 +203,91 @@ class Comment(models.Model):
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
-class Origin(models.Model):
+def normalize_place(name):
+    # Ключ места: без учёта регистра и «ё», с одиночными пробелами
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+class Place(models.Model):
+    """
+    Нормализованное место происхождения.
+
+    post_count хранит число активных неудалённых постов с этим местом и
+    пересчитывается при записи (posts.facets), а не при каждом показе.
+    """
+    name = models.CharField(max_length=200, verbose_name="Название")
+    key = models.CharField(max_length=200, unique=True, verbose_name="Ключ")
+    post_count = models.PositiveIntegerField(default=0, verbose_name="Количество постов")
+
+    objects = CachedQuerySet.as_manager()
+
+    @classmethod
+    def resolve(cls, names):
+        """
+        Находит или создаёт места для набора написаний.
+
+        Аргументы:
+            names: Строки из поля Origin.origin.
+
+        Возвращает:
+            dict: Ключ места -> Place.
+        """
+        spellings = {}
+        for name in names:
+            key = normalize_place(name)
+            if key:
+                spellings.setdefault(key, ' '.join(name.split()))
+        if not spellings:
+            return {}
+        places = {place.key: place for place in cls.objects.filter(key__in=spellings)}
+        for key, name in spellings.items():
+            if key not in places:
+                places[key], _created = cls.objects.get_or_create(key=key, defaults={'name': name})
+        return places
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = "Место"
+        verbose_name_plural = "Места"
+        indexes = [models.Index(fields=['-post_count', 'name'], name='posts_place_facet_idx')]
+
+class Origin(DirtyFieldsMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='origins', verbose_name="Персонаж (Пост)")
     parent_name = models.CharField(max_length=100, verbose_name="Имя родителя")
     origin = models.CharField(max_length=200, verbose_name="Место происхождения", help_text="Например, Асгард, Земля")
     description = models.TextField(blank=True, verbose_name="Описание")
+    place = models.ForeignKey(Place, on_delete=models.PROTECT, related_name='origins', null=True, blank=True,
+                              editable=False, verbose_name="Место")
+
+    objects = CachedQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Прежнее место нужно, чтобы пересчитать счётчик и у него
+        instance._loaded_place_id = instance.__dict__.get('place_id')
+        return instance
+
+    def assign_place(self, places=None):
+        """
+        Связывает происхождение с местом по тексту поля origin.
+
+        Аргументы:
+            places: Заранее полученный словарь из Place.resolve().
+        """
+        if places is None:
+            places = Place.resolve([self.origin])
+        self.place = places.get(normalize_place(self.origin))
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        written = self.get_update_fields(update_fields)
+        if 'origin' not in self.get_deferred_fields() and (written is None or 'origin' in written):
+            self.assign_place()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'place'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Происхождение для {self.post.title}: {self.parent_name}"
@@ -61,14 +296,16 @@ class Origin(models.Model):
         verbose_name = "Происхождение"
         verbose_name_plural = "Происхождения"
 
-class Review(models.Model):
+class Review(DirtyFieldsMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reviews', verbose_name="Пост")
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Автор отзыва")
     text = models.TextField(verbose_name="Текст отзыва")
     rating = models.PositiveSmallIntegerField(verbose_name="Оценка", choices=[(i, i) for i in range(1, 6)])
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Дата создания")
     slug = models.SlugField(max_length=50, unique=True, blank=True, null=True)
 
+    objects = CachedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = generate_unique_slug(self)
@@ -79,4 +316,5 @@ class Review(models.Model):
 
     class Meta:
         verbose_name = "Отзыв"
-        verbose_name_plural = "Отзывы"
\ No newline at end of file
+        verbose_name_plural = "Отзывы"
+        indexes = [models.Index(fields=['author', 'created_at'], name='posts_review_author_created')]
\ No newline at end of file
@@ -0,0 +1,321 @@
+"""
+Кэш результатов запросов для Post, Origin и Review.
+
+CachedQuerySet перед выполнением компилирует SQL и ищет результат в кэше по
+ключу из SQL, параметров и версий всех таблиц запроса. Любая запись в таблицу
+(save/delete через сигналы, update()/delete()/bulk_* у CachedQuerySet)
+увеличивает версию таблицы, и старые ключи просто перестают использоваться.
+Кэшируются только запросы, все таблицы которых зарегистрированы через
+register(): запись в остальные таблицы (отпечатки, статистика просмотров,
+комментарии) версию не меняет. Пакетные обходы используют uncached().
+
+Внутри транзакции запросы к таблицам, в которые эта транзакция уже писала,
+идут мимо кэша, а после commit версия увеличивается ещё раз, чтобы
+отбросить результаты, закэшированные другими процессами до фиксации.
+От «лавины» при промахе защищает короткая блокировка в кэше.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.db import connections, models, router, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.lookups import Lookup
+from django.db.models.sql import Query
+from django.db.models.sql.where import ExtraWhere, WhereNode
+from django.http import JsonResponse
+
+from config.metrics import QUERY_CACHE_LOOKUPS
+
+VERSION_PREFIX = 'qc:v:'
+RESULT_PREFIX = 'qc:r:'
+LOCK_TIMEOUT = 10
+WAIT_STEP = 0.01
+
+stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'waited': 0}
+_written = threading.local()
+# Таблицы, каждая запись в которые меняет версию
+_instrumented = set()
+
+
+def get_config():
+    config = {'ENABLED': True, 'CACHE': 'default', 'TIMEOUT': 300, 'LOCK_WAIT': 0.5}
+    config.update(getattr(settings, 'QUERY_CACHE', {}))
+    return config
+
+
+def get_cache():
+    return caches[get_config()['CACHE']]
+
+
+def _written_tables(using):
+    tables = getattr(_written, 'tables', None)
+    if tables is None:
+        tables = _written.tables = {}
+    return tables.setdefault(using, set())
+
+
+def table_versions(tables):
+    cache = get_cache()
+    keys = {VERSION_PREFIX + table: table for table in tables}
+    versions = cache.get_many(list(keys))
+    for key in keys:
+        if key not in versions:
+            # Начальная версия из времени: после вытеснения ключа старые результаты не оживут
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in sorted(keys)]
+
+
+def bump(tables):
+    cache = get_cache()
+    for table in tables:
+        try:
+            cache.incr(VERSION_PREFIX + table)
+        except ValueError:
+            cache.add(VERSION_PREFIX + table, time.time_ns(), None)
+
+
+def mark_written(tables, using='default'):
+    """
+    Инвалидирует результаты для таблиц; вызывается при любой записи.
+    """
+    if not get_config()['ENABLED']:
+        return
+    tables = set(tables)
+    bump(tables)
+    connection = connections[using]
+    if connection.in_atomic_block:
+        _written_tables(using).update(tables)
+        transaction.on_commit(lambda: bump(tables), using=using)
+
+
+def is_volatile(table, fields):
+    """
+    Проверяет, что запись затрагивает только поля из QUERY_CACHE['VOLATILE_FIELDS']
+    (например, счётчик просмотров): такие записи версию таблицы не меняют,
+    и закэшированные значения этих полей могут отставать на TIMEOUT.
+    """
+    volatile = get_config().get('VOLATILE_FIELDS', {}).get(table, ())
+    return bool(fields) and bool(volatile) and set(fields) <= set(volatile)
+
+
+def invalidate_models(*model_classes):
+    mark_written({model._meta.db_table for model in model_classes})
+
+
+def register(*model_classes):
+    """
+    Подключает сигналы записи моделей к версиям таблиц и разрешает кэшировать
+    запросы к этим таблицам. Массовые записи в обход сигналов должны идти через
+    CachedQuerySet или mark_written().
+    """
+    from django.db.models.signals import post_delete, post_save
+    for model in model_classes:
+        label = model._meta.label
+        post_save.connect(model_written, sender=model, dispatch_uid=f'querycache_save_{label}')
+        post_delete.connect(model_written, sender=model, dispatch_uid=f'querycache_delete_{label}')
+        _instrumented.add(model._meta.db_table)
+
+
+class _UnknownTables(Exception):
+    pass
+
+
+def _collect_tables(node, tables):
+    if isinstance(node, Query):
+        tables.update(join.table_name for join in node.alias_map.values())
+        if node.extra or node.extra_tables:
+            # В extra() может быть произвольный SQL с любыми таблицами
+            raise _UnknownTables
+        children = [node.where, *node.annotations.values(), *node.combined_queries]
+        children.extend(item for item in node.order_by if hasattr(item, 'resolve_expression'))
+    elif isinstance(node, (RawSQL, ExtraWhere)):
+        raise _UnknownTables
+    elif isinstance(node, WhereNode):
+        children = node.children
+    elif isinstance(node, Lookup):
+        children = [node.lhs, node.rhs]
+    elif isinstance(node, models.QuerySet):
+        children = [node.query]
+    elif hasattr(node, 'get_source_expressions'):
+        # Subquery и Exists хранят запрос в .query, остальные выражения — в исходных выражениях
+        children = [getattr(node, 'query', None), *node.get_source_expressions()]
+    else:
+        return
+    for child in children:
+        if child is not None:
+            _collect_tables(child, tables)
+
+
+def query_tables(query):
+    """
+    Собирает таблицы запроса, включая подзапросы в WHERE, аннотациях,
+    сортировке и запросах union()/intersection()/difference().
+
+    Возвращает:
+        set: Имена таблиц или None, если запрос содержит произвольный SQL.
+    """
+    tables = set()
+    try:
+        _collect_tables(query, tables)
+    except _UnknownTables:
+        return None
+    return tables
+
+
+def _cached(queryset, suffix, compute):
+    """
+    Возвращает результат compute() из кэша или вычисляет и кэширует его.
+    """
+    config = get_config()
+    using = queryset.db
+    connection = connections[using]
+    if not connection.in_atomic_block:
+        _written_tables(using).clear()
+    try:
+        compiler = queryset.query.get_compiler(using=using)
+        sql, params = compiler.as_sql()
+    except Exception:
+        # EmptyResultSet и прочие запросы, которые нельзя выразить SQL-строкой
+        stats['bypassed'] += 1
+        QUERY_CACHE_LOOKUPS.inc(result='bypassed')
+        return compute()
+    tables = query_tables(compiler.query)
+    # Запись в незарегистрированную таблицу не меняет версий: такой результат мог бы устареть
+    if tables is None or not tables <= _instrumented or tables & _written_tables(using):
+        stats['bypassed'] += 1
+        QUERY_CACHE_LOOKUPS.inc(result='bypassed')
+        return compute()
+
+    cache = get_cache()
+    raw_key = '|'.join([
+        using, suffix, queryset._iterable_class.__name__,
+        sql, repr(params), repr(table_versions(tables)),
+    ])
+    key = RESULT_PREFIX + hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+    result = cache.get(key)
+    if result is not None:
+        stats['hits'] += 1
+        QUERY_CACHE_LOOKUPS.inc(result='hit')
+        return result[0]
+
+    stats['misses'] += 1
+    QUERY_CACHE_LOOKUPS.inc(result='miss')
+    lock_key = key + ':lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Результат уже считает другой запрос — ждём его недолго, потом считаем сами без записи
+        stats['waited'] += 1
+        deadline = time.monotonic() + config['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            result = cache.get(key)
+            if result is not None:
+                return result[0]
+        return compute()
+    try:
+        value = compute()
+        try:
+            # Кортеж, чтобы отличать закэшированный пустой результат от промаха
+            cache.set(key, (value,), config['TIMEOUT'])
+        except Exception:
+            # Например, namedtuple из values_list(named=True) не сериализуется
+            pass
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+class CachedQuerySet(models.QuerySet):
+    """
+    QuerySet с прозрачным кэшированием результатов и инвалидацией записей.
+    """
+    _cache_disabled = False
+
+    def uncached(self):
+        """
+        Возвращает копию, которая читает мимо кэша: для пакетных обходов
+        (sitemap, заполнение полей, поиск дубликатов), чьи результаты больше
+        никто не запросит, а в кэше они вытеснили бы полезные.
+        """
+        clone = self._chain()
+        clone._cache_disabled = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_disabled = self._cache_disabled
+        return clone
+
+    def _cache_allowed(self):
+        return (
+            get_config()['ENABLED']
+            and not self._cache_disabled
+            and not self._for_write
+            and not self.query.select_for_update
+        )
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_allowed():
+            self._result_cache = _cached(self, 'rows', lambda: list(self._iterable_class(self)))
+        super()._fetch_all()
+
+    def count(self):
+        if self._result_cache is None and self._cache_allowed():
+            return _cached(self, 'count', super().count)
+        return super().count()
+
+    def _tables(self):
+        return {self.model._meta.db_table}
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if not is_volatile(self.model._meta.db_table, kwargs):
+            mark_written(self._tables(), router.db_for_write(self.model))
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        result = super().delete()
+        mark_written(self._tables(), router.db_for_write(self.model))
+        return result
+
+    delete.alters_data = True
+
+    def _raw_delete(self, using):
+        rows = super()._raw_delete(using)
+        mark_written(self._tables(), using)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        result = super().bulk_create(objs, *args, **kwargs)
+        mark_written(self._tables(), router.db_for_write(self.model))
+        return result
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        mark_written(self._tables(), router.db_for_write(self.model))
+        return rows
+
+
+def model_written(sender, using='default', update_fields=None, **kwargs):
+    """
+    Обработчик post_save/post_delete для кэшируемых моделей и таблиц, которые они присоединяют.
+    """
+    table = sender._meta.db_table
+    if is_volatile(table, update_fields):
+        return
+    mark_written({table}, using)
+
+
+@staff_member_required
+def querycache_stats(request):
+    """
+    Возвращает счётчики попаданий и промахов кэша запросов в этом процессе.
+    """
+    lookups = stats['hits'] + stats['misses']
+    return JsonResponse({**stats, 'hit_ratio': stats['hits'] / lookups if lookups else None})
@@ -0,0 +1,218 @@
+"""
+Похожие посты по TF-IDF.
+
+Векторы строятся по заголовку, содержимому и происхождениям поста и
+хранятся как разреженная матрица (CSR на массивах NumPy). Косинусная
+близость считается блоками строк через инвертированный индекс: для блока
+суммируются только пары постов с общими термами, поэтому память
+ограничена размером блока, а не квадратом числа постов. Для каждого поста
+сохраняются TOP_K ближайших соседей в таблицу RelatedPost.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import router, transaction
+
+from config import edgecache
+
+from .autocomplete import fold
+from .models import Origin, Post, RelatedPost
+
+TOP_K = 5
+# Заголовок важнее текста: его термы учитываются с таким весом
+TITLE_WEIGHT = 2
+# Термов на пост после отбора по весу; остальные почти не влияют на близость
+MAX_TERMS = 64
+# Термы из более чем такой доли постов не различают посты и только раздувают вычисления
+MAX_DF = 0.5
+# Ячеек плотного блока близостей (строки блока × все посты)
+BLOCK_CELLS = 2 ** 22
+STORE_BATCH_SIZE = 1000
+
+TOKEN_RE = re.compile(r'[^\W\d_]{3,}')
+STOP_WORDS = frozenset("""
+    это как его её что для она они оно был была были было или при так все всё уже
+    его ему она них нет над под без про после через который которая которые также
+    the and for with from that this was were are
+""".split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(fold(text)) if token not in STOP_WORDS]
+
+
+def iter_documents():
+    """
+    Возвращает пары (id поста, Counter термов) для всех неудалённых постов.
+    """
+    origins = {}
+    for post_id, parent_name, origin, description in (
+        Origin.objects.filter(post__is_deleted=False)
+        .values_list('post_id', 'parent_name', 'origin', 'description').iterator(chunk_size=2000)
+    ):
+        origins.setdefault(post_id, []).append(f'{parent_name} {origin} {description}')
+    for post_id, title, content in Post.objects.order_by('pk').values_list('pk', 'title', 'content').iterator(chunk_size=2000):
+        terms = Counter(tokenize(content))
+        for token in tokenize(title):
+            terms[token] += TITLE_WEIGHT
+        for text in origins.get(post_id, ()):
+            terms.update(tokenize(text))
+        yield post_id, terms
+
+
+class TfidfMatrix:
+    """
+    Нормированные TF-IDF векторы в формате CSR и тот же набор в виде инвертированного индекса.
+
+    Атрибуты:
+        post_ids: id постов по номерам строк.
+        indptr, indices, data: Строки матрицы (CSR).
+        term_ptr, term_rows, term_data: Столбцы матрицы — списки постов по термам.
+    """
+    def __init__(self, documents, max_terms=MAX_TERMS, max_df=MAX_DF):
+        vocabulary = {}
+        post_ids, rows, terms, counts = [], [], [], []
+        for row, (post_id, bag) in enumerate(documents):
+            post_ids.append(post_id)
+            for token, count in bag.items():
+                rows.append(row)
+                terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                counts.append(count)
+        self.post_ids = np.asarray(post_ids, dtype=np.int64)
+        n_rows = len(post_ids)
+        rows = np.asarray(rows, dtype=np.int64)
+        terms = np.asarray(terms, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+
+        # Терм из одного поста ни с кем его не связывает
+        df = np.bincount(terms, minlength=len(vocabulary))
+        keep = (df >= 2) & (df <= max(2, max_df * n_rows))
+        mask = keep[terms]
+        rows, terms, counts = rows[mask], terms[mask], counts[mask]
+
+        idf = np.log((1 + n_rows) / (1 + df)) + 1
+        weights = (1 + np.log(counts)) * idf[terms]
+
+        # Оставляем max_terms самых весомых термов каждого поста
+        order = np.lexsort((-weights, rows))
+        rows, terms, weights = rows[order], terms[order], weights[order]
+        row_counts = np.bincount(rows, minlength=n_rows)
+        row_starts = np.concatenate(([0], np.cumsum(row_counts)[:-1]))
+        mask = np.arange(len(rows)) - row_starts[rows] < max_terms
+        rows, terms, weights = rows[mask], terms[mask], weights[mask]
+
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=n_rows))
+        weights = weights / norms[rows]
+
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_rows))))
+        self.indices = terms
+        self.data = weights
+
+        by_term = np.argsort(terms, kind='stable')
+        self.term_ptr = np.concatenate(([0], np.cumsum(np.bincount(terms, minlength=len(vocabulary)))))
+        self.term_rows = rows[by_term]
+        self.term_data = weights[by_term]
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def block_similarity(self, start, stop):
+        """
+        Возвращает плотный блок косинусных близостей строк [start, stop) со всеми постами.
+        """
+        n_rows = len(self)
+        lo, hi = self.indptr[start], self.indptr[stop]
+        local_rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        terms = self.indices[lo:hi]
+        weights = self.data[lo:hi]
+
+        # Разворачиваем каждый ненулевой элемент блока в список постов с тем же термом
+        lengths = self.term_ptr[terms + 1] - self.term_ptr[terms]
+        total = int(lengths.sum())
+        offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(self.term_ptr[terms], lengths) + offsets
+        cells = np.repeat(local_rows, lengths) * n_rows + self.term_rows[positions]
+        products = np.repeat(weights, lengths) * self.term_data[positions]
+
+        block = np.bincount(cells, weights=products, minlength=(stop - start) * n_rows)
+        block = block.reshape(stop - start, n_rows)
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+        return block
+
+    def top_neighbours(self, k=TOP_K, block_cells=BLOCK_CELLS, progress=None):
+        """
+        Находит k ближайших постов для каждой строки.
+
+        Аргументы:
+            k: Число соседей.
+            block_cells: Ограничение размера плотного блока.
+            progress: Необязательная функция, получающая число обработанных строк.
+
+        Возвращает:
+            tuple: Массивы номеров соседей и близостей формы (строки, k);
+                отсутствующие соседи отмечены -1 и нулевой близостью.
+        """
+        n_rows = len(self)
+        k = min(k, max(n_rows - 1, 0))
+        neighbours = np.full((n_rows, k), -1, dtype=np.int64)
+        scores = np.zeros((n_rows, k), dtype=np.float64)
+        if not k:
+            return neighbours, scores
+        block_rows = max(1, block_cells // n_rows)
+        for start in range(0, n_rows, block_rows):
+            stop = min(start + block_rows, n_rows)
+            block = self.block_similarity(start, stop)
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            # При равных близостях на границе k argpartition выбирает из них произвольно:
+            # такие строки сортируются целиком, чтобы результат не зависел от размера блока
+            threshold = top_scores.min(axis=1, keepdims=True)
+            tied = (threshold[:, 0] > 0) & ((block >= threshold).sum(axis=1) > k)
+            if tied.any():
+                top[tied] = np.argsort(-block[tied], axis=1, kind='stable')[:, :k]
+                top_scores = np.take_along_axis(block, top, axis=1)
+            # Равные соседи идут по возрастанию номера строки
+            order = np.lexsort((top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            found = top_scores > 0
+            neighbours[start:stop] = np.where(found, top, -1)
+            scores[start:stop] = np.where(found, top_scores, 0)
+            if progress:
+                progress(stop)
+        return neighbours, scores
+
+
+def store_neighbours(post_ids, neighbours, scores):
+    """
+    Заменяет содержимое RelatedPost новым набором соседей в одной транзакции.
+
+    Возвращает:
+        int: Количество сохранённых связей.
+    """
+    def links():
+        for row, post_id in enumerate(post_ids):
+            for rank, (column, score) in enumerate(zip(neighbours[row], scores[row])):
+                if column < 0:
+                    break
+                yield RelatedPost(post_id=int(post_id), related_id=int(post_ids[column]),
+                                  rank=rank, score=float(score))
+
+    created = 0
+    with transaction.atomic(using=router.db_for_write(RelatedPost)):
+        RelatedPost.objects.all().delete()
+        batch = []
+        for link in links():
+            batch.append(link)
+            if len(batch) >= STORE_BATCH_SIZE:
+                RelatedPost.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            RelatedPost.objects.bulk_create(batch)
+            created += len(batch)
+        # Блок «Похожие персонажи» есть на странице каждого поста
+        edgecache.purge([f'post-{int(post_id)}' for post_id in post_ids], using=router.db_for_write(RelatedPost))
+    return created
+
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from config import edgecache
+
+from . import autocomplete, duplicates, facets, feeds, querycache
+from .models import Comment, Origin, Place, Post, RelatedPost, Review
+
+# Отправляется PostQuerySet.soft_delete(): update() не вызывает post_save/post_delete
+post_soft_deleted = Signal()
+# Отправляется BaseOriginFormSet.save_bulk(): bulk_create/bulk_update тоже обходят сигналы моделей
+origins_bulk_changed = Signal()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'views'}:
+        return
+    autocomplete.post_changed(instance)
+    feeds.invalidate()
+    duplicates.post_changed(instance, update_fields)
+    edgecache.purge(['post-list', f'post-{instance.pk}'], using=kwargs.get('using'))
+    if not created and (update_fields is None or {'is_active', 'is_deleted'} & set(update_fields)):
+        facets.refresh_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    autocomplete.posts_changed([instance.pk])
+    feeds.invalidate()
+    edgecache.purge(['post-list', f'post-{instance.pk}'], using=kwargs.get('using'))
+
+
+@receiver(post_soft_deleted, sender=Post)
+def posts_soft_deleted(sender, pks, **kwargs):
+    autocomplete.posts_changed(pks)
+    feeds.invalidate()
+    facets.refresh_posts(pks)
+    edgecache.purge(['post-list'] + [f'post-{pk}' for pk in pks])
+
+
+@receiver([post_save, post_delete], sender=Origin)
+def origin_changed(sender, instance, **kwargs):
+    autocomplete.posts_changed([instance.post_id])
+    facets.refresh_counts({instance.place_id, getattr(instance, '_loaded_place_id', None)})
+    instance._loaded_place_id = instance.place_id
+    edgecache.purge([f'post-{instance.post_id}'], using=kwargs.get('using'))
+
+
+@receiver(origins_bulk_changed, sender=Origin)
+def origins_bulk_saved(sender, post_ids, place_ids=(), **kwargs):
+    autocomplete.posts_changed(post_ids)
+    facets.refresh_counts(place_ids)
+    edgecache.purge([f'post-{pk}' for pk in post_ids])
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, instance, **kwargs):
+    # Отзывы показываются и на странице поста
+    edgecache.purge([f'review-{instance.slug}', f'post-{instance.post_id}'], using=kwargs.get('using'))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # Комментарии показываются на странице поста
+    edgecache.purge([f'post-{instance.post_id}'], using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет last_login; страницы и ленты показывают только имя автора
+    if update_fields is None or 'username' in update_fields:
+        # Имя автора отзыва показывается на странице поста, у которой нет ключа этого автора
+        reviewed = Review.objects.filter(author=instance).values_list('post_id', flat=True).distinct()
+        edgecache.purge([f'author-{instance.pk}'] + [f'post-{pk}' for pk in reviewed], using=kwargs.get('using'))
+        feeds.invalidate()
+
+
+# Версии таблиц кэша запросов; User — потому что посты и отзывы присоединяют автора
+querycache.register(Post, Origin, Review, Place, RelatedPost, User)
@@ -0,0 +1,170 @@
+"""
+Генерация sitemap-файлов для поисковых роботов.
+
+Каждый раздел обходится по первичному ключу порциями (keyset), без OFFSET,
+и пишется в файлы по SITEMAP_MAX_URLS адресов. Индекс sitemap.xml
+ссылается на все файлы; lastmod берётся из индексированных дат создания.
+Файлы строит команда build_sitemaps, а отдаёт веб-сервер или serve_sitemap.
+"""
+import os
+import tempfile
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.urls import reverse
+from django.views.static import serve
+
+from .models import Post, Review
+
+SITEMAP_MAX_URLS = 50000
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+INDEX_NAME = 'sitemap.xml'
+
+
+class SitemapSection:
+    """
+    Описание раздела sitemap.
+
+    Атрибуты:
+        name: Имя раздела, используется в именах файлов.
+        fields: Колонки для values().
+        lastmod_field: Колонка с датой изменения.
+        changefreq: Подсказка частоты изменения.
+    """
+    name = None
+    fields = ('pk',)
+    lastmod_field = None
+    changefreq = 'weekly'
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def location(self, row):
+        raise NotImplementedError
+
+    def iter_rows(self, chunk_size):
+        queryset = self.get_queryset()
+        last_pk = None
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values(*self.fields)[:chunk_size])
+            if not rows:
+                return
+            yield from rows
+            last_pk = rows[-1]['pk']
+
+
+class PostSitemap(SitemapSection):
+    name = 'posts'
+    fields = ('pk', 'created_at')
+    lastmod_field = 'created_at'
+    changefreq = 'daily'
+
+    def get_queryset(self):
+        return Post.objects.filter(is_active=True).uncached()
+
+    def location(self, row):
+        return reverse('posts:post_detail', args=[row['pk']])
+
+
+class ReviewSitemap(SitemapSection):
+    name = 'reviews'
+    fields = ('pk', 'slug', 'created_at')
+    lastmod_field = 'created_at'
+    changefreq = 'monthly'
+
+    def get_queryset(self):
+        return Review.objects.filter(post__is_active=True, post__is_deleted=False, slug__isnull=False).uncached()
+
+    def location(self, row):
+        return reverse('posts:review_detail', args=[row['slug']])
+
+
+def _write_atomic(path, chunks):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _urlset(base_url, section, rows):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n'
+    for row in rows:
+        yield '<url><loc>{}</loc>'.format(escape(base_url + section.location(row)))
+        if section.lastmod_field and row[section.lastmod_field]:
+            yield '<lastmod>{}</lastmod>'.format(row[section.lastmod_field].date().isoformat())
+        yield f'<changefreq>{section.changefreq}</changefreq></url>\n'
+    yield '</urlset>\n'
+
+
+def build_sitemaps(sections, output_dir=None, base_url=None, max_urls=SITEMAP_MAX_URLS, chunk_size=5000):
+    """
+    Пишет файлы разделов и индекс.
+
+    Аргументы:
+        sections: Экземпляры SitemapSection.
+        output_dir: Каталог для файлов (по умолчанию SITEMAP_ROOT).
+        base_url: Адрес сайта без завершающего слэша (по умолчанию SITE_URL).
+        max_urls: Максимум адресов в одном файле.
+        chunk_size: Размер порции при чтении из БД.
+
+    Возвращает:
+        list: Пары (имя файла, количество адресов).
+    """
+    output_dir = str(output_dir or settings.SITEMAP_ROOT)
+    base_url = (base_url or settings.SITE_URL).rstrip('/')
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    index_entries = []
+    for section in sections:
+        rows = section.iter_rows(chunk_size)
+        shard = 0
+        while True:
+            shard_rows = []
+            for row in rows:
+                shard_rows.append(row)
+                if len(shard_rows) >= max_urls:
+                    break
+            if not shard_rows and shard > 0:
+                break
+            shard += 1
+            filename = f'sitemap-{section.name}-{shard}.xml'
+            _write_atomic(os.path.join(output_dir, filename), _urlset(base_url, section, shard_rows))
+            lastmod = None
+            if section.lastmod_field:
+                dates = [row[section.lastmod_field] for row in shard_rows if row[section.lastmod_field]]
+                lastmod = max(dates) if dates else None
+            index_entries.append((filename, lastmod))
+            written.append((filename, len(shard_rows)))
+            if len(shard_rows) < max_urls:
+                break
+
+    def index():
+        yield f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n'
+        for filename, lastmod in index_entries:
+            yield '<sitemap><loc>{}</loc>'.format(escape(f'{base_url}/{filename}'))
+            if lastmod:
+                yield f'<lastmod>{lastmod.date().isoformat()}</lastmod>'
+            yield '</sitemap>\n'
+        yield '</sitemapindex>\n'
+
+    _write_atomic(os.path.join(output_dir, INDEX_NAME), index())
+
+    # Удаляем шарды, оставшиеся от прошлой генерации с большим количеством файлов
+    current = {filename for filename, _count in written}
+    for filename in os.listdir(output_dir):
+        if filename.startswith('sitemap-') and filename.endswith('.xml') and filename not in current:
+            os.remove(os.path.join(output_dir, filename))
+    return written
+
+
+def serve_sitemap(request, filename=INDEX_NAME):
+    """
+    Отдаёт заранее построенный файл sitemap (в production его отдаёт веб-сервер).
+    """
+    return serve(request, filename, document_root=settings.SITEMAP_ROOT)
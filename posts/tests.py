@@ -1,3 +1,1441 @@
-from django.test import TestCase
+import gzip
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from urllib.parse import quote
+from unittest import mock, skipIf
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import connection, transaction
+from django.test import (
+    LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from config import compression, health, media, metrics, traffic, warmup
+from config.edgecache import LocalPurgeServer
+from config.ratelimit import client_ip
+from users import timeline
+from . import analytics, autocomplete, duplicates, querycache, related
+from .forms import PostOriginFormSet
+from .markup import render_inline
+from .models import (
+    EXCERPT_LENGTH, Comment, FingerprintBand, Origin, Place, Post, PostFingerprint, PostViewDay, PostViewHour, RelatedPost,
+    Review, make_excerpt,
+)
+from .signals import post_soft_deleted
+from .sitemaps import PostSitemap, ReviewSitemap, build_sitemaps
+from .tracking import ConcurrentUpdateError
+
+
+def update_statements(queries):
+    return [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False)
+class DirtyFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома из Асгарда.', author=cls.author)
+
+    def test_save_writes_only_changed_columns(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.is_active = False
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        [sql] = update_statements(queries)
+        self.assertIn('"is_active"', sql)
+        self.assertIn('"version"', sql)
+        for column in ('"title"', '"content"', '"content_html"', '"image"', '"views"'):
+            self.assertNotIn(column, sql)
+
+    def test_unchanged_save_runs_no_queries(self):
+        post = Post.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(0):
+            post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).version, 0)
+
+    def test_snapshot_is_reset_after_save(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.title = 'Тор Одинсон'
+        post.save()
+        self.assertEqual(post.get_dirty_fields(), set())
+        with self.assertNumQueries(0):
+            post.save()
+
+    def test_content_change_updates_derived_columns(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.content = 'Сын **Одина**.'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        [sql] = update_statements(queries)
+        self.assertIn('"excerpt"', sql)
+        self.assertIn('"content_html"', sql)
+        self.assertNotIn('"title"', sql)
+        self.assertEqual(Post.objects.get(pk=post.pk).content_html, '<p>Сын <strong>Одина</strong>.</p>')
+
+    def test_deferred_fields_are_not_written(self):
+        post = Post.objects.defer('content').get(pk=self.post.pk)
+        post.title = 'Громовержец'
+        with CaptureQueriesContext(connection) as queries:
+            post.save()
+        [sql] = update_statements(queries)
+        self.assertNotIn('"content"', sql)
+        self.assertNotIn('"excerpt"', sql)
+
+    def test_concurrent_writers_of_different_fields_keep_both_changes(self):
+        moderator_copy = Post.objects.get(pk=self.post.pk)
+        counter_copy = Post.objects.get(pk=self.post.pk)
+        moderator_copy.is_active = False
+        moderator_copy.save()
+        # Второй писатель прочитал пост до первой записи и меняет другое поле
+        counter_copy.views = 10
+        counter_copy.save(update_fields=['views'])
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertFalse(post.is_active)
+        self.assertEqual(post.views, 10)
+
+    def test_concurrent_writers_without_version_keep_both_changes(self):
+        review = Review.objects.create(post=self.post, author=self.author, text='Хорошо', rating=4)
+        rating_copy = Review.objects.get(pk=review.pk)
+        text_copy = Review.objects.get(pk=review.pk)
+        rating_copy.rating = 5
+        rating_copy.save()
+        text_copy.text = 'Очень хорошо'
+        text_copy.save()
+        review = Review.objects.get(pk=review.pk)
+        self.assertEqual((review.rating, review.text), (5, 'Очень хорошо'))
+
+    def test_stale_version_is_rejected(self):
+        first = Post.objects.get(pk=self.post.pk)
+        second = Post.objects.get(pk=self.post.pk)
+        first.title = 'Первая правка'
+        first.save()
+        second.title = 'Вторая правка'
+        # Как IntegrityError, ошибка помечает внешнюю транзакцию для отката
+        with self.assertRaises(ConcurrentUpdateError), transaction.atomic():
+            second.save()
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.title, 'Первая правка')
+        self.assertEqual(post.version, 1)
+        self.assertEqual(second.version, 0)
+
+    def test_update_view_rejects_edit_of_outdated_version(self):
+        editor = User.objects.create_user('editor', 'editor@example.com', 'password')
+        editor.user_permissions.add(Permission.objects.get(codename='change_post'))
+        self.client.force_login(editor)
+        Post.objects.filter(pk=self.post.pk).update(version=3)
+        data = {
+            'title': 'Правка по старой версии', 'content': self.post.content, 'is_active': 'on', 'version': 2,
+            'origins-TOTAL_FORMS': '0', 'origins-INITIAL_FORMS': '0',
+        }
+        response = self.client.post(reverse('posts:post_update', args=[self.post.pk]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пост уже изменил другой пользователь')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).title, 'Тор')
+
+        data['version'] = 3
+        response = self.client.post(reverse('posts:post_update', args=[self.post.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.title, post.version), ('Правка по старой версии', 4))
+
+    def test_toggle_active_writes_only_status(self):
+        moderator = User.objects.create_user('moderator', 'moderator@example.com', 'password')
+        moderator.user_permissions.add(Permission.objects.get(codename='change_post'))
+        self.client.force_login(moderator)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('posts:toggle_active', args=[self.post.pk]))
+        post_updates = [sql for sql in update_statements(queries) if '"posts_post"' in sql.split('SET')[0]]
+        self.assertEqual(len(post_updates), 1)
+        self.assertNotIn('"content"', post_updates[0])
+        self.assertFalse(Post.objects.get(pk=self.post.pk).is_active)
+
+    def test_origin_place_is_kept_when_origin_text_is_unchanged(self):
+        origin = Origin.objects.create(post=self.post, parent_name='Один', origin='Асгард')
+        origin = Origin.objects.get(pk=origin.pk)
+        origin.description = 'Царство богов'
+        with CaptureQueriesContext(connection) as queries:
+            origin.save()
+        self.assertFalse([query for query in queries if 'posts_place' in query['sql'].split('WHERE')[0]
+                          and query['sql'].startswith('SELECT')])
+        [sql] = [sql for sql in update_statements(queries) if '"posts_origin"' in sql.split('SET')[0]]
+        self.assertIn('"description"', sql)
+        self.assertNotIn('"place_id"', sql)
+
+    def test_review_and_comment_save_changed_columns(self):
+        review = Review.objects.create(post=self.post, author=self.author, text='Отлично', rating=5)
+        comment = Comment.objects.create(post=self.post, text='Согласен')
+        review = Review.objects.get(pk=review.pk)
+        comment = Comment.objects.get(pk=comment.pk)
+        review.rating = 4
+        comment.text = 'Не согласен'
+        with CaptureQueriesContext(connection) as queries:
+            review.save()
+            comment.save()
+        review_sql, comment_sql = update_statements(queries)
+        self.assertIn('"rating"', review_sql)
+        self.assertNotIn('"text"', review_sql)
+        self.assertNotIn('"slug"', review_sql)
+        self.assertIn('"text"', comment_sql)
+        self.assertNotIn('"post_id"', comment_sql)
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False)
+class EdgeCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома из Асгарда.', author=cls.author)
+        cls.review = Review.objects.create(post=cls.post, author=cls.author, text='Отлично', rating=5)
+
+    def assertShared(self, response, keys):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertIn('s-maxage=', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertFalse(response.cookies)
+        self.assertEqual(set(response['Surrogate-Key'].split()), keys)
+
+    def test_anonymous_pages_are_public_with_surrogate_keys(self):
+        post_keys = {f'post-{self.post.pk}', f'author-{self.author.pk}'}
+        self.assertShared(self.client.get(reverse('posts:post_list')), post_keys | {'post-list'})
+        self.assertShared(self.client.get(reverse('posts:post_detail', args=[self.post.pk])), post_keys)
+        self.assertShared(
+            self.client.get(reverse('posts:review_detail', args=[self.review.slug])),
+            post_keys | {f'review-{self.review.slug}'},
+        )
+
+    def test_s_maxage_is_capped_without_purger(self):
+        detail = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertIn('s-maxage=60', self.client.get(detail)['Cache-Control'])
+        with override_settings(EDGE_CACHE=dict(settings.EDGE_CACHE, PURGER='config.edgecache.HttpPurger')):
+            self.assertIn('s-maxage=3600', self.client.get(detail)['Cache-Control'])
+
+    def test_render_post_content_purges_rewritten_posts(self):
+        Post.all_objects.filter(pk=self.post.pk).update(content_html_version=0)
+        with LocalPurgeServer() as server, self.purge_settings(server):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('render_post_content', workers=1, stdout=StringIO())
+        self.assertEqual(server.purged, {f'post-{self.post.pk}'})
+
+    def test_authenticated_pages_are_private(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertFalse(response.has_header('Surrogate-Key'))
+
+    @override_settings(EDGE_CACHE={'ENABLED': False})
+    def test_disabled_edge_cache_leaves_headers_alone(self):
+        response = self.client.get(reverse('posts:post_list'))
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def purge_settings(self, server):
+        return override_settings(EDGE_CACHE={
+            'ENABLED': True, 'PURGER': 'config.edgecache.HttpPurger', 'PURGE_URL': server.url,
+        })
+
+    def test_post_save_purges_post_keys_once_per_transaction(self):
+        with LocalPurgeServer() as server, self.purge_settings(server):
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.get(pk=self.post.pk)
+                post.title = 'Тор Одинсон'
+                post.save()
+                Origin.objects.create(post=post, parent_name='Один', origin='Асгард')
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(set(server.requests[0]), {'post-list', f'post-{self.post.pk}'})
+
+    def test_review_and_author_changes_purge_their_keys(self):
+        with LocalPurgeServer() as server, self.purge_settings(server):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.review.delete()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.author.last_login = self.review.created_at
+                self.author.save(update_fields=['last_login'])
+            with self.captureOnCommitCallbacks(execute=True):
+                self.author.username = 'thor'
+                self.author.save()
+        self.assertEqual(
+            [set(keys) for keys in server.requests],
+            [{f'review-{self.review.slug}', f'post-{self.post.pk}'}, {f'author-{self.author.pk}'}],
+        )
+
+    def test_comment_and_reviewer_changes_purge_post_pages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reviewer = User.objects.create_user('reviewer', 'reviewer@example.com', 'password')
+            Review.objects.create(post=self.post, author=reviewer, text='Неплохо', rating=3)
+        with LocalPurgeServer() as server, self.purge_settings(server):
+            with self.captureOnCommitCallbacks(execute=True):
+                comment = Comment.objects.create(post=self.post, text='Согласен')
+            with self.captureOnCommitCallbacks(execute=True):
+                comment.delete()
+            with self.captureOnCommitCallbacks(execute=True):
+                reviewer.username = 'heimdall'
+                reviewer.save(update_fields=['username'])
+        self.assertEqual(
+            [set(keys) for keys in server.requests],
+            [{f'post-{self.post.pk}'}, {f'post-{self.post.pk}'}, {f'author-{reviewer.pk}', f'post-{self.post.pk}'}],
+        )
+
+    def test_rolled_back_changes_are_not_purged(self):
+        with LocalPurgeServer() as server, self.purge_settings(server):
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        Post.objects.create(title='Локи', content='Бог обмана.', author=self.author)
+                        raise ValueError
+                except ValueError:
+                    pass
+                post = Post.objects.get(pk=self.post.pk)
+                post.is_active = False
+                post.save()
+        self.assertEqual([set(keys) for keys in server.requests], [{'post-list', f'post-{self.post.pk}'}])
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, EDGE_CACHE={'ENABLED': False})
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+
+    def setUp(self):
+        autocomplete.cache.clear()
+        autocomplete._local.update(index=None, version=None, epoch=None, checked_at=0.0)
+        self.addCleanup(autocomplete._local.update, index=None, version=None, epoch=None, checked_at=0.0)
+
+    def labels(self, prefix):
+        autocomplete._local['checked_at'] = 0.0
+        return [item['label'] for item in autocomplete.search(prefix)]
+
+    def test_insert_rename_and_delete_are_indexed_after_commit(self):
+        self.assertEqual(self.labels('тор'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Тор', content='Бог грома.', author=self.author)
+            Origin.objects.create(post=post, parent_name='Один', origin='Асгард')
+        self.assertEqual(self.labels('тор'), ['Тор'])
+        self.assertEqual(self.labels('асг'), ['Асгард'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Громовержец'
+            post.save()
+        self.assertEqual(self.labels('тор'), [])
+        self.assertEqual(self.labels('гром'), ['Громовержец'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.labels('гром'), [])
+        self.assertEqual(self.labels('асг'), [])
+
+    def test_rolled_back_write_is_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Post.objects.create(title='Локи', content='Бог обмана.', author=self.author)
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.labels('лок'), [])
+
+    def test_other_worker_applies_log_without_reloading(self):
+        post = Post.objects.create(title='Тор', content='Бог грома.', author=self.author)
+        self.assertEqual(self.labels('тор'), ['Тор'])
+        other_worker = dict(autocomplete._local)
+        autocomplete._local.update(index=None, version=None, epoch=None, checked_at=0.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Тор Одинсон'
+            post.save()
+        self.assertEqual(autocomplete.cache.get(autocomplete.VERSION_KEY), 1)
+
+        autocomplete._local.update(other_worker)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels('тор'), ['Тор Одинсон'])
+        self.assertEqual(autocomplete._local['version'], 1)
+
+    def test_lost_log_entry_triggers_rebuild(self):
+        post = Post.objects.create(title='Тор', content='Бог грома.', author=self.author)
+        self.assertEqual(self.labels('тор'), ['Тор'])
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Локи'
+            post.save()
+        autocomplete.cache.delete(autocomplete.LOG_KEY.format(1))
+        autocomplete.cache.set(autocomplete.VERSION_KEY, 2, None)
+        autocomplete._local['version'] = 0
+        self.assertEqual(self.labels('лок'), ['Локи'])
+
+
+def origin_formset_data(*rows, initial=0):
+    data = {'origins-TOTAL_FORMS': str(len(rows)), 'origins-INITIAL_FORMS': str(initial)}
+    for index, row in enumerate(rows):
+        data.update({f'origins-{index}-{name}': value for name, value in row.items()})
+    return data
+
+
+class MarkupTests(SimpleTestCase):
+    def test_protocol_relative_links_are_not_rendered(self):
+        self.assertIn('<a href="/posts/1/"', render_inline('[пост](/posts/1/)'))
+        for url in ('//evil.com', '/\\evil.com', 'javascript:alert(1)'):
+            with self.subTest(url=url):
+                self.assertNotIn('<a ', render_inline(f'[ссылка]({url})'))
+
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class FeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома.', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+            response.body = b''.join(response.streaming_content).decode()
+        return response
+
+    def test_cached_feed_and_conditional_get_skip_the_database(self):
+        url = reverse('posts:feed', args=['rss'])
+        first = self.get(url)
+        self.assertIn('<title>Тор</title>', first.body)
+        self.assertNotIn('Content-Length', first)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(url).body, first.body)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_formats_and_query_string(self):
+        atom = self.get(reverse('posts:feed', args=['atom']))
+        self.assertTrue(atom['Content-Type'].startswith('application/atom+xml'))
+        self.assertIn('<entry>', atom.body)
+        data = json.loads(self.get(reverse('posts:feed', args=['json']) + '?utm_source=mail').body)
+        self.assertEqual(data['feed_url'], 'http://testserver' + reverse('posts:feed', args=['json']))
+        self.assertEqual([item['title'] for item in data['items']], ['Тор'])
+        self.assertEqual(self.client.get(reverse('posts:feed', args=['csv'])).status_code, 404)
+
+    def test_author_feed_requires_existing_author(self):
+        self.assertIn('Тор', self.get(reverse('posts:author_feed', args=['json', 'author'])).body)
+        self.assertEqual(self.client.get(reverse('posts:author_feed', args=['json', 'nobody'])).status_code, 404)
+
+    def test_post_and_author_changes_invalidate_feed(self):
+        url = reverse('posts:feed', args=['json'])
+        etag = self.get(url)['ETag']
+        Post.objects.create(title='Локи', content='Бог обмана.', author=self.author)
+        response = self.get(url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Локи', response.body)
+
+        self.author.username = 'odinson'
+        self.author.save(update_fields=['username'])
+        response = self.get(url)
+        self.assertIn('odinson', response.body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class SoftDeleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.thor = Post.objects.create(title='Тор', content='Бог грома.', author=cls.author)
+        cls.loki = Post.objects.create(title='Локи', content='Бог обмана.', author=cls.author)
+        for post in (cls.thor, cls.loki):
+            Origin.objects.create(post=post, parent_name='Один', origin='Асгард')
+            Comment.objects.create(post=post, text='Первый')
+            Comment.objects.create(post=post, text='Второй')
+            Review.objects.create(post=post, author=cls.author, text='Отлично', rating=5)
+            PostViewHour.objects.create(post=post, hour=datetime(2024, 5, 31, 12, tzinfo=dt_timezone.utc), views=3)
+        RelatedPost.objects.create(post=cls.loki, related=cls.thor, rank=0, score=0.5)
+        RelatedPost.objects.create(post=cls.thor, related=cls.loki, rank=0, score=0.5)
+
+    def test_default_manager_hides_tombstones(self):
+        received = []
+
+        def receiver(sender, pks, **kwargs):
+            received.append(pks)
+
+        post_soft_deleted.connect(receiver)
+        self.addCleanup(post_soft_deleted.disconnect, receiver)
+        self.assertEqual(Post.objects.filter(pk=self.thor.pk).soft_delete(), 1)
+        self.assertEqual(received, [[self.thor.pk]])
+        self.assertEqual(list(Post.objects.all()), [self.loki])
+        self.assertEqual(list(Post.all_objects.tombstoned()), [self.thor])
+        self.assertIsNotNone(Post.all_objects.get(pk=self.thor.pk).deleted_at)
+        # Дочерние строки остаются до purge_deleted_posts
+        self.assertEqual(Comment.objects.filter(post=self.thor).count(), 2)
+
+    def test_delete_view_leaves_a_tombstone(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('posts:post_delete', args=[self.thor.pk]))
+        self.assertRedirects(response, reverse('posts:post_list'), fetch_redirect_response=False)
+        self.assertTrue(Post.all_objects.get(pk=self.thor.pk).is_deleted)
+
+    def test_purge_removes_children_in_chunks(self):
+        self.thor.soft_delete()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_deleted_posts', chunk_size=1, stdout=StringIO())
+        comment_deletes = [query for query in queries.captured_queries
+                           if query['sql'].startswith('DELETE FROM "posts_comment"')]
+        self.assertEqual(len(comment_deletes), 2)
+
+        self.assertEqual(list(Post.all_objects.all()), [self.loki])
+        for model in (Origin, Comment, Review, PostViewHour, FingerprintBand, PostFingerprint):
+            with self.subTest(model=model.__name__):
+                self.assertFalse(model.objects.exclude(post__in=Post.all_objects.all()).exists())
+                self.assertTrue(model.objects.filter(post=self.loki).exists())
+        self.assertEqual(list(RelatedPost.objects.values_list('post_id', 'related_id')), [])
+        self.assertEqual(Comment.objects.filter(post=self.loki).count(), 2)
+
+    def test_purge_keeps_recent_tombstones_with_days(self):
+        self.thor.soft_delete()
+        call_command('purge_deleted_posts', days=1, stdout=StringIO())
+        self.assertTrue(Post.all_objects.filter(pk=self.thor.pk).exists())
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class ExcerptTests(TestCase):
+    content = '## Происхождение\n\n**Сын** Одина,\nбог [грома](https://example.com) & молний.\n\nВторой абзац.'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content=cls.content, author=cls.author)
+
+    def test_excerpt_is_plain_text_of_first_paragraph(self):
+        self.assertEqual(self.post.excerpt, 'Сын Одина, бог грома & молний.')
+        self.assertEqual(make_excerpt('# Только заголовок'), 'Только заголовок')
+        self.assertEqual(make_excerpt('- раз\n- два'), 'раз два')
+        self.assertEqual(make_excerpt(''), '')
+        self.assertEqual(len(make_excerpt('слово ' * 200)), EXCERPT_LENGTH)
+
+    def test_backfill_fills_empty_and_optionally_all_excerpts(self):
+        other = Post.objects.create(title='Локи', content='Бог *обмана*.', author=self.author)
+        Post.all_objects.filter(pk=self.post.pk).update(excerpt='')
+        Post.all_objects.filter(pk=other.pk).update(excerpt='Бог *обмана*.')
+        call_command('backfill_excerpts', batch_size=1, stdout=StringIO())
+        excerpts = dict(Post.all_objects.values_list('pk', 'excerpt'))
+        self.assertEqual(excerpts, {self.post.pk: 'Сын Одина, бог грома & молний.', other.pk: 'Бог *обмана*.'})
+        call_command('backfill_excerpts', all=True, stdout=StringIO())
+        self.assertEqual(Post.all_objects.get(pk=other.pk).excerpt, 'Бог обмана.')
+
+    def test_list_page_shows_excerpt_without_loading_content(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:post_list'))
+        self.assertContains(response, 'Сын Одина, бог грома &amp; молний.')
+        self.assertNotContains(response, '**Сын**')
+        post_queries = [query['sql'] for query in queries.captured_queries if 'FROM "posts_post"' in query['sql']]
+        self.assertTrue(post_queries)
+        for sql in post_queries:
+            self.assertNotIn('"posts_post"."content"', sql)
+            self.assertNotIn('"posts_post"."content_html"', sql)
+
+
+@override_settings(RATELIMIT_ENABLED=False)
+class SitemapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.posts = []
+        for day in (3, 1, 2):
+            post = Post.objects.create(title=f'Пост {day}', content='Текст.', author=cls.author)
+            Post.objects.filter(pk=post.pk).update(created_at=datetime(2024, 5, day, 12, tzinfo=dt_timezone.utc))
+            cls.posts.append(post)
+        Post.objects.create(title='Черновик', content='Текст.', author=cls.author, is_active=False)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def build(self, max_urls):
+        return build_sitemaps([PostSitemap(), ReviewSitemap()], self.directory, 'https://example.com/', max_urls, 2)
+
+    def test_sections_are_paged_with_lastmod_per_file(self):
+        (self.directory / 'sitemap-posts-9.xml').write_text('stale')
+        written = self.build(max_urls=2)
+        self.assertEqual(written, [('sitemap-posts-1.xml', 2), ('sitemap-posts-2.xml', 1), ('sitemap-reviews-1.xml', 0)])
+        self.assertFalse((self.directory / 'sitemap-posts-9.xml').exists())
+        first = (self.directory / 'sitemap-posts-1.xml').read_text()
+        location = reverse('posts:post_detail', args=[self.posts[0].pk])
+        self.assertIn(f'<loc>https://example.com{location}</loc><lastmod>2024-05-03</lastmod>', first)
+        self.assertNotIn('Черновик', first)
+        index = (self.directory / 'sitemap.xml').read_text()
+        self.assertIn('<loc>https://example.com/sitemap-posts-1.xml</loc><lastmod>2024-05-03</lastmod>', index)
+        self.assertIn('<loc>https://example.com/sitemap-posts-2.xml</loc><lastmod>2024-05-02</lastmod>', index)
+        self.assertIn('<loc>https://example.com/sitemap-reviews-1.xml</loc></sitemap>', index)
+
+    def test_index_and_sections_are_served(self):
+        self.build(max_urls=10)
+        with override_settings(SITEMAP_ROOT=self.directory):
+            self.assertContains(self.client.get('/sitemap.xml'), 'sitemap-posts-1.xml')
+            self.assertContains(self.client.get('/sitemap-posts-1.xml'), '<urlset')
+            self.assertEqual(self.client.get('/sitemap-users-1.xml').status_code, 404)
+
+
+class SaveBulkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома.', author=cls.author)
+        cls.odin = Origin.objects.create(post=cls.post, parent_name='Один', origin='Асгард', description='Отец')
+        cls.jord = Origin.objects.create(post=cls.post, parent_name='Ёрд', origin='Мидгард', description='Мать')
+
+    def formset(self, odin, jord, *extra):
+        rows = [dict(row, id=str(origin.pk)) for origin, row in ((self.odin, odin), (self.jord, jord))]
+        return PostOriginFormSet(origin_formset_data(*rows, *extra, initial=2), instance=self.post)
+
+    def row(self, instance, **changes):
+        return dict({name: getattr(instance, name) for name in ('parent_name', 'origin', 'description')}, **changes)
+
+    def test_applies_only_the_diff(self):
+        formset = self.formset(
+            self.row(self.odin), self.row(self.jord, DELETE='on'),
+            {'parent_name': 'Фригг', 'origin': 'Асгард', 'description': ''},
+        )
+        self.assertTrue(formset.is_valid(), formset.errors)
+        self.assertEqual(formset.save_bulk(), (1, 0, 1))
+        self.assertEqual(sorted(self.post.origins.values_list('parent_name', flat=True)), ['Один', 'Фригг'])
+
+    def test_rows_write_only_their_own_changed_fields(self):
+        formset = self.formset(self.row(self.odin, description='Всеотец'), self.row(self.jord, parent_name='Фьёргюн', origin='Ётунхейм'))
+        formset.forms
+        # Правка из другого запроса после загрузки формы: поле, которое форма не меняла, не затирается
+        Origin.objects.filter(pk=self.odin.pk).update(parent_name='Бор')
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(formset.save_bulk(), (0, 2, 0))
+        origin_updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "posts_origin"')]
+        self.assertEqual(len(origin_updates), 2)
+
+        odin, jord = Origin.objects.get(pk=self.odin.pk), Origin.objects.get(pk=self.jord.pk)
+        self.assertEqual((odin.parent_name, odin.description), ('Бор', 'Всеотец'))
+        self.assertEqual((jord.parent_name, jord.origin, jord.place.name), ('Фьёргюн', 'Ётунхейм', 'Ётунхейм'))
+
+
+class DuplicateCandidatesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.posts = [
+            Post.objects.create(title=f'Пост {number}', content='Шаблонный текст.', author=cls.author)
+            for number in range(5)
+        ]
+        FingerprintBand.objects.all().delete()
+        # Ключ 1 — шаблонная полоса у всех постов, ключи 2 и 3 есть только у последнего
+        FingerprintBand.objects.bulk_create(
+            [FingerprintBand(post=post, key=1) for post in cls.posts]
+            + [FingerprintBand(post=cls.posts[-1], key=key) for key in (2, 3)]
+        )
+
+    def candidate_ids(self, keys):
+        return [row[0] for row in duplicates._candidates(keys, None)]
+
+    def test_oversized_bucket_does_not_crowd_out_matches(self):
+        with mock.patch.object(duplicates, 'MAX_CANDIDATES', 2):
+            self.assertEqual(self.candidate_ids({1, 2}), [self.posts[-1].pk])
+
+    def test_candidates_are_ordered_by_shared_keys(self):
+        candidates = self.candidate_ids({1, 2, 3})
+        self.assertEqual(candidates[0], self.posts[-1].pk)
+        self.assertEqual(len(candidates), 5)
+
+
+@override_settings(VIEW_ANALYTICS=dict(settings.VIEW_ANALYTICS, ENABLED=True, MAX_BUFFER=1000, FLUSH_INTERVAL=3600))
+class ViewAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома.', author=cls.author)
+
+    def setUp(self):
+        analytics.flush()
+        self.hour = datetime(2024, 5, 31, 22, tzinfo=dt_timezone.utc)
+
+    def record(self, views, moment, post_id=None):
+        for _ in range(views):
+            analytics.record_view(post_id or self.post.pk, moment)
+
+    def hourly(self):
+        return list(PostViewHour.objects.order_by('hour').values_list('hour', 'views'))
+
+    def test_flush_accumulates_hourly_buckets(self):
+        self.record(3, self.hour + timedelta(minutes=5))
+        self.record(1, self.hour + timedelta(hours=1, minutes=59))
+        # Просмотр поста, удалённого до сброса буфера, отбрасывается
+        self.record(1, self.hour, post_id=self.post.pk + 1000)
+        self.assertEqual(analytics.flush(), 5)
+        self.record(2, self.hour + timedelta(minutes=30))
+        self.assertEqual(analytics.flush(), 2)
+        self.assertEqual(analytics.flush(), 0)
+        self.assertEqual(self.hourly(), [(self.hour, 5), (self.hour + timedelta(hours=1), 1)])
+
+    def test_rollup_replaces_daily_totals(self):
+        self.record(4, self.hour)
+        self.record(3, self.hour + timedelta(hours=2))
+        analytics.flush()
+        day = self.hour.date()
+        self.assertEqual(analytics.rollup(day, day + timedelta(days=1)), 2)
+        self.assertEqual(analytics.rollup(day, day + timedelta(days=1)), 2)
+        self.assertEqual(list(PostViewDay.objects.order_by('day').values_list('day', 'views')),
+                         [(day, 4), (day + timedelta(days=1), 3)])
+
+    def test_rollup_command_flushes_buffer_first(self):
+        now = datetime.now(dt_timezone.utc)
+        self.record(2, now)
+        call_command('rollup_post_views', days=1, stdout=StringIO())
+        self.assertEqual(PostViewDay.objects.get(post=self.post, day=now.date()).views, 2)
+
+    def test_prune_rolls_up_expired_hours(self):
+        self.record(6, self.hour)
+        analytics.flush()
+        hourly, daily = analytics.prune(now=self.hour + timedelta(days=30))
+        self.assertEqual((hourly, daily), (1, 0))
+        self.assertEqual(self.hourly(), [])
+        self.assertEqual(PostViewDay.objects.get(post=self.post).views, 6)
+
+
+@override_settings(QUERY_CACHE=dict(settings.QUERY_CACHE, ENABLED=True),
+                   VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False, EDGE_CACHE={'ENABLED': False})
+class QueryCacheTests(TransactionTestCase):
+    # Без обёртки TestCase в транзакцию: проверяется версия таблиц, а не обход кэша внутри транзакции
+    def setUp(self):
+        querycache.get_cache().clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.post = Post.objects.create(title='Тор', content='Бог грома.', author=self.author)
+
+    def cached_titles(self):
+        titles = list(Post.objects.order_by('pk').values_list('title', flat=True))
+        hits = querycache.stats['hits']
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('title', flat=True)), titles)
+        self.assertEqual(querycache.stats['hits'], hits + 1)
+        return titles
+
+    def test_update_invalidates_cached_results(self):
+        self.assertEqual(self.cached_titles(), ['Тор'])
+        Post.objects.filter(pk=self.post.pk).update(title='Тор Одинсон')
+        self.assertEqual(self.cached_titles(), ['Тор Одинсон'])
+
+    def test_bulk_create_invalidates_cached_count(self):
+        self.assertEqual(Post.objects.count(), 1)
+        Post.objects.bulk_create([Post(title='Локи', content='Бог обмана.', author=self.author)])
+        self.assertEqual(Post.objects.count(), 2)
+
+    def test_login_does_not_invalidate_author_joins(self):
+        posts = Post.objects.select_related('author').order_by('pk')
+        list(posts.all())
+        self.assertTrue(self.client.login(username='author', password='password'))
+        hits = querycache.stats['hits']
+        self.assertEqual([post.author.username for post in posts.all()], ['author'])
+        self.assertEqual(querycache.stats['hits'], hits + 1)
+
+    def test_queries_joining_uninstrumented_tables_are_not_cached(self):
+        unfingerprinted = Post.objects.filter(fingerprint__isnull=True)
+        self.assertEqual(list(unfingerprinted.all()), [])
+        # Отпечатки пишутся мимо версий кэша, поэтому запрос должен читать БД
+        PostFingerprint.objects.filter(post=self.post).delete()
+        self.assertEqual(list(unfingerprinted.all()), [self.post])
+        commented = Post.objects.filter(comments__text='Первый')
+        self.assertEqual(commented.count(), 0)
+        Comment.objects.create(post=self.post, text='Первый')
+        self.assertEqual(commented.count(), 1)
+
+    def test_uncached_querysets_skip_the_cache(self):
+        posts = Post.objects.uncached().order_by('pk')
+        list(posts.filter(pk__gt=0))
+        lookups = querycache.stats['hits'] + querycache.stats['misses']
+        list(posts.filter(pk__gt=0).values_list('pk'))
+        self.assertEqual(querycache.stats['hits'] + querycache.stats['misses'], lookups)
+
+    def test_subquery_tables_are_versioned(self):
+        origins = Origin.objects.filter(origin='Асгард').values('post_id')
+        self.assertEqual(querycache.query_tables(Post.objects.filter(pk__in=origins).query),
+                         {'posts_post', 'posts_origin'})
+        self.assertIsNone(querycache.query_tables(Post.objects.extra(where=['1 = 1']).query))
+
+    def test_place_page_shows_post_added_by_formset(self):
+        Origin.objects.create(post=self.post, parent_name='Один', origin='Асгард')
+        place = Place.objects.get()
+        second = Post.objects.create(title='Локи', content='Бог обмана.', author=self.author)
+        url = reverse('posts:place_posts', args=[place.pk])
+        self.assertNotContains(self.client.get(url), 'Локи')
+
+        formset = PostOriginFormSet(origin_formset_data({'parent_name': 'Лафей', 'origin': 'Асгард'}), instance=second)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        self.assertEqual(formset.save_bulk(), (1, 0, 0))
+
+        self.assertEqual(Place.objects.get().post_count, 2)
+        self.assertContains(self.client.get(url), 'Локи')
+
+    def test_place_page_follows_origin_renamed_by_formset(self):
+        origin = Origin.objects.create(post=self.post, parent_name='Один', origin='Асгард')
+        asgard = origin.place
+        url = reverse('posts:place_posts', args=[asgard.pk])
+        self.assertContains(self.client.get(url), 'Тор')
+
+        formset = PostOriginFormSet(origin_formset_data(
+            {'id': str(origin.pk), 'parent_name': 'Один', 'origin': 'Мидгард'}, initial=1,
+        ), instance=self.post)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        self.assertEqual(formset.save_bulk(), (0, 1, 0))
+
+        self.assertNotContains(self.client.get(url), 'Тор')
+        midgard = Origin.objects.get(pk=origin.pk).place
+        self.assertContains(self.client.get(reverse('posts:place_posts', args=[midgard.pk])), 'Тор')
+
+    def test_place_page_drops_post_whose_origin_moved(self):
+        origin = Origin.objects.create(post=self.post, parent_name='Один', origin='Асгард')
+        asgard = origin.place
+        url = reverse('posts:place_posts', args=[asgard.pk])
+        self.assertContains(self.client.get(url), 'Тор')
+
+        origin = Origin.objects.get(pk=origin.pk)
+        origin.origin = 'Мидгард'
+        origin.save()
+
+        self.assertNotEqual(Origin.objects.get(pk=origin.pk).place_id, asgard.pk)
+        self.assertNotContains(self.client.get(url), 'Тор')
+        self.assertContains(self.client.get(reverse('posts:place_posts', args=[origin.place_id])), 'Тор')
+
+
+class ClientIpTests(SimpleTestCase):
+    def ip(self, forwarded):
+        return client_ip(RequestFactory().get('/', HTTP_X_FORWARDED_FOR=forwarded, REMOTE_ADDR='10.0.0.1'))
+
+    @override_settings(RATELIMIT_TRUST_FORWARDED=True, RATELIMIT_TRUSTED_PROXIES=1)
+    def test_spoofed_left_entries_are_ignored(self):
+        self.assertEqual(self.ip('127.0.0.1, 203.0.113.7'), '203.0.113.7')
+
+    @override_settings(RATELIMIT_TRUST_FORWARDED=True, RATELIMIT_TRUSTED_PROXIES=2)
+    def test_address_at_trusted_proxy_depth(self):
+        self.assertEqual(self.ip('127.0.0.1, 203.0.113.7, 10.0.0.2'), '203.0.113.7')
+        self.assertEqual(self.ip('203.0.113.7'), '10.0.0.1')
+
+    @override_settings(RATELIMIT_TRUST_FORWARDED=False)
+    def test_header_is_ignored_without_trusted_proxy(self):
+        self.assertEqual(self.ip('127.0.0.1'), '10.0.0.1')
+
+
+class MediaTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name, MEDIA_SENDFILE_BACKEND='', RATELIMIT_ENABLED=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.storage = media.HashedMediaStorage()
+        self.name = self.storage.save('posts/images/Тор.jpg', ContentFile(b'0123456789'))
+        self.url = self.storage.url(self.name)
+
+    def test_url_is_served_from_memory_until_file_is_replaced(self):
+        with mock.patch.object(media.os, 'stat', wraps=os.stat) as stat:
+            self.assertEqual(self.storage.url(self.name), self.url)
+        stat.assert_not_called()
+        self.storage.delete(self.name)
+        self.storage.save(self.name, ContentFile(b'another image'))
+        self.assertNotEqual(self.storage.url(self.name), self.url)
+        self.assertEqual(media._file_hash.cache_info().maxsize, media.CONTENT_HASH_CACHE_SIZE)
+
+    def test_hashed_url_is_immutable_and_revalidates(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], media.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        # Без хэша в URL файл отдаётся, но кэшируется ненадолго
+        self.assertEqual(self.client.get('/media/' + self.name)['Cache-Control'], media.DEFAULT_CACHE_CONTROL)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 2-4/10', '3'))
+        self.assertEqual(b''.join(self.client.get(self.url, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */10'))
+        # If-Range со старым ETag: файл изменился, отдаётся целиком
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_sendfile_headers_are_percent_encoded(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/posts/images/%D0%A2%D0%BE%D1%80.jpg')
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_SENDFILE_BACKEND='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], quote(self.storage.path(self.name)))
+        self.assertEqual(response['ETag'], f'"{media.content_hash(self.storage.path(self.name), os.stat(self.storage.path(self.name)))}"')
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        override = override_settings(METRICS_DIR=self.directory, METRICS_ENABLED=True)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def key(self, kind, name, **labels):
+        return json.dumps([kind, name, list(labels.items())], ensure_ascii=False)
+
+    def test_collect_sums_files_and_archives_finished_processes(self):
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        sent, queue = self.key('counter', 'mail_messages_total', result='sent'), self.key('gauge', 'mail_queue_depth')
+        pid = os.getpid()
+        for path, sent_count, depth in (
+            (self.directory / f'{pid}_0.db', 2, 1),
+            (self.directory / f'{pid}_1.db', 3, 2),
+            (self.directory / f'{finished.pid}_0.db', 5, 7),
+        ):
+            value_file = metrics.ValueFile(path)
+            value_file.add(sent, sent_count)
+            value_file.add(queue, depth)
+            value_file._map.flush()
+            del value_file
+
+        totals = metrics.collect()
+        self.assertEqual(totals[sent], 10)
+        # Датчик завершившегося процесса не учитывается, его счётчик переносится в архив
+        self.assertEqual(totals[queue], 3)
+        self.assertFalse((self.directory / f'{finished.pid}_0.db').exists())
+        self.assertEqual(metrics._read(self.directory / metrics.ARCHIVE_NAME), [(sent, 5, mock.ANY)])
+        self.assertEqual(metrics.collect(), totals)
+
+    def test_reused_pid_starts_with_empty_file(self):
+        pid = os.getpid()
+        stale = metrics.ValueFile(self.directory / f'{pid}_0.db')
+        stale.add(self.key('gauge', 'mail_queue_depth'), 3)
+        stale.add(self.key('counter', 'mail_messages_total', result='sent'), 5)
+        del stale
+
+        slots = metrics._Slots()
+        value_file = slots.current()
+        self.assertEqual(value_file.path, self.directory / f'{pid}_0.db')
+        self.assertEqual(metrics._parse(value_file._map), [])
+        totals = metrics.collect()
+        self.assertNotIn(self.key('gauge', 'mail_queue_depth'), totals)
+        self.assertEqual(totals[self.key('counter', 'mail_messages_total', result='sent')], 5)
+
+    def test_management_commands_do_not_write_metrics(self):
+        script = "from config import metrics; metrics.REQUESTS.inc(view='x', method='GET', status=200)"
+        environ = {key: value for key, value in os.environ.items() if key != 'METRICS_ENABLED'}
+        subprocess.run([sys.executable, 'manage.py', 'shell', '-c', script], cwd=settings.BASE_DIR, check=True,
+                       env=dict(environ, METRICS_DIR=str(self.directory)))
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+
+class StartupTests(SimpleTestCase):
+    def test_failed_probe_is_a_command_error(self):
+        with mock.patch.dict(os.environ, DJANGO_SETTINGS_MODULE='config.missing_settings'):
+            with self.assertRaisesMessage(CommandError, 'Startup probe failed'):
+                call_command('profile_startup', no_warmup=True, stdout=StringIO())
+
+
+class BulkCreateUsersTests(TestCase):
+    def run_command(self, rows, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8', delete=False) as stream:
+            stream.write(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+        self.addCleanup(os.unlink, stream.name)
+        stderr = StringIO()
+        call_command('bulk_create_users', stream.name, workers=1, stdout=StringIO(), stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_weak_passwords_are_rejected(self):
+        errors = self.run_command([
+            {'username': 'thor', 'email': 'thor@example.com', 'password': '12345678'},
+            {'username': 'loki', 'email': 'loki@example.com', 'password': 'loki@example.com'},
+            {'username': 'odin', 'email': 'odin@example.com', 'password': 'Gungnir-Valaskjalf-77'},
+            {'username': 'frigg', 'email': 'frigg@example.com', 'password': ''},
+        ])
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['frigg', 'odin'])
+        self.assertIn('Line 1:', errors)
+        self.assertIn('Line 2:', errors)
+        self.assertFalse(User.objects.get(username='frigg').has_usable_password())
+
+    def test_welcome_email_failure_is_reported(self):
+        # Бэкенд может отправить не все письма, не бросив исключения
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', return_value=0):
+            errors = self.run_command([{'username': 'odin', 'email': 'odin@example.com', 'password': ''}],
+                                      send_welcome=True)
+        self.assertIn('Welcome emails for 1 of 1 users were not sent', errors)
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        moment = datetime(2024, 5, 1, 12, tzinfo=dt_timezone.utc)
+        cls.posts = [Post.objects.create(title=f'Пост {n}', content='Текст.', author=cls.author) for n in range(3)]
+        cls.reviews = [Review.objects.create(post=post, author=cls.author, text='Отзыв', rating=4) for post in cls.posts]
+        # Все элементы созданы в одну и ту же микросекунду, кроме последнего поста
+        Post.objects.filter(pk__in=[post.pk for post in cls.posts[:2]]).update(created_at=moment)
+        Post.objects.filter(pk=cls.posts[2].pk).update(created_at=moment - timedelta(days=1))
+        Review.objects.filter(author=cls.author).update(created_at=moment)
+
+    def keys(self, items):
+        return [(item.kind, item.obj.pk) for item in items]
+
+    def test_cursor_round_trip(self):
+        [item] = timeline.user_timeline(self.author, self.author, limit=1)[0]
+        created_at, kind, pk = timeline.decode_cursor(timeline.encode_cursor(item))
+        self.assertEqual((created_at, kind, pk), (item.created_at, item.kind, item.obj.pk))
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('', 'abc', '1-x-2', '1-p', '1-p-2-3', f'{10 ** 30}-p-1'):
+            with self.assertRaises(timeline.InvalidCursor):
+                timeline.decode_cursor(cursor)
+
+    def test_ties_on_created_at_order_reviews_first_then_by_pk(self):
+        items, next_cursor = timeline.user_timeline(self.author, self.author)
+        reviews = sorted((review.pk for review in self.reviews), reverse=True)
+        posts = [self.posts[1].pk, self.posts[0].pk]
+        self.assertEqual(self.keys(items), [('r', pk) for pk in reviews] + [('p', pk) for pk in posts]
+                         + [('p', self.posts[2].pk)])
+        self.assertIsNone(next_cursor)
+
+    def test_pages_split_ties_without_gaps_or_duplicates(self):
+        everything = self.keys(timeline.user_timeline(self.author, self.author)[0])
+        for limit in range(1, len(everything) + 1):
+            seen, cursor = [], None
+            while True:
+                items, cursor = timeline.user_timeline(self.author, self.author, cursor=cursor, limit=limit)
+                self.assertLessEqual(len(items), limit)
+                seen += self.keys(items)
+                if cursor is None:
+                    break
+            self.assertEqual(seen, everything, limit)
+
+    def test_exact_last_page_has_no_next_cursor(self):
+        items, next_cursor = timeline.user_timeline(self.author, self.author, limit=6)
+        self.assertEqual(len(items), 6)
+        self.assertIsNone(next_cursor)
+        items, next_cursor = timeline.user_timeline(self.author, self.author, limit=5)
+        self.assertEqual(next_cursor, timeline.encode_cursor(items[-1]))
+
+    def test_profile_view_rejects_bad_cursor(self):
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('users:profile'), {'cursor': 'garbage'}).status_code, 404)
+
+
+def capture_options(directory, **options):
+    return dict(settings.TRAFFIC_CAPTURE, ENABLED=True, DIR=directory, SAMPLE_RATE=1.0, **options)
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class TrafficCaptureTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.post = Post.objects.create(title='Тор', content='Бог грома из Асгарда.', author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # Файл трафика открывается один раз на процесс: тесту нужен свой
+        for name in ('_writer', '_writer_pid'):
+            patcher = mock.patch.object(traffic, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: traffic._writer and traffic._writer.close())
+        self.client.force_login(self.author)
+
+    def records(self):
+        [path] = Path(self.directory).glob('traffic-*.ndjson')
+        return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+    def test_identifying_values_are_not_written(self):
+        with override_settings(TRAFFIC_CAPTURE=capture_options(self.directory)):
+            self.client.get(reverse('users:user_detail', args=['author']))
+            self.client.get(reverse('posts:search'), {'q': 'Тор Одинсон', 'page': '2'})
+            self.client.get(reverse('users:profile'), {'cursor': '1714564800000000-p-12'})
+            self.client.post(reverse('posts:post_update', args=[self.post.pk]), {
+                'title': 'Тор Одинсон', 'content': 'Сын Одина', 'version': '0', 'email': 'author@example.com',
+                'origins-TOTAL_FORMS': '0', 'origins-INITIAL_FORMS': '0',
+            })
+        detail, search, profile, update = self.records()
+
+        self.assertEqual(detail['kwargs'], {'username': traffic.pseudonym('author')})
+        self.assertNotEqual(traffic.pseudonym('author'), traffic.pseudonym('editor'))
+        self.assertEqual(search['query'], [['q', traffic.filler(len('Тор Одинсон'))], ['page', '2']])
+        self.assertEqual(profile['query'], [['cursor', '1714564800000000-p-12']])
+        self.assertEqual((update['kwargs'], update['tier'], update['status']), ({'pk': self.post.pk}, 'user', 302))
+        form = dict(update['form'])
+        self.assertEqual(form['title'], traffic.filler(len('Тор Одинсон')))
+        self.assertEqual(form['version'], '0')
+        self.assertNotIn('email', form)
+        self.assertNotIn('author', json.dumps([detail, search, profile, update], ensure_ascii=False))
+
+    def test_excluded_and_foreign_views_are_not_written(self):
+        with override_settings(TRAFFIC_CAPTURE=capture_options(self.directory, EXCLUDE=['posts:search'])):
+            self.client.get(reverse('posts:search'), {'q': 'Тор'})
+            self.client.get('/admin/')
+        self.assertEqual(list(Path(self.directory).iterdir()), [])
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class ReplayTrafficTests(LiveServerTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.post = Post.objects.create(title='Тор', content='Бог грома из Асгарда.', author=self.author)
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8', delete=False) as stream:
+            self.path = stream.name
+        self.addCleanup(os.unlink, self.path)
+
+    def replay(self, *records, **options):
+        with open(self.path, 'w', encoding='utf-8') as stream:
+            for ts, record in enumerate(records):
+                stream.write(json.dumps(dict({'ts': ts, 'method': 'GET', 'query': [], 'tier': 'anonymous', 'ms': 1},
+                                             **record)) + '\n')
+        stdout = StringIO()
+        call_command('replay_traffic', self.path, base_url=self.live_server_url, speedup=0, concurrency=1,
+                     stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_pseudonyms_resolve_to_existing_objects(self):
+        output = self.replay(
+            {'view': 'posts:author_feed', 'kwargs': {'feed_format': 'rss', 'username': traffic.pseudonym('loki')}},
+            {'view': 'posts:feed', 'kwargs': {'feed_format': 'atom'}},
+        )
+        self.assertIn('Statuses: 200: 2', output)
+        self.assertIn('Replayed 2 of 2 requests', output)
+
+    def test_stale_version_is_not_replayed(self):
+        Post.objects.filter(pk=self.post.pk).update(version=3)
+        form = [['title', 'lorem ipsum'], ['content', 'lorem ipsum dolor'], ['version', '0'],
+                ['origins-TOTAL_FORMS', '0'], ['origins-INITIAL_FORMS', '0']]
+        output = self.replay({'method': 'POST', 'view': 'posts:post_update', 'kwargs': {'pk': self.post.pk},
+                              'tier': 'user', 'form': form},
+                             {'view': 'posts:feed', 'kwargs': {'feed_format': 'rss'}, 'tier': 'staff'},
+                             login=['user=author:password'])
+        self.assertIn('Statuses: 302: 1', output)
+        self.assertIn('Skipped 1 records: no credentials for staff', output)
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual((post.title, post.version), ('lorem ipsum', 4))
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False}, SCRYPT_WORK_FACTOR=2 ** 4, PBKDF2_ITERATIONS=1000)
+class PasswordHashingTests(TestCase):
+    def login(self, password='Gungnir-Valaskjalf-77'):
+        return self.client.post(reverse('users:login'), {'username': 'odin', 'password': password})
+
+    def test_legacy_pbkdf2_hash_is_rehashed_on_login(self):
+        user = User.objects.create_user('odin', 'odin@example.com')
+        User.objects.filter(pk=user.pk).update(password=make_password('Gungnir-Valaskjalf-77', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login(password='wrong').status_code, 200)
+        self.assertTrue(User.objects.get(pk=user.pk).password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login().status_code, 302)
+        algorithm, work_factor, _salt, block_size, parallelism, _hash = User.objects.get(pk=user.pk).password.split('$')
+        self.assertEqual((algorithm, work_factor, block_size, parallelism), ('scrypt', str(2 ** 4), '8', '1'))
+
+    def test_changed_scrypt_parameters_are_applied_on_login(self):
+        User.objects.create_user('odin', 'odin@example.com', 'Gungnir-Valaskjalf-77')
+        with self.settings(SCRYPT_WORK_FACTOR=2 ** 5):
+            self.assertEqual(self.login().status_code, 302)
+        self.assertEqual(User.objects.get(username='odin').password.split('$')[1], str(2 ** 5))
+
+
+class TfidfMatrixTests(SimpleTestCase):
+    def documents(self, *texts):
+        return [(pk, Counter(related.tokenize(text))) for pk, text in enumerate(texts, start=1)]
+
+    def neighbours(self, matrix, **options):
+        neighbours, scores = matrix.top_neighbours(**options)
+        return [[int(matrix.post_ids[column]) for column in row if column >= 0] for row in neighbours], scores
+
+    def test_empty_and_stop_word_documents_have_no_neighbours(self):
+        self.assertEqual(related.tokenize('Это было так, как для них. The and'), [])
+        matrix = related.TfidfMatrix(self.documents('', 'это как для the and', 'Асгард гром', 'гром Асгард'))
+        neighbours, scores = self.neighbours(matrix, k=3)
+        self.assertEqual(neighbours, [[], [], [4], [3]])
+        self.assertFalse(np.isnan(scores).any())
+
+        for documents in ([], self.documents('')):
+            empty = related.TfidfMatrix(documents)
+            self.assertEqual(empty.top_neighbours()[0].shape, (len(documents), 0))
+
+    def test_identical_documents_do_not_match_themselves(self):
+        matrix = related.TfidfMatrix(self.documents('Тор гром молот', 'Тор гром молот', 'Локи обман'))
+        neighbours, scores = self.neighbours(matrix, k=2)
+        self.assertEqual(neighbours[:2], [[2], [1]])
+        self.assertAlmostEqual(scores[0][0], 1.0)
+        self.assertEqual(neighbours[2], [])
+
+    def test_equal_scores_are_ordered_by_row_for_every_block_size(self):
+        texts = ['Асгард Мидгард'] + ['Асгард'] * 5 + ['Мидгард'] * 5
+        matrix = related.TfidfMatrix(self.documents(*texts), max_df=1)
+        expected = None
+        # Один, два, три и все посты в блоке; граница блока проходит между равными соседями
+        for block_rows in (1, 2, 3, len(texts)):
+            neighbours, _scores = self.neighbours(matrix, k=3, block_cells=block_rows * len(texts))
+            if expected is None:
+                expected = neighbours
+            self.assertEqual(neighbours, expected, block_rows)
+        self.assertEqual(expected[1], [3, 4, 5])
+        self.assertEqual(expected[6], [8, 9, 10])
+
+    def test_scores_are_descending_within_k(self):
+        matrix = related.TfidfMatrix(self.documents(
+            'Тор гром молот Асгард', 'Тор гром молот', 'Тор гром', 'Тор Мидгард', 'Локи обман',
+        ), max_df=1)
+        neighbours, scores = self.neighbours(matrix, k=3)
+        self.assertEqual(neighbours[0], [2, 3, 4])
+        self.assertTrue((np.diff(scores, axis=1) <= 0).all())
+
+
+def load_settings(**environ):
+    # Модуль настроек исполняется заново: профили читаются из окружения при импорте
+    spec = importlib.util.spec_from_file_location('profile_settings', Path(settings.BASE_DIR) / 'config' / 'settings.py')
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, environ):
+        spec.loader.exec_module(module)
+    return module
+
+
+class SettingsProfileTests(SimpleTestCase):
+    server = {'DB_NAME': 'blog', 'DB_USER': 'blog', 'DB_PASSWORD': 'secret', 'DB_HOST': 'db.internal'}
+
+    def test_sqlite_and_locmem_profiles(self):
+        profile = load_settings(DB_PROFILE='sqlite', SQLITE_PATH='/tmp/blog.sqlite3', CACHE_PROFILE='locmem')
+        database = profile.DATABASES['default']
+        self.assertEqual((database['ENGINE'], database['NAME']), ('config.db_backends.sqlite', '/tmp/blog.sqlite3'))
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertEqual(profile.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+
+    def test_server_profiles_read_connection_settings(self):
+        profile = load_settings(DB_PROFILE='postgresql', DB_PORT='5433', CACHE_PROFILE='redis',
+                                REDIS_URL='redis://cache:6379/2', **self.server)
+        database = profile.DATABASES['default']
+        self.assertEqual(database['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((database['HOST'], database['PORT'], database['NAME']), ('db.internal', '5433', 'blog'))
+        self.assertEqual(profile.CACHES['default']['LOCATION'], 'redis://cache:6379/2')
+
+        database = load_settings(DB_PROFILE='mssql', **self.server).DATABASES['default']
+        self.assertEqual(database['ENGINE'], 'mssql')
+        self.assertEqual(database['OPTIONS']['driver'], 'ODBC Driver 18 for SQL Server')
+
+    def test_unknown_database_profile_is_rejected(self):
+        with self.assertRaisesMessage(ValueError, "Unknown DB_PROFILE: 'oracle'"):
+            load_settings(DB_PROFILE='oracle')
+
+    def test_db_parity_skips_unavailable_profiles(self):
+        stdout = StringIO()
+        call_command('db_parity', profiles='sqlite,oracle', repeat=1, posts=15, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("oracle: unavailable (ValueError: Unknown DB_PROFILE: 'oracle')", output)
+        self.assertIn('sqlite q', output)
+        self.assertNotIn('oracle q', output)
+        self.assertIn('Query counts match on all benchmarked backends.', output)
+
+        stdout = StringIO()
+        call_command('db_parity', profiles='oracle', stdout=stdout)
+        self.assertIn('No database profile could be benchmarked.', stdout.getvalue())
+
+
+class CompressionTests(SimpleTestCase):
+    body = 'Тор, бог грома. ' * 40
+
+    def respond(self, response, accept='gzip, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        return compression.CompressionMiddleware(lambda request: response)(request)
+
+    def html(self, **headers):
+        return HttpResponse(self.body, content_type='text/html; charset=utf-8', headers=headers)
+
+    def test_accept_encoding_weights(self):
+        self.assertEqual(compression.accepted_encodings('gzip;q=0.5, BR, identity;q=0, deflate;q=x, '),
+                         {'gzip': 0.5, 'br': 1.0})
+
+    def test_gzip_negotiation(self):
+        for accept, encoding in (('gzip', 'gzip'), ('identity', None), ('', None)):
+            with self.subTest(accept=accept):
+                response = self.respond(self.html(), accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+        with self.settings(COMPRESSION_BROTLI=False):
+            self.assertEqual(self.respond(self.html())['Content-Encoding'], 'gzip')
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_negotiation(self):
+        for accept, encoding in (('gzip, br', 'br'), ('br', 'br'), ('br;q=0.5, gzip', 'gzip')):
+            with self.subTest(accept=accept):
+                response = self.respond(self.html(), accept)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_compressed_body_and_weak_etag(self):
+        decoders = [('gzip', gzip.decompress)]
+        if compression.brotli is not None:
+            decoders.append(('br', compression.brotli.decompress))
+        for accept, decompress in decoders:
+            with self.subTest(accept=accept):
+                response = self.respond(self.html(ETag='"v1"'), accept)
+                self.assertEqual(decompress(response.content).decode(), self.body)
+                self.assertEqual(response['Content-Length'], str(len(response.content)))
+                self.assertEqual(response['ETag'], 'W/"v1"')
+
+    def test_responses_that_are_left_alone(self):
+        for response in (
+            HttpResponse('коротко', content_type='text/html'),
+            HttpResponse(b'\x89PNG' * 100, content_type='image/png'),
+            self.html(**{'Content-Range': 'bytes 0-99/640'}),
+            self.html(**{'X-Accel-Redirect': '/protected/a.txt'}),
+            self.html(**{'Content-Encoding': 'gzip'}),
+        ):
+            with self.subTest(response=response):
+                content = response.content
+                self.assertEqual(self.respond(response).content, content)
+
+    def test_streaming_responses_are_compressed_by_chunk(self):
+        decoders = [('gzip', gzip.decompress)]
+        if compression.brotli is not None:
+            decoders.append(('br', compression.brotli.decompress))
+        for accept, decompress in decoders:
+            with self.subTest(accept=accept):
+                response = StreamingHttpResponse(iter([self.body, self.body]), content_type='text/html')
+                response['Content-Length'] = str(len(self.body.encode()) * 2)
+                response = self.respond(response, accept)
+                self.assertEqual(response['Content-Encoding'], accept)
+                self.assertFalse(response.has_header('Content-Length'))
+                chunks = list(response.streaming_content)
+                self.assertGreater(len(chunks), 1)
+                self.assertEqual(decompress(b''.join(chunks)).decode(), self.body * 2)
+
+
+@override_settings(QUERY_CACHE={'ENABLED': False}, VIEW_ANALYTICS={'ENABLED': False}, RATELIMIT_ENABLED=False,
+                   EDGE_CACHE={'ENABLED': False})
+class StreamingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        Post.objects.bulk_create([
+            Post(title=f'Персонаж {n:02d}', content='Текст.', excerpt='Текст.', author=cls.staff) for n in range(60)
+        ])
+
+    def get(self, **query):
+        return self.client.get(reverse('posts:post_list'), query, HTTP_ACCEPT_ENCODING='gzip')
+
+    def test_large_staff_page_is_streamed(self):
+        self.client.force_login(self.staff)
+        response = self.get(page_size=60)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        html = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(html.count('<div class="post">'), 60)
+        self.assertLess(html.index('Персонаж 59'), html.index('Персонаж 00'))
+        self.assertNotIn('stream:items', html)
+
+    def test_small_or_unprivileged_pages_are_rendered_normally(self):
+        self.client.force_login(self.staff)
+        response = self.get(page_size=10)
+        self.assertFalse(response.streaming)
+        self.assertEqual(gzip.decompress(response.content).decode().count('<div class="post">'), 10)
+
+        User.objects.filter(pk=self.staff.pk).update(is_staff=False)
+        response = self.get(page_size=60)
+        self.assertFalse(response.streaming)
+        self.assertEqual(gzip.decompress(response.content).decode().count('<div class="post">'), 5)
+
+
+@override_settings(HEALTH_CHECKS={'TIMEOUT': 0.2, 'TTL': 60, 'CRITICAL': ['database', 'cache'], 'EMAIL': False})
+class HealthTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(health._last, {'checked_at': 0.0, 'results': None})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def checks(self, **checks):
+        def counted(name, check):
+            def run():
+                self.calls.append(name)
+                check()
+            return run
+        checks = {name: counted(name, check) for name, check in checks.items()}
+        return mock.patch.object(health, 'get_checks', return_value=checks)
+
+    def get(self, name, warm=True):
+        with mock.patch.object(warmup, 'is_warm', return_value=warm):
+            response = self.client.get(reverse(name))
+        return response.status_code, response.json()
+
+    def test_real_checks_pass(self):
+        status, data = self.get('readyz')
+        self.assertEqual(status, 200, data)
+        self.assertEqual({name: check['status'] for name, check in data['checks'].items()},
+                         {'database': 'ok', 'cache': 'ok', 'storage': 'ok'})
+
+    def test_not_ready_until_warm(self):
+        with self.checks(database=lambda: None, cache=lambda: None):
+            status, data = self.get('readyz', warm=False)
+            self.assertEqual((status, data['ready'], data['warm'], data['status']), (503, False, False, 'ok'))
+            self.assertEqual(self.get('healthz', warm=False)[0], 200)
+            status, data = self.get('readyz')
+            self.assertEqual((status, data['ready']), (200, True))
+
+    def test_hung_check_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with self.checks(database=lambda: release.wait(5), cache=lambda: None):
+            started = time.perf_counter()
+            status, data = self.get('readyz')
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(status, 503)
+        self.assertEqual(data['checks']['database'], {'status': 'timeout', 'latency_ms': 200.0})
+        self.assertEqual(data['checks']['cache']['status'], 'ok')
+
+    def test_failed_optional_check_does_not_affect_readiness(self):
+        def broken():
+            raise ConnectionRefusedError('smtp is down')
+        with self.checks(database=lambda: None, cache=lambda: None, email=broken):
+            status, data = self.get('readyz')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['checks']['email'],
+                         {'status': 'error', 'latency_ms': None, 'error': 'ConnectionRefusedError: smtp is down'})
+
+    def test_results_are_cached_for_ttl(self):
+        with self.checks(database=lambda: None, cache=lambda: None):
+            self.get('readyz')
+            status, data = self.get('healthz')
+            self.assertEqual(sorted(self.calls), ['cache', 'database'])
+            self.assertGreaterEqual(data['age_s'], 0)
+            with self.settings(HEALTH_CHECKS=dict(settings.HEALTH_CHECKS, TTL=0)):
+                self.get('readyz')
+            self.assertEqual(len(self.calls), 4)
@@ -0,0 +1,129 @@
+"""
+Отслеживание изменённых полей моделей.
+
+Модель с DirtyFieldsMixin запоминает значения полей при загрузке из БД, и
+save() без update_fields записывает только изменённые с тех пор столбцы:
+UPDATE становится короче, а правки разных полей из параллельных запросов
+не затирают друг друга. Если у модели задан version_field, UPDATE
+выполняется с условием на версию, которую видел пользователь, и при
+расхождении выбрасывает ConcurrentUpdateError вместо тихой перезаписи.
+Явный save(update_fields=...) версию не проверяет и не увеличивает: так
+пишутся служебные поля вроде счётчиков, которые не конфликтуют с правками.
+"""
+from django.db import DatabaseError, models
+from django.db.models.fields.files import FieldFile
+
+_MISSING = object()
+
+
+class ConcurrentUpdateError(DatabaseError):
+    """
+    Запись изменена другим запросом после того, как её прочитали.
+    """
+
+
+def _snapshot_value(value):
+    # FieldFile изменяется на месте (save/delete), поэтому храним только имя файла
+    if isinstance(value, FieldFile):
+        return value.name
+    return value
+
+
+class DirtyFieldsMixin(models.Model):
+    """
+    Миксин модели: save() записывает только поля, изменённые после загрузки.
+
+    Атрибуты:
+        version_field: Имя целочисленного поля версии для оптимистической блокировки или None.
+    """
+    version_field = None
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _take_snapshot(self, attnames=None):
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if (attnames is None or field.attname in attnames) and field.attname in self.__dict__:
+                loaded[field.attname] = _snapshot_value(self.__dict__[field.attname])
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Догруженные отложенные поля и обновлённые значения становятся новой точкой отсчёта
+        self._take_snapshot(None if fields is None else {self._meta.get_field(name).attname for name in fields})
+
+    def get_dirty_fields(self):
+        """
+        Возвращает имена полей, изменённых после загрузки; незагруженные поля не учитываются.
+
+        Возвращает:
+            set: Имена полей (field.name).
+        """
+        loaded = self.__dict__.get('_loaded_values', {})
+        dirty = set()
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if _snapshot_value(self.__dict__[field.attname]) != loaded.get(field.attname, _MISSING):
+                dirty.add(field.name)
+        return dirty
+
+    def get_update_fields(self, update_fields=None):
+        """
+        Определяет, какие поля запишет save().
+
+        Аргументы:
+            update_fields: Явно переданные update_fields.
+
+        Возвращает:
+            set: Поля для UPDATE или None, если объект сохраняется целиком
+            (новый объект или объект, не загруженный из БД).
+        """
+        if update_fields is not None:
+            return set(update_fields)
+        if self._state.adding or '_loaded_values' not in self.__dict__:
+            return None
+        dirty = self.get_dirty_fields()
+        if dirty:
+            dirty.update(field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False))
+        return dirty
+
+    def save(self, *args, **kwargs):
+        if not args and not kwargs.get('force_insert'):
+            versioned = self.version_field and kwargs.get('update_fields') is None
+            update_fields = self.get_update_fields(kwargs.get('update_fields'))
+            if update_fields is not None and versioned and not self._state.adding:
+                if not update_fields:
+                    # Нечего записывать — версию тоже не увеличиваем
+                    return
+                self._expected_version = getattr(self, self.version_field)
+                setattr(self, self.version_field, self._expected_version + 1)
+                update_fields.add(self.version_field)
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields
+        try:
+            super().save(*args, **kwargs)
+        except ConcurrentUpdateError:
+            setattr(self, self.version_field, self._expected_version)
+            raise
+        finally:
+            self.__dict__.pop('_expected_version', None)
+        saved = kwargs.get('update_fields')
+        self._take_snapshot(None if saved is None else {self._meta.get_field(name).attname for name in saved})
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = self.__dict__.get('_expected_version')
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        base_qs = base_qs.filter(**{self.version_field: expected})
+        if not super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update):
+            raise ConcurrentUpdateError(
+                f"{self._meta.object_name} {pk_val} was changed by someone else (expected version {expected})."
+            )
+        return True
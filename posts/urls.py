@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import feeds, views
 
 
 app_name = 'posts'
@@ -14,4 +14,9 @@ urlpatterns = [
     path('post/<int:pk>/review/', views.ReviewCreateView.as_view(), name='review_create'),
     path('review/<slug:review_slug>/', views.ReviewDetailView.as_view(), name='review_detail'),
     path('search/', views.SearchView.as_view(), name='search'),
+    path('places/', views.PlaceFacetView.as_view(), name='places'),
+    path('places/<int:place_id>/', views.PlaceFacetView.as_view(), name='place_posts'),
+    path('autocomplete/', views.autocomplete_view, name='autocomplete'),
+    path('feeds/<str:feed_format>/', feeds.feed_view, name='feed'),
+    path('feeds/<str:feed_format>/<str:username>/', feeds.feed_view, name='author_feed'),
 ]
\ No newline at end of file
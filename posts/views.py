@@ -1,32 +1,61 @@
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from .models import Post, Review, Origin
+from .models import Post, Review, Origin, Place
 from .forms import PostForm, PostOriginFormSet, ReviewForm
 from django.urls import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib.auth.decorators import permission_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, HttpResponseRedirect, JsonResponse
 from django.core.mail import send_mail
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views.decorators.http import require_GET
+from . import analytics, autocomplete, duplicates, facets
+from .tracking import ConcurrentUpdateError
+from config.edgecache import EdgeCacheMixin
+from config.ratelimit import RateLimitMixin
+from config.streaming import StreamingListMixin
+
+def with_list_columns(posts):
+    """
+    Ограничивает колонки для страниц-списков: без полного содержимого поста
+    и без описаний происхождений, которые показываются только на детальной странице.
+
+    Аргументы:
+        posts: QuerySet постов.
+
+    Возвращает:
+        QuerySet: Посты с автором и облегчёнными происхождениями.
+    """
+    return posts.defer('content', 'content_html').select_related('author').prefetch_related(
+        Prefetch('origins', queryset=Origin.objects.only('id', 'post_id', 'parent_name', 'origin', 'place_id')),
+    )
 
-class PostListView(ListView):
+class PostListView(EdgeCacheMixin, StreamingListMixin, ListView):
     """
     Отображает список постов с пагинацией.
 
     Атрибуты:
         model: Модель Post.
         template_name: Шаблон для отображения списка.
+        item_template_name: Шаблон одного поста для потокового режима.
         context_object_name: Имя объекта в шаблоне.
         ordering: Сортировка по дате создания (убывание).
         paginate_by: Количество постов на странице.
+        edge_cache_policy: Политика кэширования на CDN (EDGE_CACHE['POLICIES']).
     """
     model = Post
     template_name = 'posts/post_list.html'
+    item_template_name = 'posts/post_list_item.html'
+    item_context_name = 'post'
     context_object_name = 'posts'
     ordering = ['-created_at']
     paginate_by = 5
+    edge_cache_policy = 'post_list'
 
     def get_queryset(self):
         """
@@ -36,10 +65,12 @@ class PostListView(ListView):
             QuerySet: Посты, доступные пользователю.
         """
         if not self.request.user.is_authenticated:
-            return Post.objects.filter(is_active=True)
+            posts = Post.objects.filter(is_active=True)
         elif self.request.user.has_perm('posts.change_post'):
-            return Post.objects.all()
-        return Post.objects.filter(is_active=True)
+            posts = Post.objects.all()
+        else:
+            posts = Post.objects.filter(is_active=True)
+        return with_list_columns(posts.order_by(*self.get_ordering()))
 
     def get_context_data(self, **kwargs):
         """
@@ -56,18 +87,30 @@ class PostListView(ListView):
         context['can_delete'] = self.request.user.has_perm('posts.delete_post')
         return context
 
-class SearchView(ListView):
+    def get_surrogate_keys(self, context):
+        """
+        Страница списка очищается при любом изменении постов, их происхождений и авторов.
+        """
+        posts = context.get('posts', ())
+        return ['post-list'] + [f'post-{post.pk}' for post in posts] + sorted(
+            {f'author-{post.author_id}' for post in posts if post.author_id}
+        )
+
+class SearchView(StreamingListMixin, ListView):
     """
     Выполняет поиск постов по заголовку или месту происхождения.
 
     Атрибуты:
         model: Модель Post.
         template_name: Шаблон для отображения результатов.
+        item_template_name: Шаблон одного результата для потокового режима.
         context_object_name: Имя объекта в шаблоне.
         paginate_by: Количество результатов на странице.
     """
     model = Post
     template_name = 'posts/search_results.html'
+    item_template_name = 'posts/search_result_item.html'
+    item_context_name = 'post'
     context_object_name = 'posts'
     paginate_by = 5
 
@@ -93,7 +136,7 @@ class SearchView(ListView):
                 Q(origins__origin__icontains=query),
                 is_active=True
             ).distinct()
-        return posts
+        return with_list_columns(posts.order_by('-created_at'))
 
     def get_context_data(self, **kwargs):
         """
@@ -109,7 +152,67 @@ class SearchView(ListView):
         context['query'] = self.request.GET.get('q', '')
         return context
 
-class PostDetailView(DetailView):
+class PlaceFacetView(ListView):
+    """
+    Показывает посты, отфильтрованные по месту происхождения, и список мест со счётчиками.
+
+    Атрибуты:
+        model: Модель Post.
+        template_name: Шаблон для отображения.
+        context_object_name: Имя объекта в шаблоне.
+        paginate_by: Количество постов на странице.
+    """
+    model = Post
+    template_name = 'posts/place_list.html'
+    context_object_name = 'posts'
+    paginate_by = 5
+
+    def get_place(self):
+        """
+        Возвращает выбранное место или None, если фильтр не задан.
+
+        Возвращает:
+            Place: Объект места.
+        """
+        if not hasattr(self, '_place'):
+            place_id = self.kwargs.get('place_id')
+            self._place = get_object_or_404(Place, pk=place_id) if place_id else None
+        return self._place
+
+    def get_queryset(self):
+        """
+        Возвращает видимые пользователю посты выбранного места.
+
+        Возвращает:
+            QuerySet: Посты места или все посты, если место не выбрано.
+        """
+        if self.request.user.has_perm('posts.change_post'):
+            posts = Post.objects.all()
+        else:
+            posts = Post.objects.filter(is_active=True)
+        place = self.get_place()
+        if place is not None:
+            # Подзапрос вместо JOIN, чтобы не понадобился DISTINCT при нескольких происхождениях;
+            # кэш запросов версионирует и posts_origin из подзапроса (querycache.query_tables)
+            posts = posts.filter(pk__in=Origin.objects.filter(place=place).values('post_id'))
+        return with_list_columns(posts.order_by('-created_at'))
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет выбранное место и места для боковой панели.
+
+        Аргументы:
+            **kwargs: Дополнительные аргументы.
+
+        Возвращает:
+            dict: Контекст для шаблона.
+        """
+        context = super().get_context_data(**kwargs)
+        context['place'] = self.get_place()
+        context['places'] = facets.sidebar()
+        return context
+
+class PostDetailView(EdgeCacheMixin, DetailView):
     """
     Отображает детальную информацию о посте.
 
@@ -117,10 +220,12 @@ class PostDetailView(DetailView):
         model: Модель Post.
         template_name: Шаблон для отображения.
         context_object_name: Имя объекта в шаблоне.
+        edge_cache_policy: Политика кэширования на CDN.
     """
     model = Post
     template_name = 'posts/post_detail.html'
     context_object_name = 'post'
+    edge_cache_policy = 'post_detail'
 
     def get_object(self):
         """
@@ -131,8 +236,10 @@ class PostDetailView(DetailView):
         """
         obj = super().get_object()
         if self.request.user.is_authenticated and self.request.user != obj.author:
-            obj.views += 1
-            obj.save()
+            # Атомарное увеличение: объект мог прийти из кэша запросов с устаревшим счётчиком
+            Post.objects.filter(pk=obj.pk).update(views=F('views') + 1)
+            analytics.record_view(obj.pk)
+            obj.refresh_from_db(fields=['views'])
             if obj.views % 100 == 0 and obj.author and obj.author.email:
                 send_mail(
                     subject=f'Ваш пост "{obj.title}" набрал {obj.views} просмотров!',
@@ -160,9 +267,65 @@ class PostDetailView(DetailView):
         context['can_delete'] = self.request.user.has_perm('posts.delete_post')
         context['review_form'] = ReviewForm()
         context['reviews'] = self.object.reviews.all()
+        # Соседи заранее посчитаны командой build_related_posts; здесь один запрос по индексу (post, rank)
+        context['related_posts'] = (
+            Post.objects.filter(is_active=True, related_from__post=self.object)
+            .order_by('related_from__rank')
+            .only('id', 'title', 'excerpt')
+        )
         return context
 
-class PostCreateView(LoginRequiredMixin, CreateView):
+    def get_surrogate_keys(self, context):
+        keys = [f'post-{self.object.pk}']
+        if self.object.author_id:
+            keys.append(f'author-{self.object.author_id}')
+        return keys
+
+class OriginFormSetMixin:
+    """
+    Общая работа с формсетом происхождений для создания и редактирования поста.
+
+    Формсет строится один раз за запрос и сохраняется пакетно вместе с постом
+    в одной транзакции.
+    """
+    def get_origin_formset(self):
+        """
+        Возвращает формсет происхождений, созданный для текущего запроса.
+
+        Возвращает:
+            BaseOriginFormSet: Формсет.
+        """
+        if not hasattr(self, '_origin_formset'):
+            if self.request.method == 'POST':
+                self._origin_formset = PostOriginFormSet(self.request.POST, self.request.FILES, instance=self.object)
+            else:
+                self._origin_formset = PostOriginFormSet(instance=self.object)
+        return self._origin_formset
+
+    def save_with_origins(self, form):
+        """
+        Сохраняет пост и происхождения, если формсет валиден.
+
+        Аргументы:
+            form: Валидная форма поста.
+
+        Возвращает:
+            HttpResponse: Перенаправление или форма с ошибками.
+        """
+        origin_formset = self.get_origin_formset()
+        if not origin_formset.is_valid():
+            return self.form_invalid(form)
+        try:
+            with transaction.atomic():
+                self.object = form.save()
+                origin_formset.instance = self.object
+                origin_formset.save_bulk()
+        except ConcurrentUpdateError:
+            form.add_error(None, 'Пост уже изменил другой пользователь. Обновите страницу и внесите правки заново.')
+            return self.form_invalid(form)
+        return HttpResponseRedirect(self.get_success_url())
+
+class PostCreateView(LoginRequiredMixin, RateLimitMixin, OriginFormSetMixin, CreateView):
     """
     Создаёт новый пост.
 
@@ -176,6 +339,7 @@ class PostCreateView(LoginRequiredMixin, CreateView):
     template_name = 'posts/post_create.html'
     form_class = PostForm
     success_url = reverse_lazy('posts:post_list')
+    ratelimit_group = 'post_create'
 
     def get_context_data(self, **kwargs):
         """
@@ -188,10 +352,7 @@ class PostCreateView(LoginRequiredMixin, CreateView):
             dict: Контекст для шаблона.
         """
         context = super().get_context_data(**kwargs)
-        if self.request.POST:
-            context['origin_formset'] = PostOriginFormSet(self.request.POST, self.request.FILES)
-        else:
-            context['origin_formset'] = PostOriginFormSet()
+        context['origin_formset'] = self.get_origin_formset()
         return context
 
     def form_valid(self, form):
@@ -205,15 +366,15 @@ class PostCreateView(LoginRequiredMixin, CreateView):
             HttpResponse: Перенаправление.
         """
         form.instance.author = self.request.user
-        context = self.get_context_data()
-        origin_formset = context['origin_formset']
-        if origin_formset.is_valid():
-            self.object = form.save()
-            origin_formset.instance = self.object
-            origin_formset.save()
-            return super().form_valid(form)
-        else:
-            return self.form_invalid(form)
+        # Похожие посты показываются один раз; повторная отправка с confirm_duplicate сохраняет пост
+        if not self.request.POST.get('confirm_duplicate'):
+            fingerprint = duplicates.Fingerprint.compute(
+                form.cleaned_data['title'], form.cleaned_data['content'], form.cleaned_data.get('image'),
+            )
+            matches = duplicates.find_duplicates(fingerprint)
+            if matches:
+                return self.render_to_response(self.get_context_data(form=form, duplicates=matches))
+        return self.save_with_origins(form)
 
     def form_invalid(self, form):
         """
@@ -227,7 +388,7 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         """
         return super().form_invalid(form)
 
-class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, OriginFormSetMixin, UpdateView):
     """
     Обновляет существующий пост.
 
@@ -270,10 +431,7 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
             dict: Контекст для шаблона.
         """
         context = super().get_context_data(**kwargs)
-        if self.request.POST:
-            context['origin_formset'] = PostOriginFormSet(self.request.POST, self.request.FILES, instance=self.object)
-        else:
-            context['origin_formset'] = PostOriginFormSet(instance=self.object)
+        context['origin_formset'] = self.get_origin_formset()
         return context
 
     def test_func(self):
@@ -307,15 +465,7 @@ class PostUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         Возвращает:
             HttpResponse: Перенаправление.
         """
-        context = self.get_context_data()
-        origin_formset = context['origin_formset']
-        if origin_formset.is_valid():
-            self.object = form.save()
-            origin_formset.instance = self.object
-            origin_formset.save()
-            return super().form_valid(form)
-        else:
-            return self.form_invalid(form)
+        return self.save_with_origins(form)
 
     def form_invalid(self, form):
         """
@@ -365,7 +515,8 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
     def form_valid(self, form):
         """
-        Подтверждает удаление.
+        Подтверждает удаление: пост помечается удалённым, а сам пост и связанные
+        записи удаляются позже командой purge_deleted_posts.
 
         Аргументы:
             form: Форма удаления.
@@ -373,9 +524,11 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         Возвращает:
             HttpResponse: Перенаправление.
         """
-        return super().form_valid(form)
+        success_url = self.get_success_url()
+        self.object.soft_delete()
+        return HttpResponseRedirect(success_url)
 
-class ReviewCreateView(LoginRequiredMixin, CreateView):
+class ReviewCreateView(LoginRequiredMixin, RateLimitMixin, CreateView):
     """
     Создаёт новый отзыв.
 
@@ -389,6 +542,7 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
     form_class = ReviewForm
     template_name = 'posts/review_form.html'
     success_url = reverse_lazy('posts:post_list')
+    ratelimit_group = 'review_create'
 
     def form_valid(self, form):
         """
@@ -418,7 +572,7 @@ class ReviewCreateView(LoginRequiredMixin, CreateView):
         context['post_id'] = self.kwargs['pk']
         return context
 
-class ReviewDetailView(DetailView):
+class ReviewDetailView(EdgeCacheMixin, DetailView):
     """
     Отображает детальную информацию об отзыве.
 
@@ -427,11 +581,13 @@ class ReviewDetailView(DetailView):
         template_name: Шаблон для отображения.
         context_object_name: Имя объекта в шаблоне.
         slug_url_kwarg: Имя параметра slug в URL.
+        edge_cache_policy: Политика кэширования на CDN.
     """
     model = Review
     template_name = 'posts/review_detail.html'
     context_object_name = 'review'
     slug_url_kwarg = 'review_slug'
+    edge_cache_policy = 'review_detail'
 
     def get_object(self):
         """
@@ -440,7 +596,13 @@ class ReviewDetailView(DetailView):
         Возвращает:
             Review: Объект отзыва.
         """
-        return Review.objects.get(slug=self.kwargs['review_slug'])
+        return get_object_or_404(Review, slug=self.kwargs['review_slug'], post__is_deleted=False)
+
+    def get_surrogate_keys(self, context):
+        keys = [f'review-{self.object.slug}', f'post-{self.object.post_id}']
+        if self.object.author_id:
+            keys.append(f'author-{self.object.author_id}')
+        return keys
 
 @permission_required('posts.change_post', raise_exception=True)
 def toggle_post_active(request, pk):
@@ -457,4 +619,30 @@ def toggle_post_active(request, pk):
     post = get_object_or_404(Post, pk=pk)
     post.is_active = not post.is_active
     post.save()
-    return redirect('posts:post_list')
\ No newline at end of file
+    return redirect('posts:post_list')
+
+@require_GET
+def autocomplete_view(request):
+    """
+    Возвращает подсказки для строки поиска по префиксу.
+
+    Аргументы:
+        request: HTTP-запрос с параметром q.
+
+    Возвращает:
+        JsonResponse: Список подсказок с текстом, типом и ссылкой.
+    """
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 20)
+    except ValueError:
+        limit = 10
+    search_url = reverse('posts:search')
+    results = []
+    for item in autocomplete.search(query, limit):
+        if item['kind'] == autocomplete.KIND_TITLE:
+            url = reverse('posts:post_detail', args=[item['post_id']])
+        else:
+            url = f"{search_url}?{urlencode({'q': item['label']})}"
+        results.append({'label': item['label'], 'kind': item['kind'], 'url': url})
+    return JsonResponse({'results': results})
@@ -0,0 +1,41 @@
+"""
+Хэшеры паролей с параметрами из настроек.
+
+Параметры читаются из settings при каждом обращении, поэтому смена
+SCRYPT_*/PBKDF2_ITERATIONS не требует миграций: при следующем входе
+Django увидит must_update() и прозрачно перехэширует пароль.
+Хэш считается в потоке запроса: hashlib.scrypt и PBKDF2 отпускают GIL,
+поэтому параллельные входы занимают разные ядра без отдельного пула.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+
+
+class TunableScryptPasswordHasher(ScryptPasswordHasher):
+    """
+    Scrypt (hashlib.scrypt) с параметрами SCRYPT_WORK_FACTOR, SCRYPT_BLOCK_SIZE, SCRYPT_PARALLELISM.
+    """
+    # Верхняя граница памяти для OpenSSL (по умолчанию 32 МБ, чего не хватает при n >= 2**15);
+    # нужна и для проверки старых хэшей с большими параметрами
+    maxmem = 1024 ** 3
+
+    @property
+    def work_factor(self):
+        return settings.SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.SCRYPT_PARALLELISM
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 с числом итераций PBKDF2_ITERATIONS.
+    """
+    @property
+    def iterations(self):
+        return settings.PBKDF2_ITERATIONS
@@ -0,0 +1,106 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils.crypto import get_random_string
+
+HASHER_PATHS = {
+    'scrypt': 'users.hashers.TunableScryptPasswordHasher',
+    'pbkdf2': 'users.hashers.TunablePBKDF2PasswordHasher',
+}
+SETTING_NAMES = {
+    'n': 'SCRYPT_WORK_FACTOR',
+    'r': 'SCRYPT_BLOCK_SIZE',
+    'p': 'SCRYPT_PARALLELISM',
+    'iterations': 'PBKDF2_ITERATIONS',
+}
+DEFAULT_PROFILES = [
+    'pbkdf2:iterations=720000',
+    'pbkdf2:iterations=260000',
+    'scrypt:n=16384,r=8,p=1',
+    'scrypt:n=8192,r=8,p=1',
+]
+
+
+def parse_profile(profile):
+    """
+    Разбирает профиль вида 'scrypt:n=16384,r=8,p=1'.
+
+    Возвращает:
+        tuple: (алгоритм, словарь переопределяемых настроек).
+    """
+    algorithm, _sep, params = profile.partition(':')
+    if algorithm not in HASHER_PATHS:
+        raise CommandError(f"Unknown hasher {algorithm!r}, expected one of {', '.join(HASHER_PATHS)}")
+    overrides = {}
+    for pair in filter(None, params.split(',')):
+        name, _eq, value = pair.partition('=')
+        if name not in SETTING_NAMES:
+            raise CommandError(f"Unknown parameter {name!r} in {profile!r}")
+        overrides[SETTING_NAMES[name]] = int(value)
+    hashers = [HASHER_PATHS[algorithm]] + [path for name, path in HASHER_PATHS.items() if name != algorithm]
+    overrides['PASSWORD_HASHERS'] = hashers
+    return algorithm, overrides
+
+
+class Command(BaseCommand):
+    help = 'Measures password hashing time and login throughput for hasher profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', default=DEFAULT_PROFILES,
+                            help="Profiles such as 'scrypt:n=16384,r=8,p=1' or 'pbkdf2:iterations=720000'")
+        parser.add_argument('--samples', type=int, default=10, help='Hashes measured per profile')
+        parser.add_argument('--logins', type=int, default=20, help='authenticate() calls per profile')
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads for the parallel verify test')
+
+    def handle(self, *args, **options):
+        password = get_random_string(16)
+        self.stdout.write(f"{'profile':32} {'hash ms (median)':>17} {'logins/s':>10} {'verifies/s':>11}")
+        for profile in options['profiles']:
+            _algorithm, overrides = parse_profile(profile)
+            with override_settings(**overrides):
+                hash_ms = self._hash_time(password, options['samples'])
+                logins = self._login_throughput(password, options['logins'])
+                verifies = self._verify_throughput(password, options['logins'], options['concurrency'])
+            self.stdout.write(f"{profile:32} {hash_ms:17.1f} {logins:10.1f} {verifies:11.1f}")
+
+    def _hash_time(self, password, samples):
+        durations = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            make_password(password)
+            durations.append((time.perf_counter() - started) * 1000)
+        return statistics.median(durations)
+
+    def _login_throughput(self, password, count):
+        """
+        Полный вход: поиск пользователя в БД и проверка пароля через authenticate().
+        """
+        username = f'benchmark-{get_random_string(8)}'
+        user = User.objects.create_user(username=username, password=password)
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                if authenticate(username=username, password=password) is None:
+                    raise CommandError("Benchmark user failed to authenticate")
+            return count / (time.perf_counter() - started)
+        finally:
+            user.delete()
+
+    def _verify_throughput(self, password, count, concurrency):
+        """
+        Только проверка хэша из нескольких потоков — показывает, как хэширование в потоках запросов
+        масштабируется по ядрам (hashlib.scrypt и PBKDF2 отпускают GIL).
+        """
+        encoded = make_password(password)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _i: check_password(password, encoded), range(count)))
+        if not all(results):
+            raise CommandError("Password verification failed")
+        return count / (time.perf_counter() - started)
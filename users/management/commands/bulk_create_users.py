@@ -0,0 +1,217 @@
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.contrib.auth import password_validation
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import router
+from django.utils import timezone
+
+from posts import querycache
+
+FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+WELCOME_SUBJECT = 'Добро пожаловать!'
+
+
+def init_worker(settings_module):
+    # При запуске процессов через spawn (Windows, macOS) Django в них ещё не настроен
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def hash_passwords(passwords):
+    """
+    Хэширует пароли в процессе пула; пустой пароль даёт непригодный для входа хэш.
+    """
+    return [make_password(password or None) for password in passwords]
+
+
+def read_rows(stream, fmt):
+    """
+    Читает пользователей из CSV с заголовком или NDJSON построчно.
+
+    Возвращает:
+        iterator: Пары (номер строки, словарь полей) или (номер строки, текст ошибки).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = {'username', 'email'} - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"CSV header lacks columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, f'invalid JSON: {exc}'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'expected a JSON object'
+
+
+class Command(BaseCommand):
+    help = 'Creates users from a CSV or NDJSON file, hashing passwords in a process pool and inserting in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or NDJSON file with username, email, password, first_name, last_name; '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format (by default taken from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users inserted per bulk_create')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Password hashing processes')
+        parser.add_argument('--send-welcome', action='store_true', help='Send the registration welcome email to created users')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        self.batch_size = options['batch_size']
+        self.workers = max(options['workers'], 1)
+        self.counts = {'created': 0, 'existing': 0, 'duplicate': 0, 'invalid': 0}
+        self.seen_usernames, self.seen_emails = set(), set()
+        self.username_validator = UnicodeUsernameValidator()
+        started = time.perf_counter()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8-sig', newline='')
+        mailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='welcome-mail') if options['send_welcome'] else None
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                     initargs=(os.environ['DJANGO_SETTINGS_MODULE'],)) as pool:
+                # Пока вставляется одна пачка, пул хэширует пароли следующей
+                pending = deque()
+                for batch in self.batches(read_rows(stream, fmt)):
+                    pending.append((batch, self.submit_hashing(pool, batch)))
+                    if len(pending) > 1:
+                        self.insert(*pending.popleft(), mailer)
+                while pending:
+                    self.insert(*pending.popleft(), mailer)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if mailer is not None:
+                # Письма уходят в фоне; команда завершается, когда отправлены все
+                mailer.shutdown(wait=True)
+        querycache.mark_written({User._meta.db_table}, router.db_for_write(User))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {self.counts['created']} users in {elapsed:.1f}s "
+            f"({self.counts['created'] / elapsed if elapsed else 0:.0f}/s); skipped {self.counts['existing']} already "
+            f"registered, {self.counts['duplicate']} repeated in the input, {self.counts['invalid']} invalid."
+        ))
+
+    def batches(self, rows):
+        """
+        Проверяет строки, отбрасывает повторы и уже зарегистрированные имена и адреса.
+
+        Возвращает:
+            iterator: Списки словарей с полями FIELDS.
+        """
+        batch = []
+        for line_number, row in rows:
+            row = self.clean(line_number, row)
+            if row is None:
+                continue
+            if row['username'] in self.seen_usernames or row['email'] in self.seen_emails:
+                self.counts['duplicate'] += 1
+                continue
+            self.seen_usernames.add(row['username'])
+            self.seen_emails.add(row['email'])
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield self.without_existing(batch)
+                batch = []
+        if batch:
+            yield self.without_existing(batch)
+
+    def clean(self, line_number, row):
+        if isinstance(row, str):
+            return self.invalid(line_number, row)
+        row = {name: str(row.get(name) or '').strip() for name in FIELDS}
+        row['email'] = User.objects.normalize_email(row['email'])
+        try:
+            self.username_validator(row['username'])
+            validate_email(row['email'])
+            if row['password']:
+                # Те же правила AUTH_PASSWORD_VALIDATORS, что и при регистрации через форму
+                password_validation.validate_password(row['password'], User(
+                    username=row['username'], email=row['email'],
+                    first_name=row['first_name'], last_name=row['last_name'],
+                ))
+        except ValidationError as exc:
+            return self.invalid(line_number, '; '.join(exc.messages))
+        for name in FIELDS[:2] + FIELDS[3:]:
+            max_length = User._meta.get_field(name).max_length
+            if len(row[name]) > max_length:
+                return self.invalid(line_number, f'{name} is longer than {max_length} characters')
+        return row
+
+    def invalid(self, line_number, error):
+        self.counts['invalid'] += 1
+        self.stderr.write(f"Line {line_number}: {error}")
+
+    def without_existing(self, batch):
+        # У auth_user уникально только имя, поэтому занятые адреса ищем отдельным запросом
+        existing = User.objects.filter(username__in=[row['username'] for row in batch]).values_list('username', flat=True)
+        existing_usernames = set(existing)
+        existing_emails = set(
+            User.objects.filter(email__in=[row['email'] for row in batch]).values_list('email', flat=True)
+        )
+        fresh = [
+            row for row in batch
+            if row['username'] not in existing_usernames and row['email'] not in existing_emails
+        ]
+        self.counts['existing'] += len(batch) - len(fresh)
+        return fresh
+
+    def submit_hashing(self, pool, batch):
+        passwords = [row['password'] for row in batch]
+        size = -(-len(passwords) // self.workers) or 1
+        return [pool.submit(hash_passwords, passwords[start:start + size]) for start in range(0, len(passwords), size)]
+
+    def insert(self, batch, futures, mailer):
+        """
+        Вставляет пачку одним bulk_create; имена, занятые параллельной регистрацией, пропускаются.
+        """
+        if not batch:
+            return
+        hashes = [encoded for future in futures for encoded in future.result()]
+        joined = timezone.now()
+        User.objects.bulk_create([
+            User(username=row['username'], email=row['email'], password=encoded,
+                 first_name=row['first_name'], last_name=row['last_name'], date_joined=joined)
+            for row, encoded in zip(batch, hashes)
+        ], ignore_conflicts=True)
+        # ignore_conflicts не возвращает id, поэтому созданных определяем по общему date_joined пачки
+        created = list(User.objects.filter(
+            username__in=[row['username'] for row in batch], date_joined=joined,
+        ).values_list('username', 'email'))
+        self.counts['created'] += len(created)
+        self.counts['existing'] += len(batch) - len(created)
+        if mailer is not None and created:
+            mailer.submit(self.send_welcome, created)
+
+    def send_welcome(self, created):
+        messages = [
+            EmailMessage(WELCOME_SUBJECT, f'Ваш аккаунт создан. Логин: {username}', 'from@example.com', [email])
+            for username, email in created
+        ]
+        try:
+            # Одно соединение на пачку вместо соединения на письмо
+            with get_connection() as connection:
+                sent = connection.send_messages(messages) or 0
+        except Exception as exc:
+            self.stderr.write(f"Welcome emails for {len(messages)} users failed: {exc}")
+            return
+        if sent < len(messages):
+            self.stderr.write(f"Welcome emails for {len(messages) - sent} of {len(messages)} users were not sent")
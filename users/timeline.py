@@ -0,0 +1,118 @@
+"""
+Лента активности пользователя: его посты и отзывы в одном списке.
+
+Посты и отзывы читаются двумя keyset-запросами по индексам (author,
+created_at) и сливаются в Python через heapq.merge. Курсор — ключ
+последнего показанного элемента (время, вид, id), поэтому глубина
+страницы не влияет на стоимость запросов, в отличие от OFFSET.
+"""
+import heapq
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+from posts.models import Post, Review
+
+KIND_POST = 'p'
+KIND_REVIEW = 'r'
+# Порядок видов при равном времени: в ленте по убыванию ключа отзыв идёт раньше поста
+KIND_RANK = {KIND_POST: 0, KIND_REVIEW: 1}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+@dataclass
+class TimelineItem:
+    """
+    Элемент ленты.
+
+    Атрибуты:
+        kind: KIND_POST или KIND_REVIEW.
+        created_at: Время создания.
+        obj: Объект Post или Review.
+    """
+    kind: str
+    created_at: datetime
+    obj: object
+
+    @property
+    def key(self):
+        return (self.created_at, KIND_RANK[self.kind], self.obj.pk)
+
+    @property
+    def is_post(self):
+        return self.kind == KIND_POST
+
+
+def encode_cursor(item):
+    micros = (item.created_at - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{item.kind}-{item.obj.pk}'
+
+
+def decode_cursor(cursor):
+    """
+    Разбирает курсор вида '<микросекунды>-<вид>-<id>'.
+
+    Возвращает:
+        tuple: (время, вид, id).
+    """
+    try:
+        micros, kind, pk = cursor.split('-')
+        if kind not in KIND_RANK:
+            raise ValueError(kind)
+        return EPOCH + timedelta(microseconds=int(micros)), kind, int(pk)
+    except (ValueError, OverflowError):
+        raise InvalidCursor(cursor)
+
+
+def _after(cursor, kind):
+    """
+    Условие «строго после курсора» в порядке убывания ключа для потока одного вида.
+    """
+    created_at, cursor_kind, pk = cursor
+    if KIND_RANK[kind] < KIND_RANK[cursor_kind]:
+        return Q(created_at__lte=created_at)
+    if KIND_RANK[kind] > KIND_RANK[cursor_kind]:
+        return Q(created_at__lt=created_at)
+    return Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+
+
+def user_timeline(user, viewer, cursor=None, limit=20):
+    """
+    Возвращает страницу ленты пользователя.
+
+    Аргументы:
+        user: Владелец ленты.
+        viewer: Текущий пользователь; неактивные посты видят только автор и модераторы.
+        cursor: Курсор из предыдущей страницы или None для первой.
+        limit: Размер страницы.
+
+    Возвращает:
+        tuple: Список TimelineItem и курсор следующей страницы (None, если страниц больше нет).
+    """
+    posts = Post.objects.filter(author=user)
+    reviews = Review.objects.filter(author=user, post__is_deleted=False).select_related('post')
+    if viewer != user and not viewer.has_perm('posts.change_post'):
+        posts = posts.filter(is_active=True)
+        reviews = reviews.filter(post__is_active=True)
+    if cursor:
+        cursor = decode_cursor(cursor)
+        posts = posts.filter(_after(cursor, KIND_POST))
+        reviews = reviews.filter(_after(cursor, KIND_REVIEW))
+
+    # Каждый поток берём с запасом в один элемент, чтобы узнать, есть ли следующая страница
+    posts = posts.defer('content', 'content_html').order_by('-created_at', '-pk')[:limit + 1]
+    reviews = reviews.only('id', 'slug', 'text', 'rating', 'created_at', 'post', 'post__title')
+    reviews = reviews.order_by('-created_at', '-pk')[:limit + 1]
+    streams = (
+        (TimelineItem(KIND_POST, post.created_at, post) for post in posts),
+        (TimelineItem(KIND_REVIEW, review.created_at, review) for review in reviews),
+    )
+    items = list(heapq.merge(*streams, key=lambda item: item.key, reverse=True))[:limit + 1]
+    if len(items) > limit:
+        return items[:limit], encode_cursor(items[limit - 1])
+    return items, None
@@ -7,11 +7,16 @@ from django.contrib.auth import login, logout, update_session_auth_hash
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.mail import send_mail
-from django.shortcuts import redirect
+from django.shortcuts import redirect, get_object_or_404
+from django.http import Http404
 import random
 import string
 from django.views.decorators.csrf import csrf_protect
 from django.core.paginator import Paginator
+from django.db.models import Count, Q
+from config.ratelimit import RateLimitMixin
+from config.streaming import StreamingListMixin
+from .timeline import InvalidCursor, user_timeline
 
 def generate_random_password():
     """
@@ -23,7 +28,7 @@ def generate_random_password():
     characters = string.ascii_letters + string.digits
     return ''.join(random.choice(characters) for _ in range(8))
 
-class RegisterView(FormView):
+class RegisterView(RateLimitMixin, FormView):
     """
     Регистрирует нового пользователя.
 
@@ -35,6 +40,7 @@ class RegisterView(FormView):
     template_name = 'users/register.html'
     form_class = CustomUserCreationForm
     success_url = reverse_lazy('posts:post_list')
+    ratelimit_group = 'register'
 
     def form_valid(self, form):
         """
@@ -72,7 +78,7 @@ class RegisterView(FormView):
         """
         return super().form_invalid(form)
 
-class UserLoginView(LoginView):
+class UserLoginView(RateLimitMixin, LoginView):
     """
     Аутентифицирует пользователя.
 
@@ -84,6 +90,7 @@ class UserLoginView(LoginView):
     template_name = 'users/login.html'
     form_class = AuthenticationForm
     redirect_authenticated_user = True
+    ratelimit_group = 'login'
 
     def get_success_url(self):
         """
@@ -106,15 +113,62 @@ class UserLoginView(LoginView):
         """
         return super().form_invalid(form)
 
-class ProfileView(LoginRequiredMixin, TemplateView):
+class TimelineMixin:
     """
-    Отображает профиль пользователя.
+    Добавляет в контекст ленту постов и отзывов пользователя с курсорной пагинацией.
+
+    Атрибуты:
+        timeline_page_size: Количество элементов ленты на странице.
+    """
+    timeline_page_size = 20
+
+    def get_timeline_user(self):
+        """
+        Абстрактный хук: чью ленту показывать. Переопределяется в каждом представлении
+        (ProfileView — текущий пользователь, UserDetailView — открытый профиль).
+
+        Возвращает:
+            User: Владелец ленты.
+        """
+        raise NotImplementedError(
+            f'{type(self).__name__} должен переопределить get_timeline_user().'
+        )
+
+    def get_context_data(self, **kwargs):
+        """
+        Добавляет страницу ленты и курсор следующей страницы.
+
+        Аргументы:
+            **kwargs: Дополнительные аргументы.
+
+        Возвращает:
+            dict: Контекст для шаблона.
+        """
+        context = super().get_context_data(**kwargs)
+        try:
+            items, next_cursor = user_timeline(
+                self.get_timeline_user(), self.request.user,
+                cursor=self.request.GET.get('cursor'), limit=self.timeline_page_size,
+            )
+        except InvalidCursor:
+            raise Http404("Некорректный курсор ленты.")
+        context['timeline'] = items
+        context['next_cursor'] = next_cursor
+        context['is_first_page'] = not self.request.GET.get('cursor')
+        return context
+
+class ProfileView(LoginRequiredMixin, TimelineMixin, TemplateView):
+    """
+    Отображает профиль пользователя и его ленту активности.
 
     Атрибуты:
         template_name: Шаблон профиля.
     """
     template_name = 'users/profile.html'
 
+    def get_timeline_user(self):
+        return self.request.user
+
 class ProfileUpdateView(LoginRequiredMixin, UpdateView):
     """
     Обновляет профиль пользователя.
@@ -200,7 +254,7 @@ class PasswordUpdateView(LoginRequiredMixin, PasswordChangeView):
         """
         return super().form_invalid(form)
 
-class ResetPasswordView(LoginRequiredMixin, TemplateView):
+class ResetPasswordView(LoginRequiredMixin, RateLimitMixin, TemplateView):
     """
     Сбрасывает пароль пользователя.
 
@@ -208,6 +262,7 @@ class ResetPasswordView(LoginRequiredMixin, TemplateView):
         template_name: Шаблон для сброса.
     """
     template_name = 'users/reset_password.html'
+    ratelimit_group = 'reset_password'
 
     def post(self, request, *args, **kwargs):
         """
@@ -254,26 +309,40 @@ class UserLogoutView(View):
         logout(request)
         return redirect('users:login')
 
-class UserListView(LoginRequiredMixin, ListView):
+class UserListView(LoginRequiredMixin, StreamingListMixin, ListView):
     """
     Отображает список пользователей с пагинацией.
 
     Атрибуты:
         model: Модель User.
         template_name: Шаблон для списка.
+        item_template_name: Шаблон одного пользователя для потокового режима.
         context_object_name: Имя объекта в шаблоне.
         login_url: URL для входа.
         paginate_by: Количество пользователей на странице.
     """
     model = User
     template_name = 'users/user_list.html'
+    item_template_name = 'users/user_list_item.html'
+    item_context_name = 'user'
     context_object_name = 'users'
     login_url = reverse_lazy('users:login')
     paginate_by = 5
 
-class UserDetailView(LoginRequiredMixin, DetailView):
+    def get_queryset(self):
+        """
+        Возвращает пользователей с числом неудалённых постов, посчитанным в том же запросе.
+
+        Возвращает:
+            QuerySet: Пользователи по порядку регистрации.
+        """
+        return User.objects.annotate(
+            post_count=Count('posts', filter=Q(posts__is_deleted=False)),
+        ).order_by('pk')
+
+class UserDetailView(LoginRequiredMixin, TimelineMixin, DetailView):
     """
-    Отображает детальную информацию о пользователе.
+    Отображает детальную информацию о пользователе и его ленту активности.
 
     Атрибуты:
         model: Модель User.
@@ -293,4 +362,7 @@ class UserDetailView(LoginRequiredMixin, DetailView):
         Возвращает:
             User: Объект пользователя.
         """
-        return User.objects.get(username=self.kwargs['username'])
\ No newline at end of file
+        return get_object_or_404(User, username=self.kwargs['username'])
+
+    def get_timeline_user(self):
+        return self.object
\ No newline at end of file